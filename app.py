@@ -6,25 +6,27 @@ import re
 from typing import Optional
 import json
 # --- LOCAL IMPORTS ---
-from src.core.tokenizer import AdvancedTokenizer
-from src.core.metrics import BasicMetrics
-from src.core.metrics_advanced import compute_advanced_metrics
-from src.services.openai_client import (
-    get_analysis_from_analyzer,
-    get_solution_from_solver,
-)
-from src.services.google_sheets import get_gsheet_manager
-from src.prompts.taxonomy import PROMPT_TAXONOMY
-from src.models.schemas import (
-    Run,
-    PromptMetrics,
-    Suggestion,
-    Evaluation,
-    AdvancedMetricsRecord,
-    AnalyzerScores,
-    AnalyzerPattern,
-    AdvancedMetricsPattern,
-)
+# openai/httpx/gspread được nạp lười ở lần dùng đầu (src/utils/lazy_import); thời gian hiện ở panel Debug
+from src.utils.lazy_import import import_times, timed
+with timed("app: local imports"):
+    from src.core.tokenizer import AdvancedTokenizer
+    from src.core.metrics import BasicMetrics
+    from src.core.metrics_advanced import compute_advanced_metrics
+    from src.services.openai_client import analyze_and_solve, stream_solution_from_solver, submit_analysis
+    from src.services.google_sheets import get_gsheet_manager
+    from src.services.log_sink import get_log_sink
+    from src.services.problem_bank import invalidate_problem_bank, load_problem_bank
+    from src.prompts.taxonomy import PROMPT_TAXONOMY
+    from src.models.schemas import (
+        Run,
+        PromptMetrics,
+        Suggestion,
+        Evaluation,
+        AdvancedMetricsRecord,
+        AnalyzerScores,
+        AnalyzerPattern,
+        AdvancedMetricsPattern,
+    )
 
 # =========================
 # PAGE CONFIG
@@ -33,7 +35,8 @@ st.set_page_config(layout="wide", page_title="PromptOptima")
 
 tokenizer = AdvancedTokenizer()
 metrics_service = BasicMetrics()
-gsheet_manager = get_gsheet_manager()  # ✅ giữ nguyên logic cũ
+with timed("app: google sheets client"):
+    gsheet_manager = get_gsheet_manager()  # ✅ giữ nguyên logic cũ
 
 # =========================
 # STATIC DATA
@@ -65,6 +68,12 @@ def generate_problem_id(problem_text: str) -> str:
     norm = _normalize_problem_text(problem_text)
     return str(uuid.uuid5(uuid.NAMESPACE_URL, f"promptoptima:problem:{norm}"))
 
+def _safe_basic_metrics(user_input: str, run_id: str):
+    try:
+        return metrics_service.compute(user_input, tokenizer, run_id=run_id)
+    except Exception:
+        return None
+
 def _band_to_score(band: Optional[str]) -> Optional[int]:
     if not band:
         return None
@@ -116,26 +125,46 @@ def handle_submission(user_input: str):
         {"role": "user", "content": user_input, "run_id": current_run_id}
     )
 
-    # Call Analyzer & Solver
+    # Call Analyzer & Solver (song song); deterministic metrics tính trong lúc chờ mạng
     prompt_analysis, solution_text, solver_response = {}, "", {}
-    try:
-        with st.spinner("🔎 Running analyzer & solver..."):
-            analysis_response = get_analysis_from_analyzer(
-                user_prompt=user_input,
-                problem_text=problem_text
-            )
-            prompt_analysis = analysis_response.get("prompt_analysis", {}) or {}
-
-            solver_response = get_solution_from_solver(
-                user_prompt=user_input, problem_text=problem_text
-            )
-            solution_text = solver_response.get(
-                "solution_text", "No solution text returned from API."
-            )
-    except Exception as e:
-        st.exception(e)
-        st.warning("Không gọi được AI, hiển thị thông tin lỗi thay thế.")
-        solution_text = f"--- ERROR ---\n{e}"
+    metrics_record = None
+    if st.session_state.get("stream_solver", True):
+        # Solver stream thẳng vào chat (analyzer chạy nền song song), ghi TTFT / tokens/s vào Run
+        fut_analysis = None
+        try:
+            fut_analysis = submit_analysis(user_input, problem_text)
+            stream = stream_solution_from_solver(user_input, problem_text)
+            with st.chat_message("assistant"):
+                st.write_stream(stream)
+            solver_response = stream.result or {}
+            solution_text = solver_response.get("solution_text") or "No solution text returned from API."
+        except Exception as e:
+            st.exception(e)
+            st.warning("Không gọi được AI, hiển thị thông tin lỗi thay thế.")
+            solution_text = f"--- ERROR ---\n{e}"
+        metrics_record = _safe_basic_metrics(user_input, current_run_id)
+        try:
+            if fut_analysis is not None:
+                with st.spinner("🔎 Running analyzer..."):
+                    prompt_analysis = fut_analysis.result().get("prompt_analysis", {}) or {}
+        except Exception as e:
+            st.warning(f"Analyzer lỗi: {e}")
+    else:
+        try:
+            with st.spinner("🔎 Running analyzer & solver..."):
+                analysis_response, solver_response, metrics_record = analyze_and_solve(
+                    user_input,
+                    problem_text,
+                    overlap=lambda: _safe_basic_metrics(user_input, current_run_id),
+                )
+                prompt_analysis = analysis_response.get("prompt_analysis", {}) or {}
+                solution_text = solver_response.get(
+                    "solution_text", "No solution text returned from API."
+                )
+        except Exception as e:
+            st.exception(e)
+            st.warning("Không gọi được AI, hiển thị thông tin lỗi thay thế.")
+            solution_text = f"--- ERROR ---\n{e}"
 
     # Append assistant message
     st.session_state.chat_history.append(
@@ -150,12 +179,11 @@ def handle_submission(user_input: str):
         }
     )
 
-    # Compute deterministic metrics
-    try:
-        metrics_record = metrics_service.compute(user_input, tokenizer, run_id=current_run_id)
-    except Exception:
-        metrics_record = None
+    # Deterministic metrics (nếu call AI lỗi trước khi join thì tính lại ở đây)
+    if metrics_record is None:
+        metrics_record = _safe_basic_metrics(user_input, current_run_id)
 
+    ph = (prompt_analysis.get("pattern_hits") or {})
     adv_record = None
     adv_vals = {}
     try:
@@ -229,6 +257,8 @@ def handle_submission(user_input: str):
             latency_ms=solver_response.get("latency_ms", 0),
             tokens_in=(solver_response.get("usage") or {}).get("prompt_tokens", 0),
             tokens_out=(solver_response.get("usage") or {}).get("completion_tokens", 0),
+            ttft_ms=solver_response.get("ttft_ms"),
+            tokens_per_sec=solver_response.get("tokens_per_sec"),
         )
 
         # AnalyzerScores
@@ -256,7 +286,6 @@ def handle_submission(user_input: str):
         )
 
         # AnalyzerPattern
-        ph = (prompt_analysis.get("pattern_hits") or {})
         analyzer_pattern = AnalyzerPattern(
             run_id=current_run_id,
             session_id=st.session_state.session_id,
@@ -303,20 +332,52 @@ def handle_submission(user_input: str):
 
         # --- SAVE TO GOOGLE SHEETS ---
         if gsheet_manager:
-            if metrics_record:
-                gsheet_manager.append_data("metrics_deterministic", [metrics_record])
-            if adv_record:
-                gsheet_manager.append_data("metrics_advanced", [adv_record])
-            gsheet_manager.append_data("runs", [run_record])
-            gsheet_manager.append_data("analyzer_scores", [analyzer_scores])
-            gsheet_manager.append_data("analyzer_patterns", [analyzer_pattern])
-            gsheet_manager.append_data("metrics_patterns", [backend_pattern])
+            # Write-behind: chỉ enqueue (file spill cục bộ), thread nền gom nhiều lượt thành một batchUpdate
+            queued = get_log_sink().enqueue({
+                "metrics_deterministic": [metrics_record] if metrics_record else [],
+                "metrics_advanced": [adv_record] if adv_record else [],
+                "runs": [run_record],
+                "analyzer_scores": [analyzer_scores],
+                "analyzer_patterns": [analyzer_pattern],
+                "metrics_patterns": [backend_pattern],
+            })
+            if not queued:
+                st.warning("Hàng đợi ghi log đang đầy (Google Sheets chậm/lỗi), lượt này chưa được ghi.")
         else:
             st.info("Google Sheets chưa cấu hình, bỏ qua ghi log.")
 
     except Exception as e:
         st.warning(f"Không thể ghi log lên Google Sheets: {e}")
 
+# =========================
+# BACKGROUND BATCH JOBS
+# =========================
+_fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+@_fragment(run_every=2)
+def render_batch_jobs():
+    """Poll trạng thái các job AI User đang chạy nền (tự làm mới mỗi 2s, không rerun cả trang)."""
+    from src.batch.jobs import get_job_queue
+    jobs = get_job_queue().list_jobs()
+    if not jobs:
+        return
+    st.caption("Batch jobs")
+    for job in jobs[:10]:
+        pct = min(1.0, job["done"] / job["total"]) if job["total"] else 0.0
+        st.progress(pct, text=f"[{job['job_id']}] {job['status']} · {job['submitted_by']} · {job['done']}/{job['total']}")
+        if job["message"]:
+            st.caption(job["message"])
+        if job["status"] == "done" and job["result"]:
+            r = job["result"]
+            st.success(f"Đã xử lý {r['selected']} problems, tạo {r['created_runs']} runs" + (f" (bỏ qua {r['resumed']} task đã xong)." if r.get("resumed") else "."))
+        elif job["status"] == "failed":
+            st.error(job["error"])
+        for line in job["log"][-3:]:
+            st.caption(line)
+        if job["status"] in ("queued", "running"):
+            if st.button("⏹️ Cancel", key=f"cancel_{job['job_id']}"):
+                get_job_queue().cancel(job["job_id"])
+
 # =========================
 # UI
 # =========================
@@ -336,6 +397,7 @@ with st.sidebar:
         disabled=is_disabled,
     )
     st.radio("Problem Context", PROBLEM_CONTEXTS, key="problem_context", disabled=is_disabled)
+    st.toggle("Stream solver output", value=True, key="stream_solver")
 
     st.button(
         "Confirm Setup",
@@ -347,29 +409,26 @@ with st.sidebar:
 
     st.markdown("---")
     with st.expander("🤖 Advanced: Run AI User (batch)", expanded=False):
+        # Tab 'problems' cache theo TTL (src/services/problem_bank), lựa chọn lọc đã tính sẵn khi nạp
+        if st.button("🔄 Reload problems", key="reload_problems"):
+            invalidate_problem_bank("problems")
         try:
-            _g = get_gsheet_manager()
-            _dfopt = _g.get_df("problems") if _g else None
+            _bank = load_problem_bank("problems")
         except Exception:
-            _dfopt = None
+            _bank = None
 
         DEFAULT_CTX = ["Applied Math", "Theoretical Math", "Test"]
 
-        if _dfopt is None or _dfopt.empty:
+        if _bank is None or _bank.empty:
             st.warning("Không đọc được tab 'problems'.")
             ccss_opts = CONTENT_DOMAINS
             level_opts = [str(x) for x in COGNITIVE_LEVELS.keys()]
             ctx_opts = DEFAULT_CTX
         else:
-            # Tự dò tên cột gần đúng
-            colnames = [c.lower().strip() for c in _dfopt.columns]
-            ctx_col = next((c for c in _dfopt.columns if "abstract" in c.lower() and "real" in c.lower()), None)
-            ctx_vals = set()
-            if ctx_col:
-                ctx_vals = {str(x).strip() for x in _dfopt[ctx_col] if str(x).strip()}
-            ccss_opts = sorted({str(x).split("(")[0].strip() for x in _dfopt.get("CCSS", []) if str(x).strip()})
-            level_opts = sorted({str(x).strip() for x in _dfopt.get("Level", []) if str(x).strip()})
-            ctx_opts = sorted(ctx_vals) if ctx_vals else DEFAULT_CTX
+            ccss_opts = _bank.ccss_options
+            level_opts = _bank.level_options
+            ctx_opts = _bank.context_options or DEFAULT_CTX
+            st.caption(f"{len(_bank.df)} problems · nạp lúc {datetime.fromtimestamp(_bank.loaded_at):%H:%M:%S}")
 
         ms_ccss = st.multiselect("Content Domains (để trống = tất cả)", options=ccss_opts)
         ms_level = st.multiselect("Cognitive Levels (để trống = tất cả)", options=level_opts)
@@ -377,7 +436,10 @@ with st.sidebar:
 
         inc_baseline = st.checkbox("Include baseline", value=True)
         flush_every = st.slider("Flush mỗi N runs", 5, 100, 20, 5)
-        throttle = st.slider("Delay mỗi request (s)", 0.0, 1.0, 0.15, 0.05)
+        workers = st.slider("Số variant chạy song song", 1, 16, 4, 1)
+        offline = st.checkbox("Offline batch (OpenAI Batch API — rẻ hơn, trả kết quả chậm)", value=False)
+        resume = st.checkbox("Resume batch dang dở (cùng cấu hình)", value=True)
+        reuse_para = st.checkbox("Dùng lại paraphrase đã lưu (cùng problem/key/persona/model)", value=True)
 
         valid_filters = any([ms_ccss, ms_level, ms_ctx])
 
@@ -385,9 +447,9 @@ with st.sidebar:
             if not valid_filters:
                 st.error("Hãy chọn ít nhất 1 nhóm (Domain/Level/Context).")
             else:
-                from src.batch.ai_user_runner import run_ai_user_batch
+                from src.batch.jobs import get_job_queue
                 evaluator_name = (st.session_state.get("evaluator_name") or "").strip() or "Anonymous"
-                res = run_ai_user_batch(
+                job_id = get_job_queue().submit(dict(
                     sheet_name="problems",
                     ccss_filters=ms_ccss,
                     level_filters=ms_level,
@@ -397,16 +459,21 @@ with st.sidebar:
                     analyzer_model="gpt-3.5-turbo",
                     solver_model="gpt-3.5-turbo",
                     paraphraser_model="gpt-3.5-turbo",
-                    throttle_sec=float(throttle),
                     flush_every=int(flush_every),
-                )
-                st.session_state["ai_user_result"] = res
+                    max_workers=int(workers),
+                    mode="offline" if offline else "online",
+                    resume=bool(resume),
+                    reuse_paraphrases=bool(reuse_para),
+                ), submitted_by=evaluator_name)
+                st.toast(f"Đã xếp job {job_id} vào hàng đợi; có thể đóng tab, job vẫn chạy.")
 
-        if st.session_state.get("ai_user_result"):
-            r = st.session_state["ai_user_result"]
-            st.success(f"AI User đã xử lý {r['selected']} problems, tạo {r['created_runs']} runs.")
+        render_batch_jobs()
 
     st.markdown("---")
     # st.write("DEBUG analyzer:", json.dumps(prompt_analysis, indent=2))
     if st.button("New Problem / Reset", use_container_width=True, on_click=reset_session):
         st.rerun()
+
+    with st.expander("🐞 Debug: import times", expanded=False):
+        # Lần nạp đầu của process (module nạp lười xuất hiện sau lần dùng đầu tiên, vd lượt submit đầu)
+        st.table([{"module": name, "ms": ms} for name, ms in import_times()])
@@ -1,10 +1,21 @@
 import time
 import uuid
+import json
+import hashlib
 import random
-from typing import List, Dict, Optional, Any
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Any, Tuple
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from src.services.google_sheets import get_gsheet_manager
-from src.services.openai_client import (get_analysis_from_analyzer, get_solution_from_solver, synthesize_prompt_from_suggestion)
+from src.services.storage import get_storage
+from src.services.openai_client import (analyze_and_solve, synthesize_prompt_from_suggestion, synthesize_prompt_variants, analyzer_batch_request, solver_batch_request, paraphrase_batch_request, analysis_from_completion, solution_from_completion, paraphrases_from_completion)
+from src.batch.progress import BatchReporter, default_reporter
+from src.batch.paraphrase_store import ParaphraseStore, paraphrase_key
+from src.batch.checkpoint import BatchCheckpoint, FLUSHED, FLUSHING, task_key
+from src.services.batch_jobs import BatchBackend, BatchJobError, OpenAIBatchBackend, run_batch_job
 from src.core.tokenizer import AdvancedTokenizer
 from src.core.metrics import BasicMetrics
 from src.core.metrics_advanced import compute_advanced_metrics
@@ -41,59 +52,268 @@ def _to_dict_any(x: Any) -> Dict:
     if is_dataclass(x): return asdict(x)
     if isinstance(x, dict): return x
     return {k: v for k, v in getattr(x, "__dict__", {}).items()}
-def _append_rows_safe(gsheet, sheet_name: str, items: list):
-    if not items: return
-    rows = [_to_dict_any(it) for it in items]
+def _append_batches_safe(store, batches: Dict[str, list], reporter: Optional[BatchReporter] = None) -> bool:
+    batches = {name: [_to_dict_any(it) for it in items] for name, items in batches.items() if items}
+    if not batches: return True
     try:
-        gsheet.append_data(sheet_name, rows)
+        return store.append_many(batches) is not False
     except Exception as e:
-        st.error(f"Error writing to sheet '{sheet_name}': {e}")
+        (reporter.error if reporter else st.error)(f"Error writing to sheets {', '.join(batches)}: {e}")
+        return False
 
-# --- Hàm Helper xử lý một prompt (không đổi) ---
-def _process_single_prompt_variant(*, run_id: str, prompt_text: str, persona: str, problem_id: str, problem_text: str, content_domain: str, cognitive_level: int, problem_context: str, level_hint: int, prompt_name: str, sug_key: Optional[int], ai_user_id: str, ai_grader: str, analyzer_model: str, solver_model: str, tokenizer: AdvancedTokenizer, metrics: BasicMetrics) -> Optional[Dict[str, Any]]:
+# --- Sheet đích <- key trong dict kết quả của _build_records (thứ tự = thứ tự flush) ---
+_SHEET_FIELDS = [
+    ("runs", "run"), ("metrics_deterministic", "metrics"), ("metrics_advanced", "adv_metrics"),
+    ("suggestions", "suggestion"), ("evaluations", "evaluation"), ("analyzer_scores", "analyzer_score"),
+    ("analyzer_patterns", "analyzer_pattern"), ("metrics_patterns", "metrics_pattern"),
+]
+
+def _batch_id(**spec: Any) -> str:
+    # Cùng cấu hình (sheet, filter, model, ...) -> cùng batch id -> tự resume journal cũ
+    payload = json.dumps({k: sorted(v) if isinstance(v, list) else v for k, v in spec.items()}, sort_keys=True, default=str)
+    return "batch_" + hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+def _existing_run_ids(store, sheet_name: str) -> set:
+    df = store.get_df(sheet_name)
+    return set(df["run_id"].astype(str)) if "run_id" in df.columns else set()
+
+def _flush_checkpoint(store, ckpt: BatchCheckpoint, reporter: Optional[BatchReporter] = None) -> int:
+    """
+    Ghi mọi record chưa flush trong journal lên sheet, đúng một lần.
+    Record ở trạng thái FLUSHING (lần ghi trước bị gián đoạn) được đối chiếu run_id trên sheet trước.
+    Trả về số task đã flush.
+    """
+    pending = ckpt.unflushed()
+    if not pending: return 0
+    run_ids = [rid for rid, _, _ in pending]
+    uncertain = {rid for rid, _, state in pending if state == FLUSHING}
+    ckpt.mark(run_ids, FLUSHING)
+    batches = {}
+    for sheet_name, _ in _SHEET_FIELDS:
+        items = [(rid, row) for rid, rows, _ in pending for row in rows.get(sheet_name, [])]
+        if uncertain and items:
+            existing = _existing_run_ids(store, sheet_name) & uncertain
+            items = [(rid, row) for rid, row in items if rid not in existing]
+        batches[sheet_name] = [row for _, row in items]
+    # Mọi tab trong một lần ghi (một spreadsheets.batchUpdate)
+    ok = _append_batches_safe(store, batches, reporter)
+    if ok:
+        ckpt.mark(run_ids, FLUSHED)
+    return len(run_ids) if ok else 0
+
+# --- Hàm Helper xử lý một prompt (lỗi được ném ra; nơi gọi quyết định bỏ qua & cảnh báo) ---
+def _process_single_prompt_variant(*, run_id: str, prompt_text: str, persona: str, problem_id: str, problem_text: str, content_domain: str, cognitive_level: int, problem_context: str, level_hint: int, prompt_name: str, sug_key: Optional[int], ai_user_id: str, ai_grader: str, analyzer_model: str, solver_model: str, tokenizer: AdvancedTokenizer, metrics: BasicMetrics) -> Dict[str, Any]:
+    # Analyzer & solver chạy song song; BasicMetrics (không phụ thuộc AI) tính trong lúc chờ
+    analysis, sol, pm = analyze_and_solve(
+        prompt_text, problem_text, analyzer_model=analyzer_model, solver_model=solver_model,
+        overlap=lambda: metrics.compute(prompt_text, tokenizer, run_id=run_id, w=10),
+    )
+    return _build_records(
+        run_id=run_id, prompt_text=prompt_text, persona=persona, problem_id=problem_id, problem_text=problem_text,
+        content_domain=content_domain, cognitive_level=cognitive_level, problem_context=problem_context,
+        level_hint=level_hint, prompt_name=prompt_name, sug_key=sug_key, ai_user_id=ai_user_id, ai_grader=ai_grader,
+        solver_model=solver_model, analysis=analysis, sol=sol, pm=pm,
+    )
+
+# --- Dựng các record (Run/AnalyzerScores/...) từ kết quả analyzer/solver; dùng chung cho online & offline ---
+def _build_records(*, run_id: str, prompt_text: str, persona: str, problem_id: str, problem_text: str, content_domain: str, cognitive_level: int, problem_context: str, level_hint: int, prompt_name: str, sug_key: Optional[int], ai_user_id: str, ai_grader: str, solver_model: str, analysis: Dict[str, Any], sol: Dict[str, Any], pm: Any) -> Dict[str, Any]:
+    prompt_analysis = analysis.get("prompt_analysis", {}) or {}
+    solution_text = sol.get("solution_text") or "--- NO SOLUTION TEXT ---"
+    ph = prompt_analysis.get("pattern_hits", {})
+    adv_vals = compute_advanced_metrics(prompt_text, ai_pattern_hits=ph)
+    cdi, sss, arq, hits = adv_vals.get("cdi", {}), adv_vals.get("sss", {}), adv_vals.get("arq", {}), adv_vals.get("hits", {})
+    sig, bands, ai_est = prompt_analysis.get("signals", {}), prompt_analysis.get("qualitative_scores", {}), prompt_analysis.get("ai_estimated", {})
+    session_id_for_run = str(uuid.uuid4())[:8]
+    adv_record = AdvancedMetricsRecord( run_id=run_id, session_id=session_id_for_run, user_id=ai_user_id, prompt_text=prompt_text, cdi_rate_cognitive_verbs=_safe_float(cdi.get("rate_cognitive_verbs")), cdi_lexical_density=_safe_float(cdi.get("lexical_density")), cdi_clauses_per_sentence=_safe_float(cdi.get("clauses_per_sentence")), cdi_rate_abstract_terms=_safe_float(cdi.get("rate_abstract_terms")), cdi_composite=_safe_float(cdi.get("cdi_composite")), sss_n_examples=_safe_int(sss.get("n_examples")), sss_n_step_markers=_safe_int(sss.get("n_step_markers")), sss_n_formula_markers=_safe_int(sss.get("n_formula_markers")), sss_n_hints=_safe_int(sss.get("n_hints")), sss_weighted=_safe_float(sss.get("sss_weighted")), sss_raw=_safe_int(sss.get("sss_raw")), arq_abstract_terms=_safe_int(arq.get("abstract_terms")), arq_numbers=_safe_int(arq.get("numbers")), arq_ratio=_safe_float(arq.get("ratio")), arq_meta_bonus=_safe_float(arq.get("meta_bonus")), arq_score=_safe_float(arq.get("arq_score")),)
+    metrics_pattern_record = AdvancedMetricsPattern( run_id=run_id, session_id=session_id_for_run, user_id=ai_user_id, prompt_text=prompt_text, cdi_c_rate=_safe_float(cdi.get("rate_cognitive_verbs")), cdi_a_rate=_safe_float(cdi.get("rate_abstract_terms")), cdi_ld=_safe_float(cdi.get("lexical_density")), cdi_cps=_safe_float(cdi.get("clauses_per_sentence")), sss_log=_safe_float(sss.get("sss_weighted")), arq_meta=bool(arq.get("meta_gate", False)), c_terms_backend="|".join(hits.get("c_terms", [])), a_terms_backend="|".join(hits.get("a_terms", [])), meta_terms_backend="|".join(hits.get("meta_terms", [])), examples_hits="|".join(hits.get("examples", [])), step_markers_hits="|".join(hits.get("step_markers", [])), formula_marks_hits="|".join(hits.get("formula_marks", [])), hints_hits="|".join(hits.get("hints", [])), numbers_hits="|".join(hits.get("numbers", [])), cdi_index=_safe_float(cdi.get("cdi_composite")), sss_total=_safe_int(sss.get("sss_raw")), arq_ratio=_safe_float(arq.get("ratio")), arq_index=_safe_float(arq.get("arq_score")),)
+    analyzer_score_record = AnalyzerScores( run_id=run_id, session_id=session_id_for_run, user_id=ai_user_id, prompt_text=prompt_text, problem_id=problem_id, tokens=_safe_int(sig.get("tokens")), sentences=_safe_int(sig.get("sentences")), avg_tokens_per_sentence=_safe_float(sig.get("avg_tokens_per_sentence")), avg_clauses_per_sentence=_safe_float(sig.get("avg_clauses_per_sentence")), cognitive_verbs_count=_safe_int(sig.get("cognitive_verbs_count")), abstract_terms_count=_safe_int(sig.get("abstract_terms_count")), clarity_score=_safe_int(bands.get("clarity_score")), specificity_score=_safe_int(bands.get("specificity_score")), structure_score=_safe_int(bands.get("structure_score")), mattr_like_0_1=_safe_float(ai_est.get("mattr_like")), reading_ease_like=_safe_float(ai_est.get("reading_ease_like")), cdi_like=_safe_float(ai_est.get("cdi_like")), sss_like=_safe_float(ai_est.get("sss_like")), arq_like=_safe_float(ai_est.get("arq_like")), confidence=str(ai_est.get("confidence", "")),)
+    analyzer_pattern_record = AnalyzerPattern( run_id=run_id, session_id=session_id_for_run, user_id=ai_user_id, prompt_text=prompt_text, problem_id=problem_id, cognitive_terms_ai="|".join(ph.get("cognitive_terms", [])), abstract_terms_ai="|".join(ph.get("abstract_terms", [])), meta_terms_ai="|".join(ph.get("meta_terms", [])), logic_connectors_ai="|".join(ph.get("logic_connectors", [])), modals_ai="|".join(ph.get("modals", [])), step_markers_ai="|".join(ph.get("step_markers", [])), examples_ai="|".join(ph.get("examples", [])), formula_markers_ai="|".join(ph.get("formula_markers", [])), hints_ai="|".join(ph.get("hints", [])), numbers_ai="|".join(ph.get("numbers", [])), sections_ai="|".join(ph.get("sections", [])), output_rules_ai="|".join(ph.get("output_rules", [])),)
+    run_obj = Run( run_id=run_id, session_id=session_id_for_run, user_id=ai_user_id, ai_persona=persona, problem_id=problem_id, problem_text=problem_text, content_domain=content_domain, cognitive_level=cognitive_level, problem_context=problem_context, prompt_text=prompt_text, prompt_level=level_hint, prompt_name=prompt_name, solver_model_name=solver_model, response_text=solution_text, latency_ms=_safe_int(sol.get("latency_ms")), tokens_in=_safe_int((sol.get("usage") or {}).get("prompt_tokens")), tokens_out=_safe_int((sol.get("usage") or {}).get("completion_tokens")),)
+    suggestion_record = None
+    if sug_key is not None:
+        suggestion_record = Suggestion( run_id=run_id, session_id=run_obj.session_id, user_id=ai_user_id, suggestion_key=_safe_int(sug_key), suggestion_name=prompt_name, suggested_level=level_hint, accepted=True,)
+    evaluation_record = Evaluation( run_id=run_id, grader_id=ai_grader, correctness_score=1, evaluation_notes="Auto (AI batch). Please review.",)
+    return { "run": run_obj, "metrics": pm, "adv_metrics": adv_record, "metrics_pattern": metrics_pattern_record, "analyzer_score": analyzer_score_record, "analyzer_pattern": analyzer_pattern_record, "suggestion": suggestion_record, "evaluation": evaluation_record }
+
+def _baseline_prompt(problem_text: str) -> str:
+    return f"Solve this problem:\n{problem_text}"
+
+# --- Paraphrase: dùng lại biến thể đã lưu (ParaphraseStore) hoặc sinh mới n biến thể trong một request ---
+def _paraphrase(*, problem: Dict[str, Any], sug_key: int, paraphraser_model: str, paraphrases: Optional[ParaphraseStore] = None, reuse_paraphrases: bool = True, paraphrases_per_key: int = 1) -> str:
+    sug = PROMPT_TAXONOMY[sug_key]
+    key = paraphrase_key(problem["problem_id"], sug_key, problem["persona"], problem["cognitive_level"], paraphraser_model, sug.get("template", ""))
+    if paraphrases is not None and reuse_paraphrases:
+        text = paraphrases.take(key)
+        if text:
+            return text
+    texts = synthesize_prompt_variants(
+        problem["problem_text"], sug, problem["cognitive_level"], problem["persona"],
+        model=paraphraser_model, n=max(1, int(paraphrases_per_key)),
+    )
+    if not texts:  # không có OpenAI client -> điền template trực tiếp (không lưu)
+        return synthesize_prompt_from_suggestion(problem["problem_text"], sug, problem["cognitive_level"], problem["persona"], model=paraphraser_model, strict_fill=True)[0]
+    return (paraphrases.add(key, texts) if paraphrases is not None else None) or texts[0]
+
+# --- Một "task" = một (problem × taxonomy key): paraphrase (nếu có) -> analyzer/solver -> records ---
+def _build_variant(*, problem: Dict[str, Any], sug_key: Optional[int], paraphraser_model: str, **paraphrase_opts: Any) -> Tuple[str, str, int, str, Optional[int]]:
+    persona = problem["persona"]
+    if sug_key is None:
+        return (_baseline_prompt(problem["problem_text"]), persona, 0, "Zero-Shot Baseline", None)
+    sug = PROMPT_TAXONOMY[sug_key]
+    prompt_text = _paraphrase(problem=problem, sug_key=sug_key, paraphraser_model=paraphraser_model, **paraphrase_opts)
+    return (prompt_text, persona, int(sug.get("level", 0)), str(sug["name"]), sug_key)
+
+def _run_variant_task(*, run_id: str, problem: Dict[str, Any], sug_key: Optional[int], ai_user_id: str, analyzer_model: str, solver_model: str, paraphraser_model: str, tokenizer: AdvancedTokenizer, metrics: BasicMetrics, throttle_sec: float, **paraphrase_opts: Any) -> Dict[str, Any]:
+    """Chạy trong worker thread; không gọi UI, chỉ trả kết quả (hoặc lỗi) về luồng chính."""
+    persona = problem["persona"]
+    prompt_name = "Zero-Shot Baseline" if sug_key is None else str(PROMPT_TAXONOMY[sug_key]["name"])
+    data, error = None, None
     try:
-        analysis = get_analysis_from_analyzer(user_prompt=prompt_text, problem_text=problem_text, model=analyzer_model)
-        prompt_analysis = analysis.get("prompt_analysis", {}) or {}
-        sol = get_solution_from_solver(user_prompt=prompt_text, problem_text=problem_text, model=solver_model)
-        solution_text = sol.get("solution_text") or "--- NO SOLUTION TEXT ---"
-        ph = prompt_analysis.get("pattern_hits", {})
-        adv_vals = compute_advanced_metrics(prompt_text, ai_pattern_hits=ph)
-        pm = metrics.compute(prompt_text, tokenizer, run_id=run_id, w=10)
-        cdi, sss, arq, hits = adv_vals.get("cdi", {}), adv_vals.get("sss", {}), adv_vals.get("arq", {}), adv_vals.get("hits", {})
-        sig, bands, ai_est = prompt_analysis.get("signals", {}), prompt_analysis.get("qualitative_scores", {}), prompt_analysis.get("ai_estimated", {})
-        session_id_for_run = str(uuid.uuid4())[:8]
-        adv_record = AdvancedMetricsRecord( run_id=run_id, session_id=session_id_for_run, user_id=ai_user_id, prompt_text=prompt_text, cdi_rate_cognitive_verbs=_safe_float(cdi.get("rate_cognitive_verbs")), cdi_lexical_density=_safe_float(cdi.get("lexical_density")), cdi_clauses_per_sentence=_safe_float(cdi.get("clauses_per_sentence")), cdi_rate_abstract_terms=_safe_float(cdi.get("rate_abstract_terms")), cdi_composite=_safe_float(cdi.get("cdi_composite")), sss_n_examples=_safe_int(sss.get("n_examples")), sss_n_step_markers=_safe_int(sss.get("n_step_markers")), sss_n_formula_markers=_safe_int(sss.get("n_formula_markers")), sss_n_hints=_safe_int(sss.get("n_hints")), sss_weighted=_safe_float(sss.get("sss_weighted")), sss_raw=_safe_int(sss.get("sss_raw")), arq_abstract_terms=_safe_int(arq.get("abstract_terms")), arq_numbers=_safe_int(arq.get("numbers")), arq_ratio=_safe_float(arq.get("ratio")), arq_meta_bonus=_safe_float(arq.get("meta_bonus")), arq_score=_safe_float(arq.get("arq_score")),)
-        metrics_pattern_record = AdvancedMetricsPattern( run_id=run_id, session_id=session_id_for_run, user_id=ai_user_id, prompt_text=prompt_text, cdi_c_rate=_safe_float(cdi.get("rate_cognitive_verbs")), cdi_a_rate=_safe_float(cdi.get("rate_abstract_terms")), cdi_ld=_safe_float(cdi.get("lexical_density")), cdi_cps=_safe_float(cdi.get("clauses_per_sentence")), sss_log=_safe_float(sss.get("sss_weighted")), arq_meta=bool(arq.get("meta_gate", False)), c_terms_backend="|".join(hits.get("c_terms", [])), a_terms_backend="|".join(hits.get("a_terms", [])), meta_terms_backend="|".join(hits.get("meta_terms", [])), examples_hits="|".join(hits.get("examples", [])), step_markers_hits="|".join(hits.get("step_markers", [])), formula_marks_hits="|".join(hits.get("formula_marks", [])), hints_hits="|".join(hits.get("hints", [])), numbers_hits="|".join(hits.get("numbers", [])), cdi_index=_safe_float(cdi.get("cdi_composite")), sss_total=_safe_int(sss.get("sss_raw")), arq_ratio=_safe_float(arq.get("ratio")), arq_index=_safe_float(arq.get("arq_score")),)
-        analyzer_score_record = AnalyzerScores( run_id=run_id, session_id=session_id_for_run, user_id=ai_user_id, prompt_text=prompt_text, problem_id=problem_id, tokens=_safe_int(sig.get("tokens")), sentences=_safe_int(sig.get("sentences")), avg_tokens_per_sentence=_safe_float(sig.get("avg_tokens_per_sentence")), avg_clauses_per_sentence=_safe_float(sig.get("avg_clauses_per_sentence")), cognitive_verbs_count=_safe_int(sig.get("cognitive_verbs_count")), abstract_terms_count=_safe_int(sig.get("abstract_terms_count")), clarity_score=_safe_int(bands.get("clarity_score")), specificity_score=_safe_int(bands.get("specificity_score")), structure_score=_safe_int(bands.get("structure_score")), mattr_like_0_1=_safe_float(ai_est.get("mattr_like")), reading_ease_like=_safe_float(ai_est.get("reading_ease_like")), cdi_like=_safe_float(ai_est.get("cdi_like")), sss_like=_safe_float(ai_est.get("sss_like")), arq_like=_safe_float(ai_est.get("arq_like")), confidence=str(ai_est.get("confidence", "")),)
-        analyzer_pattern_record = AnalyzerPattern( run_id=run_id, session_id=session_id_for_run, user_id=ai_user_id, prompt_text=prompt_text, problem_id=problem_id, cognitive_terms_ai="|".join(ph.get("cognitive_terms", [])), abstract_terms_ai="|".join(ph.get("abstract_terms", [])), meta_terms_ai="|".join(ph.get("meta_terms", [])), logic_connectors_ai="|".join(ph.get("logic_connectors", [])), modals_ai="|".join(ph.get("modals", [])), step_markers_ai="|".join(ph.get("step_markers", [])), examples_ai="|".join(ph.get("examples", [])), formula_markers_ai="|".join(ph.get("formula_markers", [])), hints_ai="|".join(ph.get("hints", [])), numbers_ai="|".join(ph.get("numbers", [])), sections_ai="|".join(ph.get("sections", [])), output_rules_ai="|".join(ph.get("output_rules", [])),)
-        run_obj = Run( run_id=run_id, session_id=session_id_for_run, user_id=ai_user_id, ai_persona=persona, problem_id=problem_id, problem_text=problem_text, content_domain=content_domain, cognitive_level=cognitive_level, problem_context=problem_context, prompt_text=prompt_text, prompt_level=level_hint, prompt_name=prompt_name, solver_model_name=solver_model, response_text=solution_text, latency_ms=_safe_int(sol.get("latency_ms")), tokens_in=_safe_int((sol.get("usage") or {}).get("prompt_tokens")), tokens_out=_safe_int((sol.get("usage") or {}).get("completion_tokens")),)
-        suggestion_record = None
-        if sug_key is not None:
-            suggestion_record = Suggestion( run_id=run_id, session_id=run_obj.session_id, user_id=ai_user_id, suggestion_key=_safe_int(sug_key), suggestion_name=prompt_name, suggested_level=level_hint, accepted=True,)
-        evaluation_record = Evaluation( run_id=run_id, grader_id=ai_grader, correctness_score=1, evaluation_notes="Auto (AI batch). Please review.",)
-        return { "run": run_obj, "metrics": pm, "adv_metrics": adv_record, "metrics_pattern": metrics_pattern_record, "analyzer_score": analyzer_score_record, "analyzer_pattern": analyzer_pattern_record, "suggestion": suggestion_record, "evaluation": evaluation_record }
+        prompt_text, persona, level_hint, prompt_name, sug_key = _build_variant(problem=problem, sug_key=sug_key, paraphraser_model=paraphraser_model, **paraphrase_opts)
+        data = _process_single_prompt_variant(
+            run_id=run_id, prompt_text=prompt_text, persona=persona,
+            problem_id=problem["problem_id"], problem_text=problem["problem_text"], content_domain=problem["content_domain"],
+            cognitive_level=problem["cognitive_level"], problem_context=problem["problem_context"],
+            level_hint=level_hint, prompt_name=prompt_name, sug_key=sug_key,
+            ai_user_id=ai_user_id, ai_grader=ai_user_id,
+            analyzer_model=analyzer_model, solver_model=solver_model,
+            tokenizer=tokenizer, metrics=metrics,
+        )
     except Exception as e:
-        st.warning(f"Skipping run for prompt '{prompt_name}' (ID: {run_id[:8]}) due to error: {e}")
-        return None
+        error = e
+    if throttle_sec > 0:
+        time.sleep(throttle_sec)
+    return {"run_id": run_id, "problem_id": problem["problem_id"], "sug_key": sug_key, "prompt_name": prompt_name, "persona": persona, "data": data, "error": error}
+
+# --- Offline: paraphrase -> (analyzer + solver) thành 2 batch job JSONL, rồi dựng record như bản online ---
+def _iter_offline_results(tasks: List[Dict[str, Any]], *, backend: BatchBackend, poll_interval: float, on_poll=None, should_stop=None):
+    """Sinh kết quả (cùng dạng _run_variant_task) theo đúng thứ tự `tasks`."""
+    prompts: Dict[str, str] = {}
+    keys: Dict[str, Any] = {}
+    para_reqs = []
+    for t in tasks:
+        if t["sug_key"] is None:
+            continue
+        problem, sug, store = t["problem"], PROMPT_TAXONOMY[t["sug_key"]], t.get("paraphrases")
+        keys[t["run_id"]] = key = paraphrase_key(problem["problem_id"], t["sug_key"], problem["persona"], problem["cognitive_level"], t["paraphraser_model"], sug.get("template", ""))
+        text = store.take(key) if store is not None and t.get("reuse_paraphrases", True) else None
+        if text:
+            prompts[t["run_id"]] = text
+            continue
+        para_reqs.append({"custom_id": f"{t['run_id']}:paraphrase",
+                          "body": paraphrase_batch_request(problem["problem_text"], sug, problem["cognitive_level"], problem["persona"], model=t["paraphraser_model"], n=max(1, int(t.get("paraphrases_per_key", 1))))})
+    paraphrased = run_batch_job(para_reqs, backend, name="paraphrase", poll_interval=poll_interval, on_poll=on_poll, should_stop=should_stop) if para_reqs else {}
+
+    errors: Dict[str, str] = {}
+    calls = []
+    for t in tasks:
+        rid, problem = t["run_id"], t["problem"]
+        if t["sug_key"] is None:
+            prompts[rid] = _baseline_prompt(problem["problem_text"])
+        elif rid not in prompts:
+            res = paraphrased[f"{rid}:paraphrase"]
+            if res["error"]:
+                errors[rid] = f"paraphrase: {res['error']}"
+                continue
+            texts = paraphrases_from_completion(res["body"])
+            store = t.get("paraphrases")
+            prompts[rid] = (store.add(keys[rid], texts) if store is not None else None) or (texts[0] if texts else "")
+        calls.append({"custom_id": f"{rid}:analyzer", "body": analyzer_batch_request(prompts[rid], problem["problem_text"], model=t["analyzer_model"])})
+        calls.append({"custom_id": f"{rid}:solver", "body": solver_batch_request(prompts[rid], problem["problem_text"], model=t["solver_model"])})
+    answered = run_batch_job(calls, backend, name="analyze_solve", poll_interval=poll_interval, on_poll=on_poll, should_stop=should_stop)
+
+    for t in tasks:
+        rid, problem, sug_key = t["run_id"], t["problem"], t["sug_key"]
+        sug = None if sug_key is None else PROMPT_TAXONOMY[sug_key]
+        prompt_name = "Zero-Shot Baseline" if sug is None else str(sug["name"])
+        data, error = None, None
+        try:
+            if rid in errors:
+                raise RuntimeError(errors[rid])
+            a, s_ = answered[f"{rid}:analyzer"], answered[f"{rid}:solver"]
+            if a["error"] or s_["error"]:
+                raise RuntimeError(f"analyzer: {a['error']}" if a["error"] else f"solver: {s_['error']}")
+            prompt_text = prompts[rid]
+            data = _build_records(
+                run_id=rid, prompt_text=prompt_text, persona=problem["persona"], problem_id=problem["problem_id"],
+                problem_text=problem["problem_text"], content_domain=problem["content_domain"],
+                cognitive_level=problem["cognitive_level"], problem_context=problem["problem_context"],
+                level_hint=0 if sug is None else int(sug.get("level", 0)), prompt_name=prompt_name, sug_key=sug_key,
+                ai_user_id=t["ai_user_id"], ai_grader=t["ai_user_id"], solver_model=t["solver_model"],
+                analysis=analysis_from_completion(a["body"]), sol=solution_from_completion(s_["body"]),
+                pm=t["metrics"].compute(prompt_text, t["tokenizer"], run_id=rid, w=10),
+            )
+        except Exception as e:
+            error = e
+        yield {"run_id": rid, "problem_id": problem["problem_id"], "sug_key": sug_key, "prompt_name": prompt_name, "persona": problem["persona"], "data": data, "error": error}
+
+def _attach_script_ctx(ctx) -> None:
+    # Cho phép các hàm service (vd mock analyzer) dùng st.* trong worker thread
+    if ctx is not None:
+        add_script_run_ctx(threading.current_thread(), ctx)
+
+# Seed mặc định cho persona tất định theo bài (xem persona_seed của run_ai_user_batch)
+DEFAULT_PERSONA_SEED = "promptoptima"
+
+
+def _choose_persona(persona_pool: List[str], seed: Any, problem_id: str) -> str:
+    # Seed chuỗi -> cùng kết quả giữa các process (không phụ thuộc PYTHONHASHSEED)
+    return random.Random(f"{seed}:{problem_id}").choice(persona_pool)
+
 
 # -------------- Main Function (Corrected) --------------
 def run_ai_user_batch(
     *, sheet_name: str = "problems", ccss_filters: List[str], level_filters: List[str],
     context_filters: List[str], evaluator_name: str, include_baseline: bool = True,
     analyzer_model: str = "gpt-3.5-turbo", solver_model: str = "gpt-3.5-turbo",
-    paraphraser_model: str = "gpt-3.5-turbo", throttle_sec: float = 0.15, flush_every: int = 20,
+    paraphraser_model: str = "gpt-3.5-turbo", throttle_sec: float = 0.0, flush_every: int = 20,
+    max_workers: int = 1, max_in_flight: Optional[int] = None,
+    mode: str = "online", batch_backend: Optional[BatchBackend] = None, batch_poll_sec: float = 30.0,
+    batch_id: Optional[str] = None, resume: bool = True, reporter: Optional[BatchReporter] = None,
+    problems: Optional[Any] = None, reuse_paraphrases: bool = True, paraphrases_per_key: int = 1,
+    paraphrase_store: Optional[ParaphraseStore] = None, persona_seed: Any = DEFAULT_PERSONA_SEED,
 ):
-    gsheet = get_gsheet_manager()
-    df = gsheet.get_df(sheet_name)
+    """
+    max_workers: số variant (problem × taxonomy key) chạy song song trong thread pool.
+    max_in_flight: số task tối đa đã submit nhưng chưa được ghi nhận (mặc định 2 × max_workers).
+    Kết quả luôn được ghi nhận theo đúng thứ tự (problem, key) như chạy tuần tự, nên thứ tự
+    dòng ghi vào sheet và tiến độ trên progress bar là tất định.
+    throttle_sec: delay cố định thêm sau mỗi variant (mặc định 0). Nhịp gọi API đã do
+    rate limiter RPM/TPM dùng chung trong openai_client điều phối, chỉ đặt > 0 khi cần chạy chậm hơn quota.
+    mode: "online" (gọi API từng variant) hoặc "offline" — gom toàn bộ paraphrase, rồi analyzer + solver,
+    thành các batch job JSONL gửi qua `batch_backend` (mặc định OpenAI Batch API), poll tới khi xong
+    và dựng cùng các record Run/AnalyzerScores/... như chế độ online.
+    batch_id / resume: mỗi task xong được ghi vào journal .cache/checkpoints/<batch_id>.sqlite
+    (mặc định batch_id suy ra từ cấu hình). Chạy lại cùng batch_id sẽ bỏ qua các (problem, key) đã xong,
+    dùng lại persona đã chọn và chỉ ghi sheet những record chưa được ghi. resume=False bắt đầu lại từ đầu.
+    problems: DataFrame bài toán (cột CCSS / Level / Abstract / Real-world / Problem) thay cho việc đọc
+    tab `sheet_name`, vd nạp từ CSV/Parquet ở CLI (src/batch/cli.py). Kết quả ghi vào storage ([storage] trong secrets).
+    reuse_paraphrases / paraphrases_per_key: paraphrase được lưu trong ParaphraseStore (mặc định
+    .cache/paraphrases.sqlite) theo (problem_id, key, persona, level, model). reuse_paraphrases=True dùng lại
+    biến thể đã có (mỗi lần chạy lấy biến thể ít dùng nhất); thiếu thì sinh `paraphrases_per_key` biến thể
+    trong một request (dư được để dành cho các lần chạy sau).
+    Kết quả: selected / created_runs / batch_id / resumed / cancelled, cùng `failed` (số task lỗi bị bỏ qua)
+    và `unflushed` (số task đã xong nhưng chưa ghi được lên storage).
+    persona_seed: persona của mỗi bài = random.Random(f"{persona_seed}:{problem_id}").choice(...) — tất định
+    theo (seed, problem_id), nên các lần chạy sau (batch khác, evaluator khác) gặp lại đúng khoá paraphrase
+    và dùng lại được paraphrase đã lưu. Đổi seed để có bộ persona khác.
+    reporter: nơi nhận tiến độ/log (mặc định StreamlitReporter); reporter.should_stop() -> dừng sau các
+    task đang chạy, record đã xong vẫn được ghi (chạy lại với resume để tiếp tục).
+    """
+    reporter = default_reporter(reporter)
+    # Bài toán đọc từ Google Sheets (hoặc `problems`); record ghi vào storage đã cấu hình (Sheets/SQLite)
+    store = get_storage()
+    df = get_gsheet_manager().get_df(sheet_name) if problems is None else problems
+    source = f"sheet '{sheet_name}'" if problems is None else "problems input"
     if df.empty:
-        st.error(f"Sheet '{sheet_name}' is empty or could not be read.")
+        reporter.error(f"Sheet '{sheet_name}' is empty or could not be read." if problems is None else "Problems input is empty.")
         return {"selected": 0, "created_runs": 0}
 
     cols = {c.lower().strip(): c for c in df.columns}
     need = ["ccss", "level", "abstract / real-world", "problem"]
     for n in need:
         if n not in cols:
-            st.error(f"Missing column '{n}' in sheet '{sheet_name}'.")
+            reporter.error(f"Missing column '{n}' in {source}.")
             return {"selected": 0, "created_runs": 0}
     
     # --- Filtering Logic (No changes) ---
@@ -106,89 +326,129 @@ def run_ai_user_batch(
     df_sel = df[df[cols["ccss"]].apply(pass_ccss) & df[cols["level"]].apply(pass_level) & df[cols["abstract / real-world"]].apply(pass_ctx)].copy()
 
     if df_sel.empty:
-        st.warning("No problems match the selected filters.")
+        reporter.warning("No problems match the selected filters.")
         return {"selected": 0, "created_runs": 0}
 
+    # Journal/persona khoá theo problem_id -> bài trùng nội dung chỉ chạy một lần (hàng đầu tiên)
+    problem_ids = df_sel[cols["problem"]].map(lambda t: generate_problem_id(clean_problem_text(t)))
+    duplicated = problem_ids.duplicated()
+    if duplicated.any():
+        reporter.warning(f"Skipping {int(duplicated.sum())} duplicate problem(s) with the same text as an earlier row.")
+        df_sel, problem_ids = df_sel[~duplicated], problem_ids[~duplicated]
+
     # --- Initialization ---
     tokenizer, metrics = AdvancedTokenizer(), BasicMetrics()
-    buffers = { "runs": [], "metrics_deterministic": [], "metrics_advanced": [], "suggestions": [], "evaluations": [], "analyzer_scores": [], "analyzer_patterns": [], "metrics_patterns": [] }
+    # Input ngoài sheet (CSV/DataFrame) không có tên ổn định -> hash tập problem_id đã chọn vào batch id
+    input_spec = {"sheet_name": sheet_name} if problems is None else {"problem_ids": sorted(problem_ids)}
+    batch_id = batch_id or _batch_id(
+        **input_spec, ccss=ccss_filters, level=level_filters, ctx=context_filters, evaluator=evaluator_name,
+        include_baseline=include_baseline, models=[analyzer_model, solver_model, paraphraser_model], mode=mode,
+    )
+    ckpt = BatchCheckpoint(batch_id)
+    paraphrases = paraphrase_store if paraphrase_store is not None else ParaphraseStore()
+    if not resume or ckpt.get_meta("completed", False):
+        ckpt.reset()
+    finished = ckpt.done_keys()
     taxonomy_keys = sorted(PROMPT_TAXONOMY.keys())
     total_tasks = len(df_sel) * (len(taxonomy_keys) + (1 if include_baseline else 0))
-    done, created_runs_count = 0, 0
-    progress, status = st.progress(0.0), st.empty()
+    done, created_runs_count, failed_count = 0, 0, 0
+    cancelled = False
+    # Journal còn record chưa ghi từ lần chạy bị gián đoạn -> ghi trước
+    _flush_checkpoint(store, ckpt, reporter)
     ai_user_id = f"{evaluator_name} - AI"
 
     educator_personas = ["A patient and encouraging tutor", "A sharp, concise university professor", "A friendly peer who explains things simply", "An examiner focused on precision and keywords", "A Socratic coach", "A motivational coach"]
     student_personas = ["A curious student who wants to know 'why'", "An anxious student who needs a lot of reassurance", "A practical student who wants real-world examples", "A slightly confused student asking for a simpler explanation"]
     persona_pool = educator_personas + student_personas
 
-    # --- Main Loop ---
-    for _, row in df_sel.iterrows():
-        problem_text = clean_problem_text(row[cols["problem"]])
-        problem_id = generate_problem_id(problem_text)
-        content_domain = str(row[cols["ccss"]]).split("(")[0].strip()
-        cognitive_level = _parse_level_num(row[cols["level"]])
-        problem_context = _map_context(row[cols["abstract / real-world"]])
-        
-        # <<< SỬA LỖI QUAN TRỌNG: CHỌN PERSONA MỘT LẦN DUY NHẤT CHO MỖI BÀI TOÁN >>>
-        persona_for_this_problem = random.choice(persona_pool)
-
-        variants = []
-        if include_baseline:
-            variants.append((f"Solve this problem:\n{problem_text}", persona_for_this_problem, 0, "Zero-Shot Baseline", None))
-
-        for k in taxonomy_keys:
-                    sug = PROMPT_TAXONOMY[k]
-                    # SỬA Ở ĐÂY: Giải nén tuple, chỉ lấy giá trị đầu tiên (prompt_text)
-                    # Dấu gạch dưới (_) dùng để chứa giá trị persona trả về mà chúng ta không cần dùng đến.
-                    prompt_text, _ = synthesize_prompt_from_suggestion(
-                        problem_text=problem_text,
-                        suggestion=sug,
-                        cognitive_level=cognitive_level,
-                        ai_persona=persona_for_this_problem,
-                        model=paraphraser_model,
-                        strict_fill=False,
-                    )
-                    variants.append((prompt_text, persona_for_this_problem, int(sug.get("level", 0)), str(sug["name"]), k))
-                    
-        for prompt_text, persona, level_hint, prompt_name, sug_key in variants:
-            processed_data = _process_single_prompt_variant(
-                run_id=str(uuid.uuid4()), prompt_text=prompt_text, persona=persona,
-                problem_id=problem_id, problem_text=problem_text, content_domain=content_domain,
-                cognitive_level=cognitive_level, problem_context=problem_context,
-                level_hint=level_hint, prompt_name=prompt_name, sug_key=sug_key,
-                ai_user_id=ai_user_id, ai_grader=ai_user_id,
-                analyzer_model=analyzer_model, solver_model=solver_model,
-                tokenizer=tokenizer, metrics=metrics
-            )
+    max_workers = max(1, int(max_workers))
+    max_in_flight = max(max_workers, int(max_in_flight or 2 * max_workers))
+
+    def _iter_tasks():
+        # Duyệt tuần tự ở luồng chính -> run_id giữ đúng thứ tự như bản tuần tự
+        nonlocal cancelled
+        for (_, row), problem_id in zip(df_sel.iterrows(), problem_ids):
+            if reporter.should_stop():
+                cancelled = True
+                return
+            problem = {
+                "problem_text": clean_problem_text(row[cols["problem"]]),
+                "problem_id": problem_id,
+                "content_domain": str(row[cols["ccss"]]).split("(")[0].strip(),
+                "cognitive_level": _parse_level_num(row[cols["level"]]),
+                "problem_context": _map_context(row[cols["abstract / real-world"]]),
+            }
+            # CHỌN PERSONA MỘT LẦN DUY NHẤT CHO MỖI BÀI TOÁN (resume dùng lại persona đã lưu)
+            problem["persona"] = ckpt.persona_for(problem["problem_id"], lambda: _choose_persona(persona_pool, persona_seed, problem_id))
+            keys = ([None] if include_baseline else []) + list(taxonomy_keys)
+            for k in keys:
+                if (problem["problem_id"], task_key(k)) in finished:
+                    _skip()
+                    continue
+                yield dict(
+                    run_id=str(uuid.uuid4()), problem=problem, sug_key=k, ai_user_id=ai_user_id,
+                    analyzer_model=analyzer_model, solver_model=solver_model, paraphraser_model=paraphraser_model,
+                    tokenizer=tokenizer, metrics=metrics, throttle_sec=throttle_sec,
+                    paraphrases=paraphrases, reuse_paraphrases=reuse_paraphrases, paraphrases_per_key=paraphrases_per_key,
+                )
+
+    def _skip():
+        nonlocal done
+        done += 1
+
+    def _collect(result: Dict[str, Any]):
+        nonlocal done, created_runs_count, failed_count
+        done += 1
+        processed_data, prompt_name = result["data"], result["prompt_name"]
+        if result["error"] is not None:
+            failed_count += 1
+            reporter.warning(f"Skipping run for prompt '{prompt_name}' (ID: {result['run_id'][:8]}) due to error: {result['error']}")
+        if processed_data:
+            created_runs_count += 1
+            rows = {sheet: [_to_dict_any(processed_data[field])] for sheet, field in _SHEET_FIELDS if processed_data[field]}
+            ckpt.record(result["problem_id"], result["sug_key"], result["run_id"], rows)
+
+        reporter.progress(done, total_tasks, f"AI User: {done}/{total_tasks} | {prompt_name} | Persona: {result['persona']}")
+
+        if processed_data and created_runs_count % flush_every == 0:
+            _flush_checkpoint(store, ckpt, reporter)
 
-            done += 1
-            if processed_data:
-                created_runs_count += 1
-                buffers["runs"].append(processed_data["run"])
-                buffers["metrics_deterministic"].append(processed_data["metrics"])
-                buffers["metrics_advanced"].append(processed_data["adv_metrics"])
-                buffers["metrics_patterns"].append(processed_data["metrics_pattern"])
-                buffers["analyzer_scores"].append(processed_data["analyzer_score"])
-                buffers["analyzer_patterns"].append(processed_data["analyzer_pattern"])
-                if processed_data["suggestion"]:
-                    buffers["suggestions"].append(processed_data["suggestion"])
-                buffers["evaluations"].append(processed_data["evaluation"])
-
-            status.write(f"AI User: {done}/{total_tasks} | {prompt_name} | Persona: {persona}")
-            progress.progress(min(1.0, done / total_tasks))
-
-            if created_runs_count > 0 and created_runs_count % flush_every == 0:
-                for sheet_name, items in buffers.items():
-                    if items: _append_rows_safe(gsheet, sheet_name, items)
-                    items.clear()
-            
-            time.sleep(throttle_sec)
+    if mode == "offline":
+        # --- Offline batch: không bị rate limit tương tác, kết quả về theo đúng thứ tự task ---
+        on_poll = lambda job_id, job_status, elapsed: reporter.info(f"Batch job {job_id}: {job_status} ({int(elapsed)}s)")
+        try:
+            backend = batch_backend or OpenAIBatchBackend()
+            for result in _iter_offline_results(list(_iter_tasks()), backend=backend, poll_interval=batch_poll_sec, on_poll=on_poll, should_stop=reporter.should_stop):
+                _collect(result)
+        except BatchJobError as e:
+            cancelled = cancelled or reporter.should_stop()
+            reporter.error(f"Offline batch failed: {e}")
+    else:
+        # --- Main Loop: bounded pool, thu kết quả theo thứ tự submit ---
+        with ThreadPoolExecutor(max_workers=max_workers, initializer=_attach_script_ctx, initargs=(get_script_run_ctx(),)) as pool:
+            pending = deque()
+            for task in _iter_tasks():
+                pending.append(pool.submit(_run_variant_task, **task))
+                if len(pending) >= max_in_flight:
+                    _collect(pending.popleft().result())
+            while pending:
+                _collect(pending.popleft().result())
 
     # Final flush
-    for sheet_name, items in buffers.items():
-        if items: _append_rows_safe(gsheet, sheet_name, items)
+    _flush_checkpoint(store, ckpt, reporter)
+    counts = ckpt.counts()
+    unflushed = counts["pending"] + counts["flushing"]
+    if unflushed:
+        reporter.warning(f"Batch {batch_id}: {unflushed} task chưa ghi được lên sheet; chạy lại để thử ghi tiếp.")
+    elif done >= total_tasks and len(ckpt.done_keys()) >= total_tasks:
+        ckpt.set_meta("completed", True)
+    ckpt.close()
+    if paraphrase_store is None:
+        paraphrases.close()
 
-    progress.progress(1.0)
-    status.write("✅ AI User process complete.")
-    return {"selected": int(len(df_sel)), "created_runs": created_runs_count}
\ No newline at end of file
+    if cancelled:
+        reporter.progress(done, total_tasks, f"⏹️ AI User cancelled at {done}/{total_tasks}.")
+    else:
+        reporter.progress(total_tasks, total_tasks, "✅ AI User process complete.")
+    return {"selected": int(len(df_sel)), "created_runs": created_runs_count, "batch_id": batch_id, "resumed": len(finished), "cancelled": cancelled,
+            "failed": failed_count, "unflushed": unflushed}
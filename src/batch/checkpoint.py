@@ -0,0 +1,119 @@
+# src/batch/checkpoint.py
+"""
+Journal checkpoint (SQLite, mỗi batch một file) cho run_ai_user_batch.
+
+- Mỗi (problem_id, taxonomy key) chạy xong được ghi ngay cùng toàn bộ record của nó
+  (Run, PromptMetrics, ...) -> session chết giữa chừng không mất gì, chạy lại thì bỏ qua phần đã xong.
+- Persona chọn cho từng problem cũng được lưu để lần resume dùng lại đúng persona đó.
+- Ghi sheet đúng một lần: record đi qua các trạng thái PENDING -> FLUSHING -> FLUSHED.
+  Nếu process chết khi đang FLUSHING (không rõ sheet đã nhận hay chưa), lần flush sau
+  đối chiếu run_id đã có trên sheet trước khi ghi lại.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+DEFAULT_CHECKPOINT_DIR = os.path.join(".cache", "checkpoints")
+
+PENDING, FLUSHING, FLUSHED = 0, 1, 2
+BASELINE_KEY = "baseline"
+
+
+def _json_default(v: Any) -> str:
+    # Cùng định dạng thời gian mà GoogleSheetManager ghi cho cột datetime
+    if isinstance(v, datetime):
+        return v.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    return str(v)
+
+
+def task_key(sug_key: Optional[int]) -> str:
+    return BASELINE_KEY if sug_key is None else str(sug_key)
+
+
+class BatchCheckpoint:
+    def __init__(self, batch_id: str, root: str = DEFAULT_CHECKPOINT_DIR):
+        self.batch_id = batch_id
+        os.makedirs(root, exist_ok=True)
+        self.path = os.path.join(root, f"{batch_id}.sqlite")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+            "CREATE TABLE IF NOT EXISTS personas (problem_id TEXT PRIMARY KEY, persona TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " problem_id TEXT NOT NULL, task_key TEXT NOT NULL, run_id TEXT NOT NULL, records TEXT NOT NULL,"
+            " state INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, PRIMARY KEY (problem_id, task_key));"
+            "CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks(state);"
+        )
+        self._conn.commit()
+
+    # ---- meta ----
+    def get_meta(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value, default=str)))
+            self._conn.commit()
+
+    def reset(self) -> None:
+        """Xoá toàn bộ journal (bắt đầu lại batch cùng cấu hình)."""
+        with self._lock:
+            self._conn.executescript("DELETE FROM meta; DELETE FROM personas; DELETE FROM tasks;")
+            self._conn.commit()
+
+    # ---- task state ----
+    def persona_for(self, problem_id: str, choose: Callable[[], str]) -> str:
+        with self._lock:
+            row = self._conn.execute("SELECT persona FROM personas WHERE problem_id = ?", (problem_id,)).fetchone()
+        if row:
+            return row[0]
+        persona = choose()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO personas (problem_id, persona) VALUES (?, ?)", (problem_id, persona))
+            self._conn.commit()
+        return persona
+
+    def done_keys(self) -> Set[Tuple[str, str]]:
+        with self._lock:
+            return {(p, k) for p, k in self._conn.execute("SELECT problem_id, task_key FROM tasks")}
+
+    def record(self, problem_id: str, sug_key: Optional[int], run_id: str, rows: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Ghi kết quả một task (rows: {sheet_name: [row dict]}) ở trạng thái PENDING."""
+        payload = json.dumps(rows, ensure_ascii=False, default=_json_default)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tasks (problem_id, task_key, run_id, records, state, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (problem_id, task_key(sug_key), run_id, payload, PENDING, time.time()),
+            )
+            self._conn.commit()
+
+    def unflushed(self) -> List[Tuple[str, Dict[str, List[Dict[str, Any]]], int]]:
+        """[(run_id, rows, state)] cho các task chưa FLUSHED, theo thứ tự hoàn thành."""
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT run_id, records, state FROM tasks WHERE state != ? ORDER BY created_at, rowid", (FLUSHED,)
+            )
+            return [(run_id, json.loads(records), state) for run_id, records, state in cur]
+
+    def mark(self, run_ids: Iterable[str], state: int) -> None:
+        with self._lock:
+            self._conn.executemany("UPDATE tasks SET state = ? WHERE run_id = ?", [(state, rid) for rid in run_ids])
+            self._conn.commit()
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = dict(self._conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+        return {"pending": rows.get(PENDING, 0), "flushing": rows.get(FLUSHING, 0), "flushed": rows.get(FLUSHED, 0)}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,150 @@
+# src/batch/cli.py
+"""
+Chạy pipeline AI User (run_ai_user_batch) từ shell / cron, không cần Streamlit UI.
+
+    python -m src.batch.cli --evaluator "Lab server" --ccss 7.RP 7.EE --level 2 3 --context real-world \\
+        --workers 16 [--input problems.csv | --input problems.parquet] [--mode offline]
+
+Không truyền --input thì đọc tab `--sheet` (mặc định "problems") như sidebar. Filter để trống = tất cả.
+Cấu hình (OpenAI key, Google service account, ...) vẫn đọc từ .streamlit/secrets.toml trong thư mục chạy.
+Mã thoát: 0 = xong (kể cả khi chỉ có cảnh báo, vd bỏ bài trùng), 1 = lỗi cấu hình/đầu vào,
+2 = có task lỗi, còn record chưa ghi hoặc lỗi batch/ghi checkpoint, 130 = bị huỷ (Ctrl+C).
+"""
+
+import argparse
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from typing import List, Optional
+
+import pandas as pd
+
+from src.batch.progress import BatchReporter
+
+log = logging.getLogger("promptoptima.batch")
+
+
+class LoggingReporter(BatchReporter):
+    """Reporter cho CLI: ghi tiến độ qua logging (tối đa mỗi `every_sec` giây một dòng)."""
+
+    def __init__(self, every_sec: float = 5.0, stop_event: Optional[threading.Event] = None):
+        self.every_sec = every_sec
+        self.stop_event = stop_event or threading.Event()
+        self.warnings = 0
+        self.errors = 0
+        self._last = 0.0
+
+    def progress(self, done: int, total: int, message: str = "") -> None:
+        now = time.monotonic()
+        if done >= total or now - self._last >= self.every_sec:
+            self._last = now
+            log.info("[%d/%d] %s", done, total, message)
+
+    def info(self, message: str) -> None:
+        log.info(message)
+
+    def warning(self, message: str) -> None:
+        self.warnings += 1
+        log.warning(message)
+
+    def error(self, message: str) -> None:
+        self.errors += 1
+        log.error(message)
+
+    def should_stop(self) -> bool:
+        return self.stop_event.is_set()
+
+
+def load_problems(path: str) -> pd.DataFrame:
+    """Đọc bảng bài toán từ CSV hoặc Parquet (giữ mọi ô dạng chuỗi như khi đọc từ sheet)."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".parquet", ".pq"):
+        df = pd.read_parquet(path)
+    elif ext in (".csv", ".tsv", ".txt"):
+        df = pd.read_csv(path, sep="\t" if ext == ".tsv" else ",", dtype=str, keep_default_na=False)
+    else:
+        raise ValueError(f"Unsupported problems file '{path}' (expected .csv, .tsv or .parquet).")
+    df = df.fillna("").astype(str)
+    df.columns = [str(c).strip() for c in df.columns]
+    return df
+
+
+def exit_code(res: dict, reporter: LoggingReporter) -> int:
+    """Mã thoát theo kết quả run_ai_user_batch; cảnh báo thuần thông tin không làm run thất bại."""
+    if res.get("cancelled"):
+        return 130
+    if not res.get("selected"):
+        return 1
+    # reporter.errors: lỗi batch offline / ghi sheet; failed/unflushed: task lỗi hoặc record chưa ghi
+    return 2 if reporter.errors or res.get("failed") or res.get("unflushed") else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="python -m src.batch.cli", description="Run the PromptOptima AI-user batch headlessly.")
+    p.add_argument("--evaluator", required=True, help="Evaluator name; runs are logged as '<name> - AI'.")
+    p.add_argument("--ccss", nargs="*", default=[], help="Content domains, e.g. 7.RP 7.EE (empty = all).")
+    p.add_argument("--level", nargs="*", default=[], help="Cognitive levels, e.g. 1 2 or L3 (empty = all).")
+    p.add_argument("--context", nargs="*", default=[], help="Problem contexts as in the sheet, e.g. real-world abstract (empty = all).")
+    p.add_argument("--input", help="Local CSV/Parquet problems file instead of the Google Sheet tab.")
+    p.add_argument("--sheet", default="problems", help="Problems tab name when --input is not given.")
+    p.add_argument("--no-baseline", action="store_true", help="Skip the zero-shot baseline variant.")
+    p.add_argument("--analyzer-model", default="gpt-3.5-turbo")
+    p.add_argument("--solver-model", default="gpt-3.5-turbo")
+    p.add_argument("--paraphraser-model", default="gpt-3.5-turbo")
+    p.add_argument("--workers", type=int, default=4, help="Variants processed in parallel (online mode).")
+    p.add_argument("--flush-every", type=int, default=20)
+    p.add_argument("--mode", choices=("online", "offline"), default="online")
+    p.add_argument("--batch-poll-sec", type=float, default=30.0, help="Polling interval for offline batch jobs.")
+    p.add_argument("--batch-id", help="Checkpoint journal id (default: derived from the run configuration).")
+    p.add_argument("--no-resume", action="store_true", help="Ignore an existing checkpoint and start over.")
+    p.add_argument("--fresh-paraphrases", action="store_true", help="Always call the paraphraser instead of reusing stored paraphrases.")
+    p.add_argument("--paraphrases-per-key", type=int, default=1, help="Paraphrases generated per request and stored for later runs.")
+    p.add_argument("--persona-seed", default=None, help="Seed for the per-problem persona choice (default: the runner's fixed seed).")
+    p.add_argument("--log-every", type=float, default=5.0, help="Seconds between progress lines.")
+    p.add_argument("-v", "--verbose", action="store_true")
+    return p
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    # Streamlit cảnh báo "missing ScriptRunContext" cho mỗi st.* khi chạy ngoài `streamlit run`
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    problems = None
+    if args.input:
+        try:
+            problems = load_problems(args.input)
+        except Exception as e:
+            log.error("Cannot read problems from %s: %s", args.input, e)
+            return 1
+        log.info("Loaded %d problems from %s", len(problems), args.input)
+
+    reporter = LoggingReporter(every_sec=args.log_every)
+    # Ctrl+C lần 1: dừng sau các task đang chạy (record đã xong vẫn được ghi); lần 2: thoát ngay
+    def _on_sigint(signum, frame):
+        if reporter.stop_event.is_set():
+            raise KeyboardInterrupt
+        log.warning("Stopping after in-flight tasks (Ctrl+C again to abort)...")
+        reporter.stop_event.set()
+    signal.signal(signal.SIGINT, _on_sigint)
+
+    from src.batch.ai_user_runner import run_ai_user_batch
+    res = run_ai_user_batch(
+        sheet_name=args.sheet, ccss_filters=args.ccss, level_filters=args.level, context_filters=args.context,
+        evaluator_name=args.evaluator, include_baseline=not args.no_baseline,
+        analyzer_model=args.analyzer_model, solver_model=args.solver_model, paraphraser_model=args.paraphraser_model,
+        flush_every=args.flush_every, max_workers=args.workers, mode=args.mode, batch_poll_sec=args.batch_poll_sec,
+        batch_id=args.batch_id, resume=not args.no_resume, reporter=reporter, problems=problems,
+        reuse_paraphrases=not args.fresh_paraphrases, paraphrases_per_key=args.paraphrases_per_key,
+        **({"persona_seed": args.persona_seed} if args.persona_seed is not None else {}),
+    )
+    log.info("Result: %s", res)
+    return exit_code(res, reporter)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+# src/batch/jobs.py
+"""
+Hàng đợi job chạy run_ai_user_batch ở background thread, tách khỏi vòng đời script Streamlit.
+
+- Một queue + N worker thread dùng chung cho cả server (get_job_queue dùng st.cache_resource),
+  nên nhiều người có thể xếp job và job vẫn chạy khi đóng tab trình duyệt.
+- Sidebar chỉ poll trạng thái (snapshot), không giữ tham chiếu tới widget nào trong thread.
+- cancel(): job đang chờ bị bỏ ngay; job đang chạy dừng sau các task đang dở (record đã xong
+  vẫn được ghi nhờ checkpoint, chạy lại cùng cấu hình sẽ resume).
+"""
+
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import streamlit as st
+
+from src.batch.progress import BatchReporter
+
+JOB_STATUSES = ("queued", "running", "cancelling", "cancelled", "done", "failed")
+_ACTIVE = ("queued", "running", "cancelling")
+
+
+@dataclass
+class BatchJob:
+    job_id: str
+    spec: Dict[str, Any]
+    submitted_by: str = ""
+    status: str = "queued"
+    done: int = 0
+    total: int = 0
+    message: str = ""
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    log: Deque[str] = field(default_factory=lambda: deque(maxlen=50))
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id, "submitted_by": self.submitted_by, "status": self.status,
+            "done": self.done, "total": self.total, "message": self.message,
+            "result": self.result, "error": self.error, "log": list(self.log),
+            "created_at": self.created_at, "started_at": self.started_at, "finished_at": self.finished_at,
+        }
+
+
+class JobReporter(BatchReporter):
+    """Ghi tiến độ/log của run_ai_user_batch vào BatchJob (thread-safe qua lock của queue)."""
+
+    def __init__(self, job: BatchJob, lock: threading.Lock):
+        self.job, self._lock = job, lock
+
+    def progress(self, done: int, total: int, message: str = "") -> None:
+        with self._lock:
+            self.job.done, self.job.total = done, total
+            if message:
+                self.job.message = message
+
+    def info(self, message: str) -> None:
+        with self._lock:
+            self.job.message = message
+
+    def warning(self, message: str) -> None:
+        with self._lock:
+            self.job.log.append(f"⚠️ {message}")
+
+    def error(self, message: str) -> None:
+        with self._lock:
+            self.job.log.append(f"❌ {message}")
+
+    def should_stop(self) -> bool:
+        return self.job.cancel_event.is_set()
+
+
+class BatchJobQueue:
+    def __init__(self, runner: Optional[Callable[..., Dict[str, Any]]] = None, max_concurrent: int = 1, keep_finished: int = 50):
+        if runner is None:
+            from src.batch.ai_user_runner import run_ai_user_batch as runner
+        self._runner = runner
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, BatchJob] = {}
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._keep_finished = keep_finished
+        self._workers = [
+            threading.Thread(target=self._work, name=f"batch-job-{i}", daemon=True)
+            for i in range(max(1, int(max_concurrent)))
+        ]
+        for t in self._workers:
+            t.start()
+
+    # ---- public API (sidebar) ----
+    def submit(self, spec: Dict[str, Any], submitted_by: str = "") -> str:
+        job = BatchJob(job_id=uuid.uuid4().hex[:8], spec=dict(spec), submitted_by=submitted_by)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune_locked()
+        self._queue.put(job.job_id)
+        return job.job_id
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.snapshot() if job else None
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [j.snapshot() for j in sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)]
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job.status not in _ACTIVE:
+                return False
+            job.cancel_event.set()
+            if job.status == "queued":
+                job.status, job.finished_at = "cancelled", time.time()
+            else:
+                job.status = "cancelling"
+            return True
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Chờ job kết thúc (dùng cho CLI/test)."""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            snap = self.status(job_id)
+            if snap is None or snap["status"] not in _ACTIVE:
+                return snap
+            if deadline is not None and time.time() > deadline:
+                return snap
+            time.sleep(0.05)
+
+    # ---- worker ----
+    def _work(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job.status != "queued":
+                    continue  # đã huỷ khi còn trong hàng đợi
+                job.status, job.started_at = "running", time.time()
+            reporter = JobReporter(job, self._lock)
+            try:
+                result = self._runner(**job.spec, reporter=reporter)
+                with self._lock:
+                    job.result = result
+                    job.status = "cancelled" if job.cancel_event.is_set() else "done"
+            except Exception as e:
+                with self._lock:
+                    job.error = f"{type(e).__name__}: {e}"
+                    job.log.append(traceback.format_exc(limit=5))
+                    job.status = "failed"
+            finally:
+                with self._lock:
+                    job.finished_at = time.time()
+
+    def _prune_locked(self) -> None:
+        finished = sorted((j for j in self._jobs.values() if j.status not in _ACTIVE), key=lambda j: j.created_at)
+        for j in finished[: max(0, len(finished) - self._keep_finished)]:
+            del self._jobs[j.job_id]
+
+
+@st.cache_resource
+def get_job_queue(max_concurrent: int = 1) -> BatchJobQueue:
+    return BatchJobQueue(max_concurrent=max_concurrent)
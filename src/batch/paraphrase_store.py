@@ -0,0 +1,85 @@
+# src/batch/paraphrase_store.py
+"""
+Kho paraphrase (SQLite) cho run_ai_user_batch, dùng chung giữa các lần chạy.
+
+Khoá = (problem_id, taxonomy key, persona, cognitive_level, model) + hash của template taxonomy
+(sửa template thì paraphrase cũ tự hết hiệu lực). Mỗi khoá giữ một hoặc nhiều biến thể:
+- take(): lấy biến thể được dùng ít nhất (các lần chạy lại lần lượt nhận biến thể khác nhau,
+  hết thì quay vòng) -> không tốn call paraphrase nào.
+- add(): lưu các biến thể vừa sinh (vd n biến thể từ một request với `n`), trả về biến thể đầu.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+DEFAULT_PARAPHRASE_PATH = os.path.join(".cache", "paraphrases.sqlite")
+
+ParaphraseKey = Tuple[str, str, str, int, str, str]
+
+
+def paraphrase_key(problem_id: str, sug_key: int, persona: str, cognitive_level: int, model: str, template: str) -> ParaphraseKey:
+    tpl_hash = hashlib.sha1((template or "").encode("utf-8")).hexdigest()[:12]
+    return (str(problem_id), str(sug_key), str(persona), int(cognitive_level), str(model), tpl_hash)
+
+
+class ParaphraseStore:
+    def __init__(self, path: str = DEFAULT_PARAPHRASE_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS paraphrases ("
+            " problem_id TEXT NOT NULL, sug_key TEXT NOT NULL, persona TEXT NOT NULL, cognitive_level INTEGER NOT NULL,"
+            " model TEXT NOT NULL, template_hash TEXT NOT NULL, variant INTEGER NOT NULL, text TEXT NOT NULL,"
+            " uses INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL,"
+            " PRIMARY KEY (problem_id, sug_key, persona, cognitive_level, model, template_hash, variant));"
+        )
+        self._conn.commit()
+        self.stats = {"hits": 0, "misses": 0, "stored": 0}
+
+    _WHERE = "problem_id = ? AND sug_key = ? AND persona = ? AND cognitive_level = ? AND model = ? AND template_hash = ?"
+
+    def take(self, key: ParaphraseKey) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT variant, text FROM paraphrases WHERE {self._WHERE} ORDER BY uses, variant LIMIT 1", key
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute(f"UPDATE paraphrases SET uses = uses + 1 WHERE {self._WHERE} AND variant = ?", (*key, row[0]))
+            self._conn.commit()
+            self.stats["hits"] += 1
+            return row[1]
+
+    def add(self, key: ParaphraseKey, texts: List[str]) -> Optional[str]:
+        """Lưu biến thể mới (bỏ chuỗi rỗng); biến thể đầu được tính là đã dùng một lần và được trả về."""
+        texts = [t for t in texts if t]
+        if not texts:
+            return None
+        now = time.time()
+        with self._lock:
+            start = self._conn.execute(f"SELECT COALESCE(MAX(variant) + 1, 0) FROM paraphrases WHERE {self._WHERE}", key).fetchone()[0]
+            self._conn.executemany(
+                "INSERT INTO paraphrases (problem_id, sug_key, persona, cognitive_level, model, template_hash, variant, text, uses, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(*key, start + i, t, 1 if i == 0 else 0, now) for i, t in enumerate(texts)],
+            )
+            self._conn.commit()
+            self.stats["stored"] += len(texts)
+        return texts[0]
+
+    def count(self, key: ParaphraseKey) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM paraphrases WHERE {self._WHERE}", key).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,61 @@
+# src/batch/progress.py
+"""
+Báo tiến độ / log cho run_ai_user_batch, không phụ thuộc UI.
+
+run_ai_user_batch chỉ gọi các method của BatchReporter; nơi gọi chọn cách hiển thị:
+- StreamlitReporter: progress bar + st.warning/st.error trong script đang chạy (mặc định).
+- Reporter của background job (src/batch/jobs.py) ghi vào trạng thái job để sidebar poll.
+`should_stop()` cho phép huỷ giữa chừng (kiểm tra giữa các task).
+"""
+
+from typing import Optional
+
+import streamlit as st
+
+
+class BatchReporter:
+    def progress(self, done: int, total: int, message: str = "") -> None:
+        pass
+
+    def info(self, message: str) -> None:
+        pass
+
+    def warning(self, message: str) -> None:
+        pass
+
+    def error(self, message: str) -> None:
+        pass
+
+    def should_stop(self) -> bool:
+        return False
+
+
+class StreamlitReporter(BatchReporter):
+    def __init__(self):
+        # Tạo progress bar khi có tiến độ đầu tiên (lỗi cấu hình sớm không để lại bar rỗng)
+        self._bar = None
+        self._status = None
+
+    def _widgets(self):
+        if self._bar is None:
+            self._bar, self._status = st.progress(0.0), st.empty()
+        return self._bar, self._status
+
+    def progress(self, done: int, total: int, message: str = "") -> None:
+        bar, status = self._widgets()
+        if message:
+            status.write(message)
+        bar.progress(min(1.0, done / total) if total else 1.0)
+
+    def info(self, message: str) -> None:
+        self._widgets()[1].write(message)
+
+    def warning(self, message: str) -> None:
+        st.warning(message)
+
+    def error(self, message: str) -> None:
+        st.error(message)
+
+
+def default_reporter(reporter: Optional[BatchReporter]) -> BatchReporter:
+    return reporter if reporter is not None else StreamlitReporter()
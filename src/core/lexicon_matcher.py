@@ -0,0 +1,124 @@
+# src/core/lexicon_matcher.py
+"""
+LexiconMatcher: automaton Aho–Corasick dựng một lần cho nhiều lexicon,
+quét văn bản MỘT lượt tuyến tính và trả về (count, hits) cho từng lexicon.
+
+Giữ nguyên ngữ nghĩa của cách đếm cũ trong metrics_advanced:
+- Thuật ngữ một từ  -> như re.findall(rf"\\b{term}\\b", text) (có ranh giới từ).
+- Cụm nhiều từ (có dấu cách) -> như text.count(term) (chuỗi con, không cần ranh giới).
+- Cả hai đều đếm KHÔNG chồng lấn theo từng thuật ngữ (quét trái -> phải).
+
+Dùng:
+    matcher = LexiconMatcher({"cognitive": COGNITIVE_VERBS, "abstract": ABSTRACT_TERMS})
+    res = matcher.scan(text_lower)
+    cnt, hits = res["cognitive"]
+"""
+
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+
+def _is_word_char(ch: str) -> bool:
+    # Cùng định nghĩa "word character" của module re cho pattern str (Unicode).
+    return ch.isalnum() or ch == "_"
+
+def _at_boundary(text: str, pos: int) -> bool:
+    # Tương đương \b của re tại vị trí pos.
+    before = pos > 0 and _is_word_char(text[pos - 1])
+    after = pos < len(text) and _is_word_char(text[pos])
+    return before != after
+
+
+class LexiconMatcher:
+    def __init__(self, lexicons: Dict[str, Iterable[str]]):
+        self.names: List[str] = list(lexicons)
+        # term -> (term_id); mỗi term có thể thuộc nhiều lexicon (vd "explain").
+        self._terms: List[str] = []
+        self._term_lexicons: List[Tuple[int, ...]] = []
+        self._term_bounded: List[bool] = []
+        index: Dict[str, int] = {}
+        owners: Dict[str, List[int]] = {}
+        for li, name in enumerate(self.names):
+            for term in lexicons[name]:
+                if not term:
+                    continue
+                if term not in index:
+                    index[term] = len(self._terms)
+                    self._terms.append(term)
+                    owners[term] = []
+                if li not in owners[term]:
+                    owners[term].append(li)
+        for term in self._terms:
+            self._term_lexicons.append(tuple(owners[term]))
+            self._term_bounded.append(" " not in term)
+        self._build()
+
+    def _build(self) -> None:
+        goto: List[Dict[str, int]] = [{}]
+        out: List[List[int]] = [[]]
+        for tid, term in enumerate(self._terms):
+            state = 0
+            for ch in term:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto.append({})
+                    out.append([])
+                    goto[state][ch] = nxt
+                state = nxt
+            out[state].append(tid)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = [tuple(o) for o in out]
+
+    def iter_matches(self, text: str):
+        """Sinh (start, end, term_id) cho mọi lần xuất hiện (có thể chồng lấn), theo thứ tự end tăng dần."""
+        goto, fail, out, terms = self._goto, self._fail, self._out, self._terms
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                end = i + 1
+                for tid in out[state]:
+                    yield end - len(terms[tid]), end, tid
+
+    def scan(self, text: str) -> Dict[str, Tuple[int, List[str]]]:
+        """
+        Một lượt quét cho tất cả lexicon. Trả về {lexicon_name: (count, hits)};
+        hits liệt kê theo thứ tự xuất hiện trong văn bản.
+        """
+        terms, bounded, owners = self._terms, self._term_bounded, self._term_lexicons
+        last_end: Dict[int, int] = {}
+        found: List[Tuple[int, int]] = []
+        for start, end, tid in self.iter_matches(text):
+            if start < last_end.get(tid, 0):
+                continue  # chồng lấn với lần khớp trước của cùng term
+            if bounded[tid] and not (_at_boundary(text, start) and _at_boundary(text, end)):
+                continue
+            last_end[tid] = end
+            found.append((start, tid))
+
+        found.sort()
+        result: Dict[str, Tuple[int, List[str]]] = {}
+        hits_by_lex: List[List[str]] = [[] for _ in self.names]
+        for _, tid in found:
+            for li in owners[tid]:
+                hits_by_lex[li].append(terms[tid])
+        for li, name in enumerate(self.names):
+            result[name] = (len(hits_by_lex[li]), hits_by_lex[li])
+        return result
@@ -3,8 +3,11 @@
 from __future__ import annotations
 import re
 import math
+from dataclasses import dataclass, field
 from typing import Dict, List, Tuple, Optional, Set
 
+from src.core.lexicon_matcher import LexiconMatcher
+
 # ---------------- Lexicons (V2.1 – Expanded and Cleaned) ----------------
 COGNITIVE_VERBS: Set[str] = {
     # Analyze / Understand / Apply
@@ -132,6 +135,15 @@ STEP_INLINE_RE = re.compile(r"\b(first|second|third|fourth|fifth)\b", re.IGNOREC
 STEP_PHRASE_RE = re.compile(r"\bstep[-\s]?by[-\s]?step\b", re.IGNORECASE)
 SECTION_HEADER_RE = re.compile(r"(?m)^\s*(?:part|section|thread|student|approach)\s*[A-Z\d]+[:\.\)]", re.IGNORECASE)
 
+# --- Multi-pattern matcher (dựng một lần khi import) ---
+_LEXICON_MATCHER = LexiconMatcher({
+    "cognitive": COGNITIVE_VERBS,
+    "abstract": ABSTRACT_TERMS,
+    "metacognitive": METACOGNITIVE_VERBS,
+    "logic_connectors": LOGIC_CONNECTORS,
+    "modals": MODALS,
+})
+
 
 # ---------------- Helpers ----------------
 def _words(text: str) -> List[str]:
@@ -140,62 +152,100 @@ def _words(text: str) -> List[str]:
 def _numbers(text: str) -> List[str]:
     return NUM_RE.findall(text)
 
+def _sentences(text: str) -> List[str]:
+    return [s.strip() for s in SENT_SPLIT_RE.split(text) if s.strip()]
+
 def _lexical_density(tokens: List[str]) -> float:
     if not tokens: return 0.0
     content_words = [t for t in tokens if t not in STOPWORDS]
     return len(content_words) / len(tokens) if tokens else 0.0
 
-def _clauses_per_sentence(text: str) -> float:
-    sents = [s.strip() for s in SENT_SPLIT_RE.split(text) if s.strip()]
+def _clauses_per_sentence(sents: List[str]) -> float:
     if not sents: return 0.0
     clause_counts = [1 + len(CLAUSE_BOUNDARY_RE.findall(s)) for s in sents]
     return sum(clause_counts) / len(sents)
 
-def _count_terms_and_hits(text_lower: str, terms: Set[str]) -> Tuple[int, List[str]]:
-    cnt = 0
-    hits: List[str] = []
-    for term in terms:
-        if " " in term:
-            k = text_lower.count(term)
-            if k > 0:
-                cnt += k
-                hits.extend([term] * k)
-        else:
-            found = re.findall(rf"\b{re.escape(term)}\b", text_lower)
-            if found:
-                cnt += len(found)
-                hits.extend(found)
-    return cnt, hits
+def _scan_lexicons(text_lower: str) -> Dict[str, Tuple[int, List[str]]]:
+    """Một lượt quét Aho–Corasick cho cả 5 lexicon -> {tên lexicon: (count, hits)}."""
+    return _LEXICON_MATCHER.scan(text_lower)
 
 def _findall_hits(pattern: re.Pattern, text: str) -> List[str]:
     return [m.group(0) for m in pattern.finditer(text)]
 
 
-# ---------------- CDI: Cognitive Demand Index (Hybrid) ----------------
-def compute_cdi(prompt_text: str, ai_pattern_hits: Optional[Dict] = None) -> Dict:
+# ---------------- Shared prompt features ----------------
+@dataclass
+class PromptFeatures:
+    """
+    Đặc trưng dùng chung cho CDI/SSS/ARQ, tính MỘT lần cho mỗi prompt:
+    từ, câu, số, formula marks và lexicon hits (trên văn bản gốc + bản làm giàu AI).
+    """
+    text: str
+    text_lower: str
+    words: List[str]               # từ (lower) của văn bản gốc
+    sentences: List[str]
+    numbers: List[str]
+    formula_hits: List[str]
+    cdi_text: str                  # text_lower + từ khoá AI (cognitive, abstract)
+    arq_text: str                  # text_lower + từ khoá AI (abstract, meta, cognitive)
+    cdi_n_words: int               # số từ của cdi_text
+    _lex_cache: Dict[str, Dict[str, Tuple[int, List[str]]]] = field(default_factory=dict, repr=False)
+
+    def lexicons(self, text_lower: str) -> Dict[str, Tuple[int, List[str]]]:
+        """Lexicon hits cho một biến thể văn bản; các biến thể trùng nhau chỉ quét một lần."""
+        res = self._lex_cache.get(text_lower)
+        if res is None:
+            res = self._lex_cache[text_lower] = _scan_lexicons(text_lower)
+        return res
+
+
+def extract_prompt_features(prompt_text: str, ai_pattern_hits: Optional[Dict] = None) -> PromptFeatures:
     text = prompt_text or ""
     text_lower = text.lower()
-    
-    # --- Làm giàu văn bản với các từ khóa từ AI ---
-    enriched_text = text_lower
+    words = _words(text_lower)
+
+    # --- Làm giàu văn bản với các từ khóa từ AI (giữ đúng cách nối cũ của CDI/ARQ) ---
+    cdi_text = arq_text = text_lower
+    cdi_n_words = len(words)
     if ai_pattern_hits:
         ai_cognitive = ai_pattern_hits.get("cognitive_terms_ai", [])
         ai_abstract = ai_pattern_hits.get("abstract_terms_ai", [])
-        # Nối các từ AI tìm thấy vào văn bản để đếm
-        enriched_text += " " + " ".join(ai_cognitive) + " " + " ".join(ai_abstract)
+        ai_meta = ai_pattern_hits.get("meta_terms_ai", [])
+        cdi_suffix = " " + " ".join(ai_cognitive) + " " + " ".join(ai_abstract)
+        # Gộp cả cognitive vào vì AI có thể phân loại nhầm "reasoning" vào đây
+        arq_suffix = " " + " ".join(ai_abstract) + " " + " ".join(ai_meta) + " ".join(ai_cognitive)
+        cdi_text = text_lower + cdi_suffix
+        arq_text = text_lower + arq_suffix
+        # Hậu tố bắt đầu bằng dấu cách nên không dính từ với văn bản gốc
+        cdi_n_words += len(_words(cdi_suffix))
+
+    return PromptFeatures(
+        text=text,
+        text_lower=text_lower,
+        words=words,
+        sentences=_sentences(text),
+        numbers=_findall_hits(NUM_RE, text),
+        formula_hits=_findall_hits(FORMULA_MARK_RE, text),
+        cdi_text=cdi_text,
+        arq_text=arq_text,
+        cdi_n_words=cdi_n_words,
+    )
+
 
-    # Tính toán trên văn bản đã được làm giàu
-    tokens = _words(enriched_text)
-    n_tokens = max(1, len(tokens))
+# ---------------- CDI: Cognitive Demand Index (Hybrid) ----------------
+def compute_cdi(prompt_text: str, ai_pattern_hits: Optional[Dict] = None, *, features: Optional[PromptFeatures] = None) -> Dict:
+    f = features or extract_prompt_features(prompt_text, ai_pattern_hits)
 
-    c_terms_count, c_hits = _count_terms_and_hits(enriched_text, COGNITIVE_VERBS)
-    a_terms_count, a_hits = _count_terms_and_hits(enriched_text, ABSTRACT_TERMS)
+    # Đếm thuật ngữ trên văn bản đã được làm giàu bằng từ khoá AI
+    n_tokens = max(1, f.cdi_n_words)
+    lex = f.lexicons(f.cdi_text)
+    c_terms_count, c_hits = lex["cognitive"]
+    a_terms_count, a_hits = lex["abstract"]
 
     # Các chỉ số khác vẫn tính trên văn bản gốc để giữ tính khách quan
-    original_tokens = _words(text_lower)
-    ld = _lexical_density(original_tokens)
-    cps = _clauses_per_sentence(text)
-    
+    ld = _lexical_density(f.words)
+    cps = _clauses_per_sentence(f.sentences)
+
     c_rate = c_terms_count / n_tokens
     a_rate = a_terms_count / n_tokens
 
@@ -212,8 +262,9 @@ def compute_cdi(prompt_text: str, ai_pattern_hits: Optional[Dict] = None) -> Dic
 
 
 # ---------------- SSS: Structured Scaffolding Score (Rule-based) ----------------
-def compute_sss(prompt_text: str) -> Dict:
-    text = prompt_text or ""
+def compute_sss(prompt_text: str, *, features: Optional[PromptFeatures] = None) -> Dict:
+    f = features or extract_prompt_features(prompt_text)
+    text = f.text
     section_hits = _findall_hits(SECTION_HEADER_RE, text)
     ex_hits = _findall_hits(EXAMPLE_RE, text)
     step_hits = (
@@ -222,7 +273,7 @@ def compute_sss(prompt_text: str) -> Dict:
         + _findall_hits(STEP_PHRASE_RE, text)
         + section_hits
     )
-    formula_hits = _findall_hits(FORMULA_MARK_RE, text)
+    formula_hits = list(f.formula_hits)
     hint_hits = _findall_hits(HINT_RE, text)
 
     E, S, F, H = len(ex_hits), len(step_hits), len(formula_hits), len(hint_hits)
@@ -237,28 +288,20 @@ def compute_sss(prompt_text: str) -> Dict:
 
 
 # ---------------- ARQ: Abstract Reasoning Quotient (Hybrid) ----------------
-def compute_arq(prompt_text: str, ai_pattern_hits: Optional[Dict] = None) -> Dict:
-    text = prompt_text or ""
-    text_lower = text.lower()
-
-    # --- Làm giàu văn bản với các từ khóa từ AI ---
-    enriched_text = text_lower
-    if ai_pattern_hits:
-        ai_abstract = ai_pattern_hits.get("abstract_terms_ai", [])
-        ai_meta = ai_pattern_hits.get("meta_terms_ai", [])
-        # Gộp cả cognitive vào vì AI có thể phân loại nhầm "reasoning" vào đây
-        ai_cognitive = ai_pattern_hits.get("cognitive_terms_ai", [])
-        enriched_text += " " + " ".join(ai_abstract) + " " + " ".join(ai_meta) + " ".join(ai_cognitive)
+def compute_arq(prompt_text: str, ai_pattern_hits: Optional[Dict] = None, *, features: Optional[PromptFeatures] = None) -> Dict:
+    f = features or extract_prompt_features(prompt_text, ai_pattern_hits)
 
     # Đếm lại thuật ngữ trên văn bản đã làm giàu
-    a_terms_count, a_hits = _count_terms_and_hits(enriched_text, ABSTRACT_TERMS)
-    meta_terms_count, meta_hits = _count_terms_and_hits(enriched_text, METACOGNITIVE_VERBS)
+    lex = f.lexicons(f.arq_text)
+    a_terms_count, a_hits = lex["abstract"]
+    meta_terms_count, meta_hits = lex["metacognitive"]
 
     # Các yếu tố khác vẫn đếm trên văn bản gốc
-    numbers = _findall_hits(NUM_RE, text)
-    formula_hits = _findall_hits(FORMULA_MARK_RE, text)
-    logic_conn_count, logic_conn_hits = _count_terms_and_hits(text_lower, LOGIC_CONNECTORS)
-    modal_count, modal_hits = _count_terms_and_hits(text_lower, MODALS)
+    numbers = list(f.numbers)
+    formula_hits = f.formula_hits
+    lex_orig = f.lexicons(f.text_lower)
+    logic_conn_count, logic_conn_hits = lex_orig["logic_connectors"]
+    modal_count, modal_hits = lex_orig["modals"]
 
     # Tính toán cuối cùng
     denom = len(numbers) + len(formula_hits) + 1
@@ -282,12 +325,14 @@ def compute_arq(prompt_text: str, ai_pattern_hits: Optional[Dict] = None) -> Dic
 def compute_advanced_metrics(prompt_text: str, ai_pattern_hits: Optional[Dict] = None) -> Dict:
     """
     Hàm điều phối chính, tính toán tất cả các chỉ số nâng cao.
-    Nó sẽ truyền các pattern do AI phát hiện vào các hàm tính CDI và ARQ.
+    Đặc trưng của prompt (PromptFeatures) được trích MỘT lần rồi dùng chung cho CDI/SSS/ARQ;
+    các pattern do AI phát hiện được dùng để làm giàu văn bản cho CDI và ARQ.
     """
-    cdi = compute_cdi(prompt_text, ai_pattern_hits=ai_pattern_hits)
+    features = extract_prompt_features(prompt_text, ai_pattern_hits)
+    cdi = compute_cdi(prompt_text, ai_pattern_hits=ai_pattern_hits, features=features)
     # SSS vẫn dựa trên rule-based vì regex đã rất mạnh cho việc nhận diện cấu trúc.
-    sss = compute_sss(prompt_text)
-    arq = compute_arq(prompt_text, ai_pattern_hits=ai_pattern_hits)
+    sss = compute_sss(prompt_text, features=features)
+    arq = compute_arq(prompt_text, ai_pattern_hits=ai_pattern_hits, features=features)
 
     hits = {
         "c_terms": cdi["hits"]["cognitive_terms"],
@@ -302,4 +347,4 @@ def compute_advanced_metrics(prompt_text: str, ai_pattern_hits: Optional[Dict] =
         "modals": arq["hits"]["modals"],
     }
     
-    return {"cdi": cdi, "sss": sss, "arq": arq, "hits": hits}
\ No newline at end of file
+    return {"cdi": cdi, "sss": sss, "arq": arq, "hits": hits}
@@ -1,5 +1,9 @@
 import re
-from typing import List, Dict
+from typing import List, Dict, Iterator, Sequence, Tuple
+
+# Ký tự ngăn cách khi tokenize cả lô trong một lượt: không thuộc pattern nào ngoài 'other'
+# (không phải khoảng trắng/chữ/số/dấu) nên không token nào vắt qua ranh giới hai văn bản.
+_BATCH_SEP = "\x01"
 
 # Định nghĩa một interface trừu tượng để dễ mở rộng sau này
 class Tokenizer:
@@ -9,10 +13,38 @@ class Tokenizer:
     def count(self, text: str) -> int:
         raise NotImplementedError
 
+    def iter_tokens(self, text: str) -> Iterator[str]:
+        # Mặc định: duyệt trên list; tokenizer con có thể sinh token lười (lazy).
+        yield from self.tokenize(text)
+
+    def tokenize_many(self, texts: Sequence[str]) -> Tuple[List[str], List[int]]:
+        """Token của cả lô nối liền nhau + số token của từng văn bản (mặc định: tokenize từng văn bản)."""
+        tokens: List[str] = []
+        counts: List[int] = []
+        for text in texts:
+            toks = self.tokenize(text)
+            tokens.extend(toks)
+            counts.append(len(toks))
+        return tokens, counts
+
 class AdvancedTokenizer(Tokenizer):
-    """Tokenizer hỗ trợ đa ngôn ngữ và math symbols"""
-    
-    def __init__(self):
+    """Tokenizer hỗ trợ đa ngôn ngữ và math symbols
+
+    mode:
+    - "regex"  (mặc định): gộp các pattern theo thứ tự ưu tiên thành MỘT regex alternation
+      có named group, quét bằng finditer (chạy trong C).
+    - "legacy": duyệt từng vị trí và thử lần lượt từng pattern (cách cũ, giữ để đối chiếu).
+    Hai mode cho ra danh sách token giống hệt nhau.
+    """
+
+    # Thứ tự ưu tiên khi match tại một vị trí (sau khi bỏ qua khoảng trắng)
+    PRIORITY = ['math_expr', 'numbers', 'vietnamese', 'english', 'math_symbols', 'punctuation']
+    MODES = ("regex", "legacy")
+
+    def __init__(self, mode: str = "regex"):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown tokenizer mode '{mode}'. Expected one of {self.MODES}.")
+        self.mode = mode
         self.patterns = {
             'math_expr': r'\d+\.?\d*\s*[+\-*/=<>≤≥≠]\s*\d+\.?\d*',
             'numbers': r'\d+\.?\d*',
@@ -23,20 +55,50 @@ class AdvancedTokenizer(Tokenizer):
             'whitespace': r'\s+',
             'other': r'\S'
         }
-        
+
         self.compiled_patterns = {
-            name: re.compile(pattern, re.UNICODE | re.IGNORECASE) 
+            name: re.compile(pattern, re.UNICODE | re.IGNORECASE)
             for name, pattern in self.patterns.items()
         }
-    
+
+        # Khoảng trắng đứng đầu (không đặt tên -> lastgroup = None), rồi các pattern theo PRIORITY,
+        # cuối cùng là một ký tự bất kỳ (fallback "lấy ký tự đơn" của bản legacy).
+        alternation = "|".join(
+            [self.patterns['whitespace']]
+            + [f"(?P<{name}>{self.patterns[name]})" for name in self.PRIORITY]
+            + ["(?P<other>.)"]
+        )
+        self.token_re = re.compile(alternation, re.UNICODE | re.IGNORECASE | re.DOTALL)
+        # Cùng alternation nhưng chỉ một group bao toàn bộ token: findall trả '' cho khoảng trắng,
+        # nên tokenize() chỉ cần lọc chuỗi rỗng (không tạo Match object cho từng token).
+        alts = "|".join(f"(?:{self.patterns[name]})" for name in self.PRIORITY)
+        self._flat_re = re.compile(
+            f"{self.patterns['whitespace']}|({alts}|.)", re.UNICODE | re.IGNORECASE | re.DOTALL
+        )
+        # Đếm token: mỗi match = khoảng trắng đứng trước (nếu có) + đúng một token. Fallback là \S
+        # (ký tự lẻ luôn không phải khoảng trắng) để khoảng trắng cuối chuỗi không bị tính thành token.
+        self._count_re = re.compile(
+            f"(?:{self.patterns['whitespace']})?(?:{alts}|\\S)", re.UNICODE | re.IGNORECASE
+        )
+
     def tokenize(self, text: str) -> List[str]:
         if not text or not text.strip():
             return []
-            
+        if self.mode == "legacy":
+            return self._tokenize_legacy(text)
+        return [t for t in self._flat_re.findall(text) if t]
+
+    def tokenize_with_kinds(self, text: str) -> List[Tuple[str, str]]:
+        """(token, loại pattern) — loại là tên named group khớp, vd 'numbers', 'english', 'other'."""
+        if not text or not text.strip():
+            return []
+        return [(m.group(), m.lastgroup) for m in self.token_re.finditer(text) if m.lastgroup]
+
+    def _tokenize_legacy(self, text: str) -> List[str]:
         tokens = []
         i = 0
         text_len = len(text)
-        
+
         while i < text_len:
             # Ưu tiên match khoảng trắng để bỏ qua
             whitespace_match = self.compiled_patterns['whitespace'].match(text, i)
@@ -46,23 +108,57 @@ class AdvancedTokenizer(Tokenizer):
 
             matched = False
             # Thử match theo thứ tự ưu tiên
-            for pattern_name in ['math_expr', 'numbers', 'vietnamese', 'english', 'math_symbols', 'punctuation']:
+            for pattern_name in self.PRIORITY:
                 pattern = self.compiled_patterns[pattern_name]
                 match = pattern.match(text, i)
-                
+
                 if match:
                     token = match.group(0)
                     tokens.append(token)
                     i = match.end()
                     matched = True
                     break
-            
+
             if not matched:
                 # Nếu không match pattern nào, lấy ký tự đơn
                 tokens.append(text[i])
                 i += 1
-        
+
         return tokens
-    
+
+    def iter_tokens(self, text: str) -> Iterator[str]:
+        """Sinh token lần lượt (không dựng list) — dùng cho MATTR trên văn bản dài."""
+        if not text or not text.strip():
+            return
+        if self.mode == "legacy":
+            yield from self._tokenize_legacy(text)
+            return
+        for m in self.token_re.finditer(text):
+            if m.lastgroup:
+                yield m.group()
+
+    def tokenize_many(self, texts: Sequence[str]) -> Tuple[List[str], List[int]]:
+        """
+        Mode regex: nối cả lô bằng _BATCH_SEP rồi quét MỘT lần bằng findall (thay vì mỗi văn bản một lần);
+        mỗi văn bản có đúng các token như tokenize(text).
+        """
+        if self.mode == "legacy" or any(_BATCH_SEP in t for t in texts):
+            return super().tokenize_many(texts)
+        flat = list(filter(None, self._flat_re.findall(_BATCH_SEP.join(texts) + _BATCH_SEP)))
+        tokens: List[str] = []
+        counts: List[int] = []
+        start = 0
+        for _ in texts:
+            end = flat.index(_BATCH_SEP, start)
+            tokens.extend(flat[start:end])
+            counts.append(end - start)
+            start = end + 1
+        return tokens, counts
+
     def count(self, text: str) -> int:
-        return len(self.tokenize(text))
\ No newline at end of file
+        if not text or not text.strip():
+            return 0
+        if self.mode == "legacy":
+            return len(self._tokenize_legacy(text))
+        # subn chỉ trả về số lần thay thế, không tạo chuỗi cho từng token
+        return self._count_re.subn("", text)[1]
\ No newline at end of file
@@ -59,6 +59,8 @@ class Run(BaseModel):
     latency_ms: int = 0
     tokens_in: int = 0
     tokens_out: int = 0
+    ttft_ms: Optional[int] = None          # time-to-first-token (chỉ khi solver chạy stream)
+    tokens_per_sec: Optional[float] = None # tokens_out / (latency_ms - ttft_ms)
 
     created_at: datetime = Field(default_factory=new_timestamp)
 
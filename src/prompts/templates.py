@@ -0,0 +1,126 @@
+# src/prompts/templates.py
+"""
+Template của PROMPT_TAXONOMY được biên dịch một lần khi import:
+
+- Mỗi template tách thành các đoạn literal xen kẽ placeholder ({problem_text}, {student_answer},
+  {hypothesis}); placeholder lạ hoặc template thiếu {problem_text} -> ValueError ngay khi import.
+- render(): điền một lần duyệt (không str.replace lặp, nội dung bài toán có dấu {…} cũng không bị
+  thay nhầm).
+- render_many(): một template × nhiều bài toán — các placeholder khác được điền trước, mỗi bài chỉ còn
+  một `problem_text.join(segments)`.
+- strict_fill_grid(): toàn bộ lưới bài toán × taxonomy bằng strict-fill (không gọi LLM), dùng cho
+  các nghiên cứu metric offline.
+"""
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from src.prompts.taxonomy import PROMPT_TAXONOMY
+from src.utils.lazy_import import lazy_import
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+PLACEHOLDER_RE = re.compile(r"\{([A-Za-z_][A-Za-z0-9_]*)\}")
+PROBLEM_FIELD = "problem_text"
+
+# Giá trị điền sẵn cho strict-fill (không có LLM để bịa câu trả lời / giả thuyết)
+STRICT_FILL_VALUES: Dict[str, str] = {
+    "student_answer": "The student calculated the area as 96 square meters.",
+    "hypothesis": "The final number of items is directly proportional to the perimeter.",
+}
+KNOWN_PLACEHOLDERS = frozenset({PROBLEM_FIELD, *STRICT_FILL_VALUES})
+
+
+@dataclass(frozen=True)
+class CompiledTemplate:
+    source: str
+    literals: Tuple[str, ...]  # len(fields) + 1 đoạn literal
+    fields: Tuple[str, ...]    # placeholder theo thứ tự xuất hiện
+
+    @property
+    def placeholders(self) -> frozenset:
+        return frozenset(self.fields)
+
+    def render(self, values: Dict[str, str]) -> str:
+        out = [self.literals[0]]
+        for name, lit in zip(self.fields, self.literals[1:]):
+            out.append(values[name])
+            out.append(lit)
+        return "".join(out)
+
+    def segments(self, values: Dict[str, str]) -> List[str]:
+        """Điền mọi placeholder trừ {problem_text}; trả về các đoạn để nối bằng problem_text."""
+        segs, cur = [], [self.literals[0]]
+        for name, lit in zip(self.fields, self.literals[1:]):
+            if name == PROBLEM_FIELD:
+                segs.append("".join(cur))
+                cur = []
+            else:
+                cur.append(values[name])
+            cur.append(lit)
+        segs.append("".join(cur))
+        return segs
+
+    def render_many(self, problem_texts: Iterable[str], values: Optional[Dict[str, str]] = None) -> List[str]:
+        segs = self.segments(values or {})
+        return [str(p).join(segs) for p in problem_texts]
+
+    def strict_fill(self, problem_text: str) -> str:
+        return self.render({**STRICT_FILL_VALUES, PROBLEM_FIELD: problem_text})
+
+
+def compile_template(source: str, *, name: str = "template", strict: bool = True) -> CompiledTemplate:
+    """strict=False: placeholder lạ được giữ nguyên như văn bản và không bắt buộc có {problem_text}."""
+    literals, fields, pos = [], [], 0
+    unknown = sorted({m.group(1) for m in PLACEHOLDER_RE.finditer(source)} - KNOWN_PLACEHOLDERS)
+    if strict and unknown:
+        raise ValueError(f"{name}: unknown placeholder(s) {unknown}; expected {sorted(KNOWN_PLACEHOLDERS)}")
+    for m in PLACEHOLDER_RE.finditer(source):
+        if m.group(1) not in KNOWN_PLACEHOLDERS:
+            continue
+        literals.append(source[pos:m.start()])
+        fields.append(m.group(1))
+        pos = m.end()
+    literals.append(source[pos:])
+    if strict and PROBLEM_FIELD not in fields:
+        raise ValueError(f"{name}: template has no {{{PROBLEM_FIELD}}} placeholder")
+    return CompiledTemplate(source, tuple(literals), tuple(fields))
+
+
+@lru_cache(maxsize=256)
+def compiled(source: str) -> CompiledTemplate:
+    """Template bất kỳ (vd suggestion tự tạo) -> bản biên dịch, cache theo nội dung."""
+    return _BY_SOURCE.get(source) or compile_template(source, strict=False)
+
+
+COMPILED_TEMPLATES: Dict[int, CompiledTemplate] = {
+    key: compile_template(sug["template"], name=f"PROMPT_TAXONOMY[{key}]") for key, sug in PROMPT_TAXONOMY.items()
+}
+_BY_SOURCE = {t.source: t for t in COMPILED_TEMPLATES.values()}
+
+
+def strict_fill_grid(problem_texts: Sequence[str], keys: Optional[Iterable[int]] = None) -> "pd.DataFrame":
+    """
+    Lưới bài toán × taxonomy điền bằng strict-fill (không gọi API).
+    Cột: problem_index, sug_key, level, prompt_name, prompt_text (thứ tự: theo key rồi theo bài).
+    """
+    pd = lazy_import("pandas")  # chỉ dùng cho nghiên cứu offline, không nạp khi import openai_client
+    problem_texts = [str(p) for p in problem_texts]
+    keys = sorted(COMPILED_TEMPLATES) if keys is None else list(keys)
+    n = len(problem_texts)
+    frames = []
+    for key in keys:
+        sug = PROMPT_TAXONOMY[key]
+        frames.append(pd.DataFrame({
+            "problem_index": range(n),
+            "sug_key": key,
+            "level": int(sug.get("level", 0)),
+            "prompt_name": str(sug["name"]),
+            "prompt_text": COMPILED_TEMPLATES[key].render_many(problem_texts, STRICT_FILL_VALUES),
+        }))
+    if not frames:
+        return pd.DataFrame(columns=["problem_index", "sug_key", "level", "prompt_name", "prompt_text"])
+    return pd.concat(frames, ignore_index=True)
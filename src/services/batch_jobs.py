@@ -0,0 +1,232 @@
+# src/services/batch_jobs.py
+"""
+Offline batch job: ghi các request chat.completions thành file JSONL, gửi qua một backend,
+chờ (poll) tới khi xong rồi đọc file kết quả về {custom_id: kết quả}.
+
+Mỗi dòng input theo định dạng của OpenAI Batch API:
+    {"custom_id": "...", "method": "POST", "url": "/v1/chat/completions", "body": {...}}
+Mỗi dòng output:
+    {"custom_id": "...", "response": {"status_code": 200, "body": {ChatCompletion}}, "error": null}
+
+Backend:
+- OpenAIBatchBackend: Files + Batches API (production, rẻ hơn và không bị rate limit tương tác).
+- LocalBatchBackend : chạy từng dòng qua một hàm `responder(body) -> ChatCompletion JSON`
+                      và ghi file output cạnh file input (dùng cho test / chạy thử).
+"""
+
+import json
+import os
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from src.services.openai_pool import get_openai_client
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+DEFAULT_BATCH_DIR = os.path.join(".cache", "batch_jobs")
+# Giới hạn mỗi file đầu vào của Batch API (50.000 request, 200 MB); chừa biên cho dung lượng
+MAX_REQUESTS_PER_FILE = 50000
+MAX_BYTES_PER_FILE = 190 * 1024 * 1024
+
+
+class BatchJobError(RuntimeError):
+    """Job kết thúc ở trạng thái khác 'completed' hoặc quá thời gian chờ."""
+
+
+class BatchBackend:
+    def submit(self, input_path: str) -> str:
+        raise NotImplementedError
+
+    def status(self, job_id: str) -> str:
+        raise NotImplementedError
+
+    def download(self, job_id: str, output_path: str) -> str:
+        """Ghi toàn bộ dòng kết quả (cả dòng lỗi) vào output_path."""
+        raise NotImplementedError
+
+    def cancel(self, job_id: str) -> None:
+        pass
+
+
+class OpenAIBatchBackend(BatchBackend):
+    def __init__(self, client=None, completion_window: str = "24h"):
+        if client is None:
+            pooled = get_openai_client()
+            if not pooled:
+                raise BatchJobError("OpenAI API key is not configured; offline batch mode needs it.")
+            client = pooled[0]
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, input_path: str) -> str:
+        with open(input_path, "rb") as f:
+            uploaded = self.client.files.create(file=f, purpose="batch")
+        job = self.client.batches.create(
+            input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT, completion_window=self.completion_window
+        )
+        return job.id
+
+    def status(self, job_id: str) -> str:
+        return self.client.batches.retrieve(job_id).status
+
+    def download(self, job_id: str, output_path: str) -> str:
+        job = self.client.batches.retrieve(job_id)
+        with open(output_path, "w", encoding="utf-8") as out:
+            for file_id in (job.output_file_id, job.error_file_id):
+                if file_id:
+                    text = self.client.files.content(file_id).text
+                    out.write(text if text.endswith("\n") or not text else text + "\n")
+        return output_path
+
+    def cancel(self, job_id: str) -> None:
+        self.client.batches.cancel(job_id)
+
+
+class LocalBatchBackend(BatchBackend):
+    """Stand-in chạy đồng bộ ngay khi submit; lỗi của responder thành dòng `error` như Batch API."""
+
+    def __init__(self, responder: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        self.responder = responder
+        self._outputs: Dict[str, str] = {}
+
+    def submit(self, input_path: str) -> str:
+        job_id = f"local_{uuid.uuid4().hex[:12]}"
+        out_path = f"{input_path}.{job_id}.out"
+        with open(input_path, encoding="utf-8") as src:
+            items = [json.loads(line) for line in src if line.strip()]
+        # Như Batch API: một file đầu vào chỉ được dùng một model
+        models = {(item.get("body") or {}).get("model") for item in items}
+        if len(models) > 1:
+            raise BatchJobError(f"Input file mixes models {sorted(map(str, models))}; one model per batch file.")
+        with open(out_path, "w", encoding="utf-8") as out:
+            for item in items:
+                try:
+                    res = {"custom_id": item["custom_id"], "response": {"status_code": 200, "body": self.responder(item["body"])}, "error": None}
+                except Exception as e:
+                    res = {"custom_id": item["custom_id"], "response": None, "error": {"code": type(e).__name__, "message": str(e)}}
+                out.write(json.dumps(res, ensure_ascii=False) + "\n")
+        self._outputs[job_id] = out_path
+        return job_id
+
+    def status(self, job_id: str) -> str:
+        return "completed" if job_id in self._outputs else "failed"
+
+    def download(self, job_id: str, output_path: str) -> str:
+        with open(self._outputs[job_id], encoding="utf-8") as src, open(output_path, "w", encoding="utf-8") as out:
+            out.write(src.read())
+        return output_path
+
+
+def write_jsonl(path: str, requests: Iterable[Dict[str, Any]]) -> int:
+    """requests: các dict {"custom_id", "body"}. Trả về số dòng đã ghi."""
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for r in requests:
+            line = {"custom_id": r["custom_id"], "method": "POST", "url": BATCH_ENDPOINT, "body": r["body"]}
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            n += 1
+    return n
+
+
+def read_results(path: str) -> Dict[str, Dict[str, Any]]:
+    """{custom_id: {"body": ChatCompletion JSON | None, "error": str | None}}."""
+    out: Dict[str, Dict[str, Any]] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            resp, err = item.get("response") or {}, item.get("error")
+            if not err and resp.get("status_code", 200) >= 400:
+                err = resp.get("body") or {"message": f"HTTP {resp.get('status_code')}"}
+            if err:
+                msg = err.get("message") if isinstance(err, dict) else str(err)
+                out[item["custom_id"]] = {"body": None, "error": msg or "unknown batch error"}
+            else:
+                out[item["custom_id"]] = {"body": resp.get("body"), "error": None}
+    return out
+
+
+def chunk_requests(requests: List[Dict[str, Any]], max_requests: int = MAX_REQUESTS_PER_FILE, max_bytes: int = MAX_BYTES_PER_FILE) -> List[List[Dict[str, Any]]]:
+    """
+    Chia requests thành các file đầu vào của Batch API: mỗi file chỉ một model (Batch API từ chối file
+    trộn model, vd analyzer và solver khác model), không vượt giới hạn số dòng / dung lượng.
+    """
+    by_model: Dict[Any, List[Dict[str, Any]]] = {}
+    for r in requests:
+        by_model.setdefault((r.get("body") or {}).get("model"), []).append(r)
+    chunks: List[List[Dict[str, Any]]] = []
+    for group in by_model.values():
+        cur: List[Dict[str, Any]] = []
+        size = 0
+        for r in group:
+            n = len(json.dumps(r, ensure_ascii=False).encode("utf-8")) + 64  # + method/url của dòng JSONL
+            if cur and (len(cur) >= max_requests or size + n > max_bytes):
+                chunks.append(cur)
+                cur, size = [], 0
+            cur.append(r)
+            size += n
+        if cur:
+            chunks.append(cur)
+    return chunks
+
+
+def run_batch_job(
+    requests: List[Dict[str, Any]], backend: BatchBackend, *, name: str = "job",
+    workdir: str = DEFAULT_BATCH_DIR, poll_interval: float = 30.0, timeout: Optional[float] = None,
+    on_poll: Optional[Callable[[str, str, float], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    max_requests_per_file: int = MAX_REQUESTS_PER_FILE, max_bytes_per_file: int = MAX_BYTES_PER_FILE,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Ghi `requests` ra JSONL (mỗi model một file/job, chia tiếp nếu vượt giới hạn mỗi file), submit, poll tới khi
+    mọi job kết thúc rồi gộp read_results(...) của từng job.
+    custom_id không có trong output (job lỗi một phần) được trả về với error.
+    `on_poll(job_id, status, elapsed_sec)` để báo tiến độ lên UI; `should_stop()` True -> huỷ các job.
+    """
+    if not requests:
+        return {}
+    os.makedirs(workdir, exist_ok=True)
+    stamp = f"{time.strftime('%Y%m%d-%H%M%S')}_{name}_{uuid.uuid4().hex[:6]}"
+    jobs: Dict[str, str] = {}  # job_id -> tiền tố file
+    for i, chunk in enumerate(chunk_requests(requests, max_requests_per_file, max_bytes_per_file)):
+        prefix = os.path.join(workdir, f"{stamp}_part{i}")
+        write_jsonl(f"{prefix}.requests.jsonl", chunk)
+        jobs[backend.submit(f"{prefix}.requests.jsonl")] = prefix
+    statuses: Dict[str, str] = {}
+
+    def _cancel_running() -> None:
+        for jid in jobs:
+            if statuses.get(jid) not in TERMINAL_STATUSES:
+                backend.cancel(jid)
+
+    t0 = time.time()
+    while True:
+        elapsed = time.time() - t0
+        for job_id in jobs:
+            if statuses.get(job_id) in TERMINAL_STATUSES:
+                continue
+            statuses[job_id] = backend.status(job_id)
+            if on_poll:
+                on_poll(job_id, statuses[job_id], elapsed)
+        if all(s in TERMINAL_STATUSES for s in statuses.values()):
+            break
+        if should_stop is not None and should_stop():
+            _cancel_running()
+            raise BatchJobError(f"Batch job(s) {', '.join(jobs)} cancelled.")
+        if timeout is not None and elapsed > timeout:
+            _cancel_running()
+            raise BatchJobError(f"Batch job(s) {', '.join(jobs)} timed out after {int(elapsed)}s.")
+        time.sleep(poll_interval)
+    # "expired" vẫn có output cho các dòng đã xong; dòng còn thiếu được đánh lỗi bên dưới
+    failed = {jid: s for jid, s in statuses.items() if s not in ("completed", "expired")}
+    if failed:
+        raise BatchJobError("; ".join(f"Batch job {jid} ended with status '{s}'." for jid, s in failed.items()))
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for job_id, prefix in jobs.items():
+        results.update(read_results(backend.download(job_id, f"{prefix}.results.jsonl")))
+    for r in requests:
+        results.setdefault(r["custom_id"], {"body": None, "error": "missing from batch output"})
+    return results
@@ -1,143 +1,375 @@
 # src/services/google_sheets.py
 import streamlit as st
-import gspread
-from gspread_dataframe import set_with_dataframe
 import pandas as pd
-from typing import List
+import math
+import re
+import numpy as np
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel
 
-class GoogleSheetManager:
+from src.services.storage import RecordStore
+from src.utils.lazy_import import lazy_import
+
+class GoogleSheetManager(RecordStore):
+    """
+    Spreadsheet được mở một lần (ưu tiên `spreadsheet_key` -> open_by_key, không cần Drive search);
+    handle worksheet và dòng header của từng tab được cache trong instance (dùng chung qua
+    get_gsheet_manager). Cache tự làm mới khi tab không còn / header lệch với dữ liệu ghi vào;
+    `cache_info()` trả về số hit/miss.
+    """
+
     def __init__(self):
         self.client = self._connect()
         try:
-            self.spreadsheet_name = st.secrets["google_sheets"]["spreadsheet_name"]
+            cfg = st.secrets["google_sheets"]
+            self.spreadsheet_name = cfg.get("spreadsheet_name")
+            self.spreadsheet_key = cfg.get("spreadsheet_key")
         except Exception:
             self.spreadsheet_name = None
+            self.spreadsheet_key = None
+        # Manager dùng chung giữa các session/thread (cache_resource) -> ghi tuần tự
+        self._write_lock = threading.Lock()
+        self._init_caches()
+
+    def _init_caches(self) -> None:
+        self._cache_lock = threading.RLock()
+        self._spreadsheet = None
+        self._worksheets: Dict[str, Any] = {}
+        self._headers: Dict[str, List[str]] = {}
+        self._col_counts: Dict[str, int] = {}
+        # Tab đã đọc lại header vì lệch cột -> tập cột đã kiểm tra (tránh đọc lại mỗi lần ghi)
+        self._header_checked: Dict[str, frozenset] = {}
+        # Bản sao tab đã đọc (get_df): header, số hàng đã đọc, hàng cuối, DataFrame
+        self._tabs: Dict[str, Dict[str, Any]] = {}
+        self.stats: Dict[str, Dict[str, int]] = {k: {"hits": 0, "misses": 0} for k in ("spreadsheet", "worksheet", "header", "tab")}
 
     def _connect(self):
         try:
             creds = st.secrets["gcp_service_account"]
-            return gspread.service_account_from_dict(creds)
+            return lazy_import("gspread").service_account_from_dict(creds)
         except Exception as e:
             st.error(f"Lỗi kết nối Google Sheets: {e}")
             return None
 
-    def _get_worksheet(self, sheet_name: str):
-        if not self.client or not self.spreadsheet_name:
+    # ---------- cache ----------
+    def cache_info(self) -> Dict[str, Dict[str, int]]:
+        with self._cache_lock:
+            return {k: dict(v) for k, v in self.stats.items()}
+
+    def invalidate(self, sheet_name: Optional[str] = None) -> None:
+        """Bỏ cache của một tab (hoặc toàn bộ, kể cả handle spreadsheet, nếu sheet_name=None)."""
+        with self._cache_lock:
+            if sheet_name is None:
+                self._spreadsheet = None
+                self._worksheets.clear()
+                self._headers.clear()
+                self._col_counts.clear()
+                self._header_checked.clear()
+                self._tabs.clear()
+            else:
+                self._worksheets.pop(sheet_name, None)
+                self._headers.pop(sheet_name, None)
+                self._col_counts.pop(sheet_name, None)
+                self._header_checked.pop(sheet_name, None)
+                self._tabs.pop(sheet_name, None)
+
+    def _open_spreadsheet(self):
+        if not self.client or not (self.spreadsheet_key or self.spreadsheet_name):
             return None
-        try:
-            spreadsheet = self.client.open(self.spreadsheet_name)
+        with self._cache_lock:
+            if self._spreadsheet is not None:
+                self.stats["spreadsheet"]["hits"] += 1
+                return self._spreadsheet
+            self.stats["spreadsheet"]["misses"] += 1
             try:
-                worksheet = spreadsheet.worksheet(sheet_name)
-            except gspread.WorksheetNotFound:
-                worksheet = spreadsheet.add_worksheet(title=sheet_name, rows="1", cols="1")
-            return worksheet
-        except gspread.SpreadsheetNotFound:
-            st.error(
-                f"Không tìm thấy Google Sheet với tên '{self.spreadsheet_name}'. "
-                "Vui lòng tạo và chia sẻ quyền editor cho email service account."
-            )
-            return None
+                if self.spreadsheet_key:
+                    self._spreadsheet = self.client.open_by_key(self.spreadsheet_key)
+                else:
+                    # Chỉ tìm theo tên một lần; các lần sau dùng lại handle (theo id)
+                    self._spreadsheet = self.client.open(self.spreadsheet_name)
+                self._worksheets = {ws.title: ws for ws in self._spreadsheet.worksheets()}
+            except lazy_import("gspread").SpreadsheetNotFound:
+                st.error(
+                    f"Không tìm thấy Google Sheet với tên '{self.spreadsheet_name or self.spreadsheet_key}'. "
+                    "Vui lòng tạo và chia sẻ quyền editor cho email service account."
+                )
+                return None
+            return self._spreadsheet
+
+    def _worksheet(self, spreadsheet, sheet_name: str, *, create: bool = True):
+        with self._cache_lock:
+            ws = self._worksheets.get(sheet_name)
+            if ws is not None:
+                self.stats["worksheet"]["hits"] += 1
+                return ws
+            self.stats["worksheet"]["misses"] += 1
+            # Có thể tab mới được tạo ở nơi khác -> làm mới danh sách trước khi tạo
+            self._worksheets = {w.title: w for w in spreadsheet.worksheets()}
+            ws = self._worksheets.get(sheet_name)
+            if ws is None and create:
+                ws = spreadsheet.add_worksheet(title=sheet_name, rows="1", cols="1")
+                self._worksheets[sheet_name] = ws
+                self._headers[sheet_name] = []
+            return ws
+
+    def _get_worksheet(self, sheet_name: str):
+        try:
+            spreadsheet = self._open_spreadsheet()
+            return self._worksheet(spreadsheet, sheet_name) if spreadsheet is not None else None
         except Exception as e:
             st.error(f"Lỗi khi mở worksheet '{sheet_name}': {e}")
             return None
 
-# Dán toàn bộ đoạn code này vào file src/services/google_sheets.py để thay thế hàm append_data cũ
-
-    def append_data(self, sheet_name: str, records: list):
-        worksheet = self._get_worksheet(sheet_name)
-        if not worksheet or not records:
-            return
-
-        # ===================================================================
-        # === NÂNG CẤP: Logic thông minh để xử lý cả object và dictionary ===
-        # ===================================================================
+    @staticmethod
+    def _records_to_df(records: list) -> pd.DataFrame:
+        # Chấp nhận dict, Pydantic v1/v2 và dataclass
         data_to_append = []
         for record in records:
             if isinstance(record, dict):
-                # Nếu đã là dictionary, dùng luôn
                 data_to_append.append(record)
             elif hasattr(record, 'model_dump'): # Dành cho Pydantic v2
                 data_to_append.append(record.model_dump())
             elif hasattr(record, 'dict'): # Dành cho Pydantic v1
                 data_to_append.append(record.dict())
             else:
-                # Fallback cho các loại khác như dataclass
                 from dataclasses import asdict, is_dataclass
-                if is_dataclass(record):
-                    data_to_append.append(asdict(record))
-                else:
-                    # Nếu không nhận dạng được, cứ thử append
-                    data_to_append.append(record)
-        
-        # Nếu data_to_append vẫn rỗng, thoát sớm
-        if not data_to_append:
+                data_to_append.append(asdict(record) if is_dataclass(record) else record)
+        df = pd.DataFrame(data_to_append)
+        # Chuẩn hóa datetime UTC -> string
+        for col in df.select_dtypes(include=["datetime64[ns, UTC]"]).columns:
+            df[col] = df[col].dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        return df
+
+    def _fetch_headers(self, spreadsheet, titles: List[str]) -> None:
+        """Đọc dòng header của nhiều tab trong MỘT values.batchGet; kết quả được cache theo tên tab."""
+        with self._cache_lock:
+            missing = [t for t in titles if t not in self._headers]
+            self.stats["header"]["hits"] += len(titles) - len(missing)
+            self.stats["header"]["misses"] += len(missing)
+        if not missing:
             return
-            
-        df_to_append = pd.DataFrame(data_to_append)
+        resp = spreadsheet.values_batch_get([f"'{t}'!1:1" for t in missing])
+        with self._cache_lock:
+            for t, vr in zip(missing, resp.get("valueRanges", [])):
+                values = vr.get("values") or [[]]
+                self._headers[t] = [str(h) for h in values[0]]
 
-        # Chuẩn hóa datetime UTC -> string
-        for col in df_to_append.select_dtypes(include=["datetime64[ns, UTC]"]).columns:
-            df_to_append[col] = df_to_append[col].dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    def _check_headers(self, frames: Dict[str, pd.DataFrame]) -> None:
+        """Header cache thiếu cột mà dữ liệu có -> có thể sheet đã được sửa: bỏ header cache để đọc lại."""
+        with self._cache_lock:
+            for name, df in frames.items():
+                header, cols = self._headers.get(name), frozenset(map(str, df.columns))
+                if header and not cols <= set(header) and self._header_checked.get(name) != cols:
+                    self._headers.pop(name, None)
+                    self._header_checked[name] = cols
 
+    def append_data(self, sheet_name: str, records: list) -> bool:
+        """Trả về True nếu ghi thành công (hoặc không có gì để ghi)."""
+        return self.append_many({sheet_name: records})
+
+    def append_many(self, batches: Dict[str, list]) -> bool:
+        """
+        Nối record vào nhiều tab trong MỘT spreadsheets.batchUpdate (appendCells cho từng tab).
+        Header được đọc một lần (values.batchGet) rồi cache; tab chưa có header thì ghi header
+        từ cột của dữ liệu. Dòng được căn theo header (cột thiếu để trống, cột mới được nối vào cuối header).
+        """
+        batches = {name: recs for name, recs in batches.items() if recs}
+        if not batches:
+            return True
+        with self._write_lock:
+            return self._append_many_locked(batches)
+
+    def _append_many_locked(self, batches: Dict[str, list]) -> bool:
+        new_headers: Dict[str, List[str]] = {}
+        new_cols: Dict[str, int] = {}
         try:
-            # Kiểm tra xem sheet có header chưa
-            header = worksheet.row_values(1)
-            if not header:
-                # Nếu chưa có, ghi cả header và dữ liệu
-                set_with_dataframe(worksheet, df_to_append, include_index=False, resize=True)
-            else:
-                # Nếu có rồi, chỉ nối thêm dòng
-                # Sắp xếp lại cột của dataframe cho khớp với header của sheet
-                df_aligned = df_to_append.reindex(columns=header).fillna('')
-                worksheet.append_rows(
-                    df_aligned.values.tolist(), value_input_option="USER_ENTERED"
-                )
+            spreadsheet = self._open_spreadsheet()
+            if spreadsheet is None:
+                return False
+            worksheets = {name: self._worksheet(spreadsheet, name) for name in batches}
+            frames = {name: self._records_to_df(records) for name, records in batches.items()}
+            self._check_headers(frames)
+            self._fetch_headers(spreadsheet, list(batches))
+
+            requests = []
+            for name, df in frames.items():
+                if df.empty:
+                    continue
+                ws, header = worksheets[name], self._headers.get(name) or []
+                rows, extra = [], []
+                if not header:
+                    header = [str(c) for c in df.columns]
+                    rows.append(header)
+                else:
+                    # Cột mới (vd field mới của schema) -> nối vào cuối header thay vì bỏ
+                    extra = [str(c) for c in df.columns if str(c) not in header]
+                    header = header + extra
+                rows.extend(df.reindex(columns=header).values.tolist())
+                cols = self._col_counts.get(name, ws.col_count)
+                if len(header) > cols:
+                    requests.append({"appendDimension": {"sheetId": ws.id, "dimension": "COLUMNS", "length": len(header) - cols}})
+                    new_cols[name] = len(header)
+                if extra:
+                    requests.append({"updateCells": {
+                        "start": {"sheetId": ws.id, "rowIndex": 0, "columnIndex": len(header) - len(extra)},
+                        "rows": [{"values": [_cell(c) for c in extra]}],
+                        "fields": "userEnteredValue",
+                    }})
+                requests.append({"appendCells": {
+                    "sheetId": ws.id,
+                    "rows": [{"values": [_cell(v) for v in row]} for row in rows],
+                    "fields": "userEnteredValue",
+                }})
+                new_headers[name] = header
+            if requests:
+                spreadsheet.batch_update({"requests": requests})
+            with self._cache_lock:
+                self._headers.update(new_headers)
+                # col_count của handle cache không tự cập nhật sau appendDimension
+                self._col_counts.update(new_cols)
+            return True
         except Exception as e:
-            st.error(f"Lỗi khi ghi dữ liệu vào sheet '{sheet_name}': {e}")
+            # Tab bị xoá/đổi tên hoặc header đổi ngoài app -> lần sau đọc lại từ đầu
+            for name in batches:
+                self.invalidate(name)
+            st.error(f"Lỗi khi ghi dữ liệu vào sheet {', '.join(repr(n) for n in batches)}: {e}")
+            return False
 
-    def get_df(self, sheet_name: str) -> pd.DataFrame:
+    def get_df(self, sheet_name: str, refresh: bool = False) -> pd.DataFrame:
         """
-        Đọc toàn bộ tab Google Sheets thành DataFrame.
-        - Dòng đầu là header.
-        - Tự xử lý hàng thiếu cột (pad/truncate).
-        - Loại hàng trống hoàn toàn.
+        Đọc tab Google Sheets thành DataFrame (mọi ô dạng chuỗi).
+        - Dòng đầu là header; hàng thiếu/thừa cột được pad/truncate; bỏ hàng trống hoàn toàn.
+        - Bản sao của tab được cache: lần đọc sau chỉ lấy các hàng mới từ sau hàng cuối đã biết
+          (một values.batchGet). Header đổi hoặc hàng cuối đã biết bị sửa/xoá -> đọc lại toàn bộ.
+        - refresh=True: bỏ cache, đọc lại toàn bộ tab.
         """
         ws = self._get_worksheet(sheet_name)
         if not ws:
             return pd.DataFrame()
 
         try:
-            # Lấy tất cả ô (list[list])
-            data = ws.get_all_values()
-            if not data or not data[0]:
-                return pd.DataFrame()
-
-            header = [str(h).strip() for h in data[0]]
-            rows = data[1:]
-
-            # Chuẩn hoá số cột mỗi hàng khớp header
-            ncol = len(header)
-            norm_rows = []
-            for r in rows:
-                r = list(r)
-                if len(r) < ncol:
-                    r += [""] * (ncol - len(r))
-                elif len(r) > ncol:
-                    r = r[:ncol]
-                norm_rows.append([str(x) if x is not None else "" for x in r])
-
-            df = pd.DataFrame(norm_rows, columns=header)
-
-            # Bỏ các hàng trống hoàn toàn
-            df = df[~df.apply(lambda s: all(str(x).strip() == "" for x in s), axis=1)]
-            return df
+            with self._cache_lock:
+                tab = None if refresh else self._tabs.get(sheet_name)
+            df = self._read_tail(sheet_name, tab) if tab else None
+            if df is None:
+                with self._cache_lock:
+                    self.stats["tab"]["misses"] += 1
+                df = self._read_full(sheet_name, ws)
+            else:
+                with self._cache_lock:
+                    self.stats["tab"]["hits"] += 1
+            return df.copy()
 
         except Exception as e:
+            with self._cache_lock:
+                self._tabs.pop(sheet_name, None)
             st.error(f"Lỗi khi đọc sheet '{sheet_name}': {e}")
             return pd.DataFrame()
 
+    def _read_full(self, sheet_name: str, ws) -> pd.DataFrame:
+        data = ws.get_all_values()
+        if not data or not data[0]:
+            with self._cache_lock:
+                self._tabs.pop(sheet_name, None)
+            return pd.DataFrame()
+        header = [str(h).strip() for h in data[0]]
+        rows = _normalize_rows(data[1:], len(header))
+        tab = {"header_raw": list(data[0]), "n_rows": len(data), "last": rows[-1] if rows else None,
+               "df": _rows_to_df(rows, header)}
+        with self._cache_lock:
+            self._tabs[sheet_name] = tab
+        return tab["df"]
+
+    def _read_tail(self, sheet_name: str, tab: Dict[str, Any]) -> Optional[pd.DataFrame]:
+        """Lấy header + các hàng từ hàng cuối đã biết trở đi; None nếu cache không còn khớp sheet."""
+        spreadsheet = self._open_spreadsheet()
+        if spreadsheet is None:
+            return None
+        ncol, n = max(1, len(tab["header_raw"])), tab["n_rows"]
+        last_col = lazy_import("gspread.utils").rowcol_to_a1(1, ncol).rstrip("0123456789")
+        resp = spreadsheet.values_batch_get([f"'{sheet_name}'!1:1", f"'{sheet_name}'!A{n}:{last_col}"])
+        head_vr, tail_vr = (resp.get("valueRanges") or [{}, {}])[:2]
+        head = (head_vr.get("values") or [[]])[0]
+        tail = tail_vr.get("values") or []
+        if _trim_row(head) != _trim_row(tab["header_raw"]):
+            return None
+        # Hàng đầu của phần đuôi là hàng cuối đã biết (hoặc header nếu tab chưa có dữ liệu)
+        anchor = _normalize_rows(tail[:1], ncol)
+        expected = [tab["last"]] if tab["last"] is not None else _normalize_rows([tab["header_raw"]], ncol)
+        if anchor != expected:
+            return None
+        new_rows = _normalize_rows(tail[1:], ncol)
+        if not new_rows:
+            return tab["df"]
+        header = [str(h).strip() for h in tab["header_raw"]]
+        df = pd.concat([tab["df"], _rows_to_df(new_rows, header)], ignore_index=True)
+        with self._cache_lock:
+            tab.update(n_rows=n + len(new_rows), last=new_rows[-1], df=df)
+        return df
+
+
+def _normalize_rows(rows: List[list], ncol: int) -> List[List[str]]:
+    """Pad/truncate mỗi hàng về đúng `ncol` ô chuỗi (API bỏ các ô trống cuối hàng)."""
+    return [[("" if x is None else str(x)) for x in r[:ncol]] + [""] * (ncol - len(r)) for r in rows]
+
+
+def _trim_row(row: list) -> List[str]:
+    # get_all_values pad hàng tới độ rộng lưới, values.batchGet thì bỏ ô trống cuối -> so sánh sau khi bỏ
+    out = ["" if x is None else str(x) for x in row]
+    while out and out[-1] == "":
+        out.pop()
+    return out
+
+
+def _rows_to_df(rows: List[List[str]], header: List[str]) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=header, dtype=object)
+    if df.empty:
+        return df.reset_index(drop=True)
+    # Bỏ các hàng trống hoàn toàn (vectorized theo cột)
+    blank = np.ones(len(df), dtype=bool)
+    for i in range(df.shape[1]):
+        blank &= df.iloc[:, i].str.strip().eq("").to_numpy()
+    return df[~blank].reset_index(drop=True)
+
+
+# Chuỗi số kiểu en-US ("42", "-1.5", "1,234.5", "3e-4") -> số, như USER_ENTERED của append_rows cũ
+_NUMBER_RE = re.compile(r"^[+-]?(?:(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?$")
+
+
+def _string_cell(v: str) -> Dict[str, Any]:
+    """
+    Chuỗi -> ô giống cách USER_ENTERED phân tích: công thức ("=..."), số, TRUE/FALSE; "'" đầu giữ nguyên
+    dạng text. Ngày tháng không được đổi thành serial date (timestamp ISO ...Z của app vẫn là text).
+    """
+    if v.startswith("'"):
+        return {"userEnteredValue": {"stringValue": v[1:]}}
+    if v.startswith("=") and len(v) > 1:
+        return {"userEnteredValue": {"formulaValue": v}}
+    t = v.strip()
+    if t.upper() in ("TRUE", "FALSE"):
+        return {"userEnteredValue": {"boolValue": t.upper() == "TRUE"}}
+    if _NUMBER_RE.match(t):
+        return {"userEnteredValue": {"numberValue": float(t.replace(",", ""))}}
+    return {"userEnteredValue": {"stringValue": v}}
+
+
+def _cell(v: Any) -> Dict[str, Any]:
+    """Giá trị Python -> CellData.userEnteredValue (ô trống cho None/NaN/'')."""
+    if v is None or v is pd.NA or v is pd.NaT or (isinstance(v, float) and math.isnan(v)) or (isinstance(v, str) and v == ""):
+        return {}
+    if isinstance(v, datetime):
+        return {"userEnteredValue": {"stringValue": v.strftime("%Y-%m-%dT%H:%M:%S.%fZ")}}
+    if isinstance(v, bool):
+        return {"userEnteredValue": {"boolValue": v}}
+    if isinstance(v, (int, float)):
+        return {"userEnteredValue": {"numberValue": v}}
+    if hasattr(v, "item") and not isinstance(v, str):  # numpy scalar
+        return _cell(v.item())
+    return _string_cell(str(v))
+
 
 @st.cache_resource
-def get_gsheet_manager(_version: int = 2):
+def get_gsheet_manager(_version: int = 4):
     return GoogleSheetManager()
\ No newline at end of file
@@ -0,0 +1,224 @@
+# src/services/log_sink.py
+"""
+Ghi log kiểu write-behind cho luồng chat: handle_submission chỉ enqueue record rồi trả lời ngay,
+một thread nền gom nhiều lượt thành một append_many của storage (với Sheets: một batchUpdate).
+
+- Mỗi entry ({sheet_name: [row dict]}) được ghi vào file spill (SQLite) trước khi vào hàng đợi
+  trong bộ nhớ -> process chết / Sheets lỗi không mất log; lần khởi động sau nạp lại phần chưa ghi.
+- Backpressure: tối đa `max_pending` entry chờ ghi; vượt thì enqueue() đợi tối đa `block_sec`
+  rồi trả False (nơi gọi tự báo lỗi) thay vì để hàng đợi phình vô hạn khi Sheets sập lâu.
+- Ghi lỗi thì giữ nguyên entry, thử lại với backoff (tối đa `max_backoff_sec`).
+- close() (đăng ký atexit) flush phần còn lại trước khi tắt.
+
+Cấu hình (tuỳ chọn) trong .streamlit/secrets.toml:
+    [log_sink]
+    path = ".cache/log_sink.sqlite"
+    max_pending = 1000
+    flush_interval_sec = 2.0   # gom các lượt đến trong khoảng này vào cùng một lần ghi
+"""
+
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import streamlit as st
+
+from src.services.storage import get_storage, to_row
+
+log = logging.getLogger("promptoptima.log_sink")
+
+DEFAULT_SINK_PATH = os.path.join(".cache", "log_sink.sqlite")
+
+
+def _json_default(v: Any) -> str:
+    # Cùng định dạng thời gian mà GoogleSheetManager ghi cho cột datetime
+    if isinstance(v, datetime):
+        return v.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    return str(v)
+
+
+class SheetLogSink:
+    def __init__(
+        self,
+        writer: Any,
+        path: str = DEFAULT_SINK_PATH,
+        *,
+        max_pending: int = 1000,
+        flush_interval_sec: float = 2.0,
+        max_batch: int = 200,
+        max_backoff_sec: float = 60.0,
+        start: bool = True,
+    ):
+        self.writer = writer
+        self.path = path
+        self.max_pending = max(1, int(max_pending))
+        self.flush_interval_sec = float(flush_interval_sec)
+        self.max_batch = max(1, int(max_batch))
+        self.max_backoff_sec = float(max_backoff_sec)
+        self.stats = {"enqueued": 0, "flushed": 0, "writes": 0, "failures": 0, "rejected": 0}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, created_at REAL NOT NULL)")
+        self._conn.commit()
+
+        self._cond = threading.Condition()
+        self._queue: Deque[Tuple[int, Dict[str, List[Dict[str, Any]]]]] = deque(
+            (eid, json.loads(payload)) for eid, payload in self._conn.execute("SELECT id, payload FROM entries ORDER BY id")
+        )
+        if self._queue:
+            log.info("Recovered %d unflushed log entries from %s", len(self._queue), path)
+        self._in_flight = 0
+        self._closing = False
+        self._thread: Optional[threading.Thread] = None
+        if start:
+            self.start()
+
+    # ---- producer ----
+    def enqueue(self, batches: Dict[str, list], block_sec: float = 5.0) -> bool:
+        """Nhận {sheet_name: [record]}; trả False nếu hàng đợi đầy quá `block_sec` hoặc sink đã đóng."""
+        rows = {name: [to_row(r) for r in records if r is not None] for name, records in batches.items()}
+        rows = {name: items for name, items in rows.items() if items}
+        if not rows:
+            return True
+        payload = json.dumps(rows, ensure_ascii=False, default=_json_default)
+        deadline = time.monotonic() + block_sec
+        with self._cond:
+            while not self._closing and len(self._queue) + self._in_flight >= self.max_pending:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    self.stats["rejected"] += 1
+                    return False
+                self._cond.wait(left)
+            if self._closing:
+                self.stats["rejected"] += 1
+                return False
+            with self._db_lock:
+                cur = self._conn.execute("INSERT INTO entries (payload, created_at) VALUES (?, ?)", (payload, time.time()))
+                self._conn.commit()
+            self._queue.append((cur.lastrowid, json.loads(payload)))
+            self.stats["enqueued"] += 1
+            self._cond.notify_all()
+        return True
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._queue) + self._in_flight
+
+    # ---- flusher ----
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sheet-log-sink", daemon=True)
+            self._thread.start()
+
+    def _take(self) -> List[Tuple[int, Dict[str, List[Dict[str, Any]]]]]:
+        with self._cond:
+            while not self._queue and not self._closing:
+                self._cond.wait()
+            # Chờ thêm một chút để gom các lượt đến gần nhau vào cùng một lần ghi
+            deadline = time.monotonic() + self.flush_interval_sec
+            while not self._closing and len(self._queue) < self.max_batch:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+            n = min(len(self._queue), self.max_batch)
+            entries = [self._queue.popleft() for _ in range(n)]
+            self._in_flight = n
+            return entries
+
+    def _write(self, entries: List[Tuple[int, Dict[str, List[Dict[str, Any]]]]]) -> bool:
+        merged: Dict[str, List[Dict[str, Any]]] = {}
+        for _, rows in entries:
+            for name, items in rows.items():
+                merged.setdefault(name, []).extend(items)
+        try:
+            ok = self.writer.append_many(merged) is not False
+        except Exception as e:
+            log.warning("Sheets write failed: %s", e)
+            ok = False
+        self.stats["writes"] += 1
+        if ok:
+            with self._db_lock:
+                self._conn.executemany("DELETE FROM entries WHERE id = ?", [(eid,) for eid, _ in entries])
+                self._conn.commit()
+            self.stats["flushed"] += len(entries)
+        else:
+            self.stats["failures"] += 1
+        return ok
+
+    def _run(self) -> None:
+        failures = 0
+        while True:
+            entries = self._take()
+            if not entries:
+                return  # closing và hàng đợi đã trống
+            ok = self._write(entries)
+            with self._cond:
+                self._in_flight = 0
+                if not ok:
+                    # Trả lại đầu hàng đợi (giữ thứ tự), thử lại sau
+                    self._queue.extendleft(reversed(entries))
+                self._cond.notify_all()
+                if ok:
+                    failures = 0
+                    continue
+                failures += 1
+                if self._closing:
+                    return  # đang tắt: phần còn lại nằm trong file spill, lần sau ghi tiếp
+                self._cond.wait(min(self.max_backoff_sec, 2.0 ** failures))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Chờ hàng đợi trống (True) hoặc hết `timeout`."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._queue or self._in_flight:
+                left = None if deadline is None else deadline - time.monotonic()
+                if left is not None and left <= 0:
+                    return False
+                self._cond.wait(left if left is not None else 0.5)
+            return True
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Flush phần còn lại (tối đa `timeout` giây) rồi dừng thread; phần chưa ghi vẫn còn trong file spill."""
+        with self._cond:
+            if self._closing:
+                return
+            self._closing = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                return  # writer còn treo: để thread tự kết thúc, không đóng kết nối dưới chân nó
+        with self._db_lock:
+            self._conn.close()
+
+
+def _sink_settings() -> Dict[str, Any]:
+    try:
+        cfg = dict(st.secrets.get("log_sink", {}))
+    except Exception:
+        cfg = {}
+    return {
+        "path": cfg.get("path") or os.environ.get("PROMPTOPTIMA_LOG_SINK_PATH") or DEFAULT_SINK_PATH,
+        "max_pending": int(cfg.get("max_pending", 1000)),
+        "flush_interval_sec": float(cfg.get("flush_interval_sec", 2.0)),
+    }
+
+
+@st.cache_resource
+def get_log_sink() -> SheetLogSink:
+    sink = SheetLogSink(get_storage(), **_sink_settings())
+    atexit.register(sink.close)
+    return sink
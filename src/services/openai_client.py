@@ -1,22 +1,23 @@
 import os, time, json, random
-from typing import Dict, Any, Optional, Tuple
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Optional, Tuple
 from string import Template
 import re 
 
 import uuid
 import streamlit as st
-import httpx
-from openai import OpenAI
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from src.prompts.templates import compiled
+from src.services.openai_pool import get_async_openai_client, get_openai_api_key, get_openai_client
+from src.services.rate_limiter import estimate_request_tokens, get_rate_limiter
+from src.services.response_cache import CacheMissError, get_response_cache
+from src.utils.lazy_import import lazy_import
 
 # ---------- helpers ----------
 def _get_openai_api_key() -> Optional[str]:
-    try:
-        key = st.secrets.get("openai", {}).get("api_key")
-    except Exception:
-        key = os.environ.get("OPENAI_API_KEY")
-    if key and "YOUR_OPENAI_API_KEY" not in str(key):
-        return str(key).strip()
-    return None
+    return get_openai_api_key()
 
 def _strip_code_fences(text: str) -> str:
     t = text.strip()
@@ -25,11 +26,23 @@ def _strip_code_fences(text: str) -> str:
     if t.endswith("```"): t = t[:-3]
     return t.strip()
 
+def _completion(data):
+    # openai.types chỉ nạp khi thật sự có response (import SDK tốn ~0.6s lúc khởi động app)
+    return lazy_import("openai.types.chat").ChatCompletion.model_validate(data)
+
 def _client(timeout=45.0):
-    api_key = _get_openai_api_key()
-    if not api_key: return None, None
-    http_client = httpx.Client(timeout=timeout, trust_env=False)
-    return OpenAI(api_key=api_key, http_client=http_client), http_client
+    # Client + connection pool dùng chung toàn process; chỉ đổi timeout theo từng loại call.
+    # Retry/backoff do src/services/rate_limiter lo (dùng chung quota) -> tắt retry nội bộ của SDK.
+    pooled = get_openai_client()
+    if not pooled: return None, None
+    client, http_client = pooled
+    return client.with_options(timeout=timeout, max_retries=0), http_client
+
+def _aclient(timeout=45.0):
+    pooled = get_async_openai_client()
+    if not pooled: return None, None
+    client, http_client = pooled
+    return client.with_options(timeout=timeout, max_retries=0), http_client
 
 # ====================================================================================
 # === FIX: Hàm helper mới để đảm bảo AI trả về đủ các trường, không tin tưởng AI nữa ===
@@ -198,98 +211,309 @@ def _mock_solver() -> Dict[str, Any]:
         "latency_ms": 900, "error": None
     }
 
-# ---------- public API ----------
-def get_analysis_from_analyzer(user_prompt: str, problem_text: str = "", model="gpt-3.5-turbo") -> Dict[str, Any]:
-    client, _ = _client()
-    if not client:
-        return _mock_analyzer()
+# ---------- cached create (content-addressed, xem src/services/response_cache.py) ----------
+def _use_mock(client) -> bool:
+    # Ở chế độ replay, cache đủ để chạy mà không cần API key
+    return not client and get_response_cache().mode != "replay"
+
+def _usage_tokens(resp) -> Optional[int]:
+    return getattr(getattr(resp, "usage", None), "total_tokens", None)
+
+class InvalidResponseError(ValueError):
+    """`validate(resp)` thất bại; giữ lại response để nơi gọi vẫn có thể dùng đường fallback."""
+
+    def __init__(self, response: Any, cause: Exception):
+        super().__init__(f"Invalid response: {cause}")
+        self.response = response
+
+def _validated(resp, validate: Optional[Callable[[Any], Any]]) -> None:
+    if validate is None:
+        return
+    try:
+        validate(resp)
+    except Exception as e:
+        raise InvalidResponseError(resp, e) from e
+
+def _attempt_timer(create: Callable[[], Any]) -> Tuple[Callable[[], Any], List[float]]:
+    """
+    Bọc create(): ghi thời điểm bắt đầu của lần thử gần nhất (= lần thành công), để latency không tính
+    thời gian chờ rate limiter / backoff giữa các lần retry.
+    """
+    started = [time.time()]
+    def attempt():
+        started[0] = time.time()
+        return create()
+    return attempt, started
 
-    sys_msg = (
-        "You are a strict JSON generator. "
-        "Always return exactly one JSON object matching the requested schema. "
-        "No markdown, no explanations."
+def _create(client, kind: str, req: Dict[str, Any], validate: Optional[Callable[[Any], Any]] = None) -> Tuple[Any, int, bool]:
+    """
+    chat.completions.create có cache + rate limit/retry -> (response, latency_ms, cached).
+    `validate(resp)` ném lỗi -> không ghi cache (vd JSON hỏng của analyzer, để lần retry gọi lại API)
+    và ném InvalidResponseError (kèm response).
+    """
+    cache = get_response_cache()
+    hit = cache.get(kind, req)
+    if hit:
+        data, latency_ms = hit
+        return _completion(data), latency_ms, True
+    if client is None:
+        raise CacheMissError(f"No cached {kind} response and no OpenAI client configured")
+    attempt, started = _attempt_timer(lambda: client.chat.completions.create(**req))
+    resp = get_rate_limiter().call(
+        attempt, est_tokens=estimate_request_tokens(req), usage_tokens=_usage_tokens,
     )
+    latency_ms = int((time.time() - started[0]) * 1000)
+    _validated(resp, validate)
+    cache.put(kind, req, resp.model_dump(mode="json"), latency_ms)
+    return resp, latency_ms, False
+
+async def _acreate(client, kind: str, req: Dict[str, Any], validate: Optional[Callable[[Any], Any]] = None) -> Tuple[Any, int, bool]:
+    cache = get_response_cache()
+    hit = cache.get(kind, req)
+    if hit:
+        data, latency_ms = hit
+        return _completion(data), latency_ms, True
+    if client is None:
+        raise CacheMissError(f"No cached {kind} response and no OpenAI client configured")
+    attempt, started = _attempt_timer(lambda: client.chat.completions.create(**req))
+    resp = await get_rate_limiter().acall(
+        attempt, est_tokens=estimate_request_tokens(req), usage_tokens=_usage_tokens,
+    )
+    latency_ms = int((time.time() - started[0]) * 1000)
+    _validated(resp, validate)
+    cache.put(kind, req, resp.model_dump(mode="json"), latency_ms)
+    return resp, latency_ms, False
+
+def _analysis_json(resp) -> Dict[str, Any]:
+    return json.loads(resp.choices[0].message.content or "{}")
+
+# ---------- request builders (dùng chung cho bản sync & async) ----------
+ANALYZER_SYS_MSG = (
+    "You are a strict JSON generator. "
+    "Always return exactly one JSON object matching the requested schema. "
+    "No markdown, no explanations."
+)
+
+def _analyzer_request(user_prompt: str, problem_text: str, model: str) -> Dict[str, Any]:
     prompt = ANALYZER_PROMPT_TEMPLATE.safe_substitute(
         user_prompt=user_prompt, problem_text=problem_text or ""
     )
-    
-    # Retry logic remains the same
+    return dict(
+        model=model,
+        messages=[{"role": "system", "content": ANALYZER_SYS_MSG}, {"role": "user", "content": prompt}],
+        response_format={"type": "json_object"},
+        temperature=0.0, max_tokens=1024, # Increased slightly for safety
+    )
+
+def _fallback_analysis_json(resp) -> Dict[str, Any]:
+    content = resp.choices[0].message.content or "{}"
     try:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "system", "content": sys_msg}, {"role": "user", "content": prompt}],
-            response_format={"type": "json_object"},
-            temperature=0.0, max_tokens=1024, # Increased slightly for safety
-        )
-        content = resp.choices[0].message.content or "{}"
-        out = json.loads(content)
+        return json.loads(content)
     except Exception:
-        # Fallback call
-        resp2 = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "system", "content": sys_msg}, {"role": "user", "content": prompt}],
-            response_format={"type": "json_object"},
-            temperature=0.0, max_tokens=1024,
-        )
-        content2 = resp2.choices[0].message.content or "{}"
-        try:
-            out = json.loads(content2)
-        except Exception:
-            # If all else fails, create a minimal empty structure
-            out = {"prompt_analysis": {}}
-
-    # =================================================================
-    # === FIX: Luôn chạy hàm dọn dẹp để đảm bảo đủ key trước khi trả về ===
-    # =================================================================
+        # If all else fails, create a minimal empty structure
+        return {"prompt_analysis": {}}
+
+def _finalize_analysis(out: Dict[str, Any]) -> Dict[str, Any]:
+    # Luôn chạy hàm dọn dẹp để đảm bảo đủ key trước khi trả về
     final_out = _ensure_schema_compliance(out)
     final_out["error"] = None
     return final_out
 
-def get_solution_from_solver(user_prompt: str, problem_text: str, model="gpt-3.5-turbo") -> Dict[str, Any]:
-    client, _ = _client(60.0)
-    if not client: return _mock_solver()
+def _solver_request(user_prompt: str, problem_text: str, model: str) -> Dict[str, Any]:
     prompt = SOLVER_PROMPT_TEMPLATE.safe_substitute(user_prompt=user_prompt, problem_text=problem_text)
-    t0 = time.time()
-    resp = client.chat.completions.create(
+    return dict(
         model=model, messages=[{"role": "user", "content": prompt}],
         temperature=0.5, max_tokens=1200,
     )
-    t1 = time.time()
+
+def _solver_result(resp, latency_ms: int, cached: bool = False) -> Dict[str, Any]:
     usage = getattr(resp, "usage", None)
     usage_dict = None if not usage else {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
     return {
         "solution_text": resp.choices[0].message.content,
-        "usage": usage_dict, "latency_ms": int((t1 - t0) * 1000), "error": None
+        "usage": usage_dict, "latency_ms": latency_ms, "error": None, "cached": cached,
     }
 
-# (The paraphrase function synthesize_prompt_from_suggestion remains unchanged)
-# src/services/openai_client.py
+# ---------- public API ----------
+def get_analysis_from_analyzer(user_prompt: str, problem_text: str = "", model="gpt-3.5-turbo") -> Dict[str, Any]:
+    client, _ = _client()
+    if _use_mock(client):
+        return _mock_analyzer()
 
-def synthesize_prompt_from_suggestion(
-    problem_text: str,
-    suggestion: Dict[str, Any],
-    cognitive_level: int,
-    ai_persona: str,  # <<< ĐÂY LÀ THAM SỐ BẮT BUỘC
-    *,
-    model: str = "gpt-3.5-turbo",
-    strict_fill: bool = False,
-) -> Tuple[str, str]: # <<< NÓ TRẢ VỀ MỘT TUPLE (chuỗi, chuỗi)
-    tpl = suggestion.get("template", "{problem_text}")
+    req = _analyzer_request(user_prompt, problem_text, model)
+    # Retry logic remains the same
+    try:
+        resp, _, _ = _create(client, "analyzer", req, validate=_analysis_json)
+        out = _analysis_json(resp)
+    except CacheMissError:
+        raise
+    except Exception:
+        # Fallback call: reply vẫn không phải JSON -> _fallback_analysis_json (không ghi cache)
+        try:
+            resp2, _, _ = _create(client, "analyzer", req, validate=_analysis_json)
+        except InvalidResponseError as e:
+            resp2 = e.response
+        out = _fallback_analysis_json(resp2)
+    return _finalize_analysis(out)
 
-    client, _ = _client()
-    if not client or strict_fill:
-        filled_tpl = tpl.replace("{problem_text}", problem_text)
-        if "{student_answer}" in filled_tpl:
-            plausible_wrong_answer = "The student calculated the area as 96 square meters."
-            filled_tpl = filled_tpl.replace("{student_answer}", plausible_wrong_answer)
-        if "{hypothesis}" in filled_tpl:
-            plausible_hypothesis = "The final number of items is directly proportional to the perimeter."
-            filled_tpl = filled_tpl.replace("{hypothesis}", plausible_hypothesis)
-        return filled_tpl, ai_persona # Trả về cả persona được cung cấp
+def get_solution_from_solver(user_prompt: str, problem_text: str, model="gpt-3.5-turbo") -> Dict[str, Any]:
+    client, _ = _client(60.0)
+    if _use_mock(client): return _mock_solver()
+    req = _solver_request(user_prompt, problem_text, model)
+    resp, latency_ms, cached = _create(client, "solver", req)
+    return _solver_result(resp, latency_ms, cached)
 
-    # KHÔNG CHỌN NGẪU NHIÊN NỮA, DÙNG TRỰC TIẾP THAM SỐ ĐƯỢC CUNG CẤP
-    persona = ai_persona
+class SolverStream:
+    """
+    Lời giải của solver dạng stream: duyệt object để nhận từng đoạn text (vd st.write_stream(stream)).
+    Duyệt xong, `.result` có cùng khoá như get_solution_from_solver, thêm:
+      ttft_ms        — thời gian tới token đầu tiên
+      tokens_per_sec — completion_tokens / (latency_ms - ttft_ms)
+    Cache hit / mock: trả nguyên văn một lần, ttft_ms & tokens_per_sec = None.
+    """
+
+    def __init__(self, user_prompt: str, problem_text: str, model: str = "gpt-3.5-turbo"):
+        self.req = _solver_request(user_prompt, problem_text, model)
+        self.result: Optional[Dict[str, Any]] = None
+
+    def __iter__(self):
+        client, _ = _client(60.0)
+        if _use_mock(client):
+            self.result = {**_mock_solver(), "ttft_ms": None, "tokens_per_sec": None}
+            yield self.result["solution_text"]
+            return
+        hit = get_response_cache().get("solver", self.req)
+        if hit:
+            data, latency_ms = hit
+            self.result = {**_solver_result(_completion(data), latency_ms, True), "ttft_ms": None, "tokens_per_sec": None}
+            yield self.result["solution_text"] or ""
+            return
+        if client is None:
+            raise CacheMissError("No cached solver response and no OpenAI client configured")
+
+        req, limiter = self.req, get_rate_limiter()
+        est = estimate_request_tokens(req)
+        # Retry/rate limit áp dụng cho việc mở stream; usage thật được settle khi stream kết thúc.
+        # Đồng hồ bắt đầu ở lần thử thành công -> TTFT không tính thời gian chờ limiter/backoff.
+        attempt, started = _attempt_timer(
+            lambda: client.chat.completions.create(**req, stream=True, stream_options={"include_usage": True})
+        )
+        stream = limiter.call(attempt, est_tokens=est)
+        t0 = started[0]
+        parts, ttft, usage, finish, meta = [], None, None, None, {}
+        for chunk in stream:
+            meta = meta or {"id": chunk.id, "created": chunk.created, "model": chunk.model}
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            finish = choice.finish_reason or finish
+            if choice.delta and choice.delta.content:
+                if ttft is None:
+                    ttft = time.time() - t0
+                parts.append(choice.delta.content)
+                yield choice.delta.content
+        elapsed = time.time() - t0
+        limiter.settle(est, getattr(usage, "total_tokens", None))
+
+        completion = {
+            "id": meta.get("id") or f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion",
+            "created": meta.get("created") or int(t0), "model": meta.get("model") or req["model"],
+            "choices": [{"index": 0, "finish_reason": finish or "stop", "message": {"role": "assistant", "content": "".join(parts)}}],
+            "usage": usage.model_dump() if usage is not None else None,
+        }
+        resp = _completion(completion)
+        latency_ms = int(elapsed * 1000)
+        get_response_cache().put("solver", req, completion, latency_ms)
+        out_tokens = usage.completion_tokens if usage is not None else len(parts)
+        gen_sec = elapsed - (ttft or 0.0)
+        self.result = {
+            **_solver_result(resp, latency_ms),
+            "ttft_ms": None if ttft is None else int(ttft * 1000),
+            "tokens_per_sec": round(out_tokens / gen_sec, 2) if gen_sec > 0 and out_tokens else None,
+        }
+
+def stream_solution_from_solver(user_prompt: str, problem_text: str, model="gpt-3.5-turbo") -> SolverStream:
+    return SolverStream(user_prompt, problem_text, model=model)
+
+# ---------- async API (AsyncOpenAI, pool riêng cho mỗi event loop) ----------
+async def aget_analysis_from_analyzer(user_prompt: str, problem_text: str = "", model="gpt-3.5-turbo") -> Dict[str, Any]:
+    client, _ = _aclient()
+    if _use_mock(client):
+        return _mock_analyzer()
+    req = _analyzer_request(user_prompt, problem_text, model)
+    try:
+        resp, _, _ = await _acreate(client, "analyzer", req, validate=_analysis_json)
+        out = _analysis_json(resp)
+    except CacheMissError:
+        raise
+    except Exception:
+        try:
+            resp2, _, _ = await _acreate(client, "analyzer", req, validate=_analysis_json)
+        except InvalidResponseError as e:
+            resp2 = e.response
+        out = _fallback_analysis_json(resp2)
+    return _finalize_analysis(out)
+
+async def aget_solution_from_solver(user_prompt: str, problem_text: str, model="gpt-3.5-turbo") -> Dict[str, Any]:
+    client, _ = _aclient(60.0)
+    if _use_mock(client): return _mock_solver()
+    req = _solver_request(user_prompt, problem_text, model)
+    resp, latency_ms, cached = await _acreate(client, "solver", req)
+    return _solver_result(resp, latency_ms, cached)
+
+async def aanalyze_and_solve(
+    user_prompt: str, problem_text: str = "", *,
+    analyzer_model: str = "gpt-3.5-turbo", solver_model: str = "gpt-3.5-turbo",
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Bản asyncio của analyze_and_solve: hai call chạy song song trên cùng event loop."""
+    analysis, solution = await asyncio.gather(
+        aget_analysis_from_analyzer(user_prompt, problem_text, model=analyzer_model),
+        aget_solution_from_solver(user_prompt, problem_text, model=solver_model),
+    )
+    return analysis, solution
+
+# ---------- analyzer + solver song song ----------
+# Pool dùng chung cho các call mạng độc lập (analyzer/solver của cùng một prompt).
+_CALL_POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix="openai-call")
+
+def _submit_call(fn: Callable, /, *args, **kwargs) -> Future:
+    ctx = get_script_run_ctx()
+    def _call():
+        # Giữ ScriptRunContext để st.* (vd cảnh báo mock) vẫn hiển thị từ worker thread
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
+    return _CALL_POOL.submit(_call)
+
+def submit_analysis(user_prompt: str, problem_text: str = "", model: str = "gpt-3.5-turbo") -> Future:
+    """Chạy analyzer trên pool nền (vd trong lúc solver stream ra UI ở luồng script)."""
+    return _submit_call(get_analysis_from_analyzer, user_prompt=user_prompt, problem_text=problem_text, model=model)
+
+def analyze_and_solve(
+    user_prompt: str, problem_text: str = "", *,
+    analyzer_model: str = "gpt-3.5-turbo", solver_model: str = "gpt-3.5-turbo",
+    overlap: Optional[Callable[[], Any]] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any], Any]:
+    """
+    Gọi analyzer và solver đồng thời (solver không dùng kết quả analyzer) rồi join.
+    `overlap` (nếu có) chạy trên luồng hiện tại trong lúc chờ mạng, vd BasicMetrics.compute.
+    Trả về (analysis, solution, kết quả overlap). Lỗi của từng call được ném lại như gọi tuần tự.
+    """
+    fut_analysis = _submit_call(get_analysis_from_analyzer, user_prompt=user_prompt, problem_text=problem_text, model=analyzer_model)
+    fut_solution = _submit_call(get_solution_from_solver, user_prompt=user_prompt, problem_text=problem_text, model=solver_model)
+    overlap_result = overlap() if overlap else None
+    return fut_analysis.result(), fut_solution.result(), overlap_result
+
+# (The paraphrase function synthesize_prompt_from_suggestion remains unchanged)
+# src/services/openai_client.py
 
+def _strict_fill(tpl: str, problem_text: str) -> str:
+    # Template đã biên dịch sẵn (src/prompts/templates.py); giá trị mẫu ở STRICT_FILL_VALUES
+    return compiled(tpl).strict_fill(problem_text)
+
+def _paraphrase_request(problem_text: str, tpl: str, cognitive_level: int, persona: str, model: str, n: int = 1) -> Dict[str, Any]:
     # (Code hướng dẫn level và prompt cho AI giữ nguyên)
     level_guidance = ""
     if cognitive_level == 1: level_guidance = "Use direct, simple language. Focus on 'how-to' and concrete steps. Keywords: calculate, find, list, show the steps."
@@ -320,10 +544,75 @@ You must rewrite the following prompt TEMPLATE.
 5.  **OUTPUT**: Return ONLY the final, rewritten prompt. No commentary or markdown.
 """.strip()
 
-    resp = client.chat.completions.create(model=model, messages=[{"role": "system", "content": sys}, {"role": "user", "content": user}], temperature=0.7, max_tokens=600)
-    out = (resp.choices[0].message.content or "").strip()
-    
+    req = dict(model=model, messages=[{"role": "system", "content": sys}, {"role": "user", "content": user}], temperature=0.7, max_tokens=600)
+    if n > 1:
+        req["n"] = int(n)  # nhiều biến thể trong một request (prompt chỉ tính một lần)
+    return req
+
+def _clean_paraphrase(content: Optional[str]) -> str:
+    out = (content or "").strip()
     if out.startswith("`") and out.endswith("`"): out = out.strip("`")
     if out.startswith('"') and out.endswith('"'): out = out.strip('"')
+    return out
+
+def synthesize_prompt_from_suggestion(
+    problem_text: str,
+    suggestion: Dict[str, Any],
+    cognitive_level: int,
+    ai_persona: str,  # <<< ĐÂY LÀ THAM SỐ BẮT BUỘC
+    *,
+    model: str = "gpt-3.5-turbo",
+    strict_fill: bool = False,
+) -> Tuple[str, str]: # <<< NÓ TRẢ VỀ MỘT TUPLE (chuỗi, chuỗi)
+    tpl = suggestion.get("template", "{problem_text}")
+
+    client, _ = _client()
+    if _use_mock(client) or strict_fill:
+        return _strict_fill(tpl, problem_text), ai_persona # Trả về cả persona được cung cấp
+
+    # KHÔNG CHỌN NGẪU NHIÊN NỮA, DÙNG TRỰC TIẾP THAM SỐ ĐƯỢC CUNG CẤP
+    persona = ai_persona
+    req = _paraphrase_request(problem_text, tpl, cognitive_level, persona, model)
+    resp, _, _ = _create(client, "paraphrase", req)
+    return _clean_paraphrase(resp.choices[0].message.content), persona
+
+def synthesize_prompt_variants(
+    problem_text: str,
+    suggestion: Dict[str, Any],
+    cognitive_level: int,
+    ai_persona: str,
+    *,
+    model: str = "gpt-3.5-turbo",
+    n: int = 1,
+) -> List[str]:
+    """n paraphrase của cùng template/persona trong một request; [] nếu không có OpenAI client (mock)."""
+    client, _ = _client()
+    if _use_mock(client):
+        return []
+    req = _paraphrase_request(problem_text, suggestion.get("template", "{problem_text}"), cognitive_level, ai_persona, model, n=n)
+    resp, _, _ = _create(client, "paraphrase", req)
+    return [_clean_paraphrase(c.message.content) for c in resp.choices]
+
+# ---------- offline batch (src/services/batch_jobs.py): request bodies & parse kết quả ----------
+def analyzer_batch_request(user_prompt: str, problem_text: str = "", model: str = "gpt-3.5-turbo") -> Dict[str, Any]:
+    return _analyzer_request(user_prompt, problem_text, model)
+
+def solver_batch_request(user_prompt: str, problem_text: str, model: str = "gpt-3.5-turbo") -> Dict[str, Any]:
+    return _solver_request(user_prompt, problem_text, model)
+
+def paraphrase_batch_request(problem_text: str, suggestion: Dict[str, Any], cognitive_level: int, ai_persona: str, *, model: str = "gpt-3.5-turbo", n: int = 1) -> Dict[str, Any]:
+    return _paraphrase_request(problem_text, suggestion.get("template", "{problem_text}"), cognitive_level, ai_persona, model, n=n)
+
+def analysis_from_completion(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Body ChatCompletion (JSON) của analyzer -> cùng dict như get_analysis_from_analyzer."""
+    return _finalize_analysis(_fallback_analysis_json(_completion(body)))
+
+def solution_from_completion(body: Dict[str, Any]) -> Dict[str, Any]:
+    # Batch API không đo latency từng request -> latency_ms = 0
+    return _solver_result(_completion(body), 0)
+
+def paraphrase_from_completion(body: Dict[str, Any]) -> str:
+    return _clean_paraphrase(_completion(body).choices[0].message.content)
 
-    return out, persona
\ No newline at end of file
+def paraphrases_from_completion(body: Dict[str, Any]) -> List[str]:
+    return [_clean_paraphrase(c.message.content) for c in _completion(body).choices]
@@ -0,0 +1,156 @@
+# src/services/openai_pool.py
+"""
+Client OpenAI dùng chung cho toàn process (sync + async), có connection pool keep-alive.
+
+Trước đây mỗi lần gọi analyzer/solver/paraphraser đều tạo httpx.Client + OpenAI mới và
+không đóng -> mỗi request trả lại chi phí TCP/TLS và rò socket khi chạy batch lớn.
+Module này giữ MỘT httpx.Client (và một httpx.AsyncClient cho mỗi event loop) theo api key;
+module Python không bị nạp lại giữa các lần Streamlit rerun nên pool sống qua các rerun.
+Client async được giữ theo chính object loop (WeakKeyDictionary): loop bị thu hồi thì client cũng bị
+bỏ, không có chuyện loop mới trùng id() nhận pool của loop đã chết. Nên gọi `await aclose_async_clients()`
+trước khi loop kết thúc (vd cuối coroutine truyền cho asyncio.run) để đóng socket ngay.
+
+Cấu hình (tuỳ chọn) trong .streamlit/secrets.toml, mục [openai]:
+    max_connections = 64
+    max_keepalive_connections = 32
+    keepalive_expiry = 30.0
+    http2 = true          # cần gói `h2` (httpx[http2]); thiếu thì tự quay về HTTP/1.1
+"""
+
+import asyncio
+import atexit
+import os
+import threading
+import weakref
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+import streamlit as st
+
+from src.utils.lazy_import import lazy_import
+
+if TYPE_CHECKING:  # openai/httpx chỉ được nạp khi tạo client đầu tiên
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+
+DEFAULT_POOL_SETTINGS: Dict[str, Any] = {
+    "max_connections": 64,
+    "max_keepalive_connections": 32,
+    "keepalive_expiry": 30.0,
+    "http2": True,
+}
+
+_lock = threading.Lock()
+_sync_clients: Dict[str, Tuple["OpenAI", "httpx.Client"]] = {}
+# loop -> {api_key: (AsyncOpenAI, httpx.AsyncClient)}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Tuple[AsyncOpenAI, httpx.AsyncClient]]]" = weakref.WeakKeyDictionary()
+
+
+def get_openai_api_key() -> Optional[str]:
+    try:
+        key = st.secrets.get("openai", {}).get("api_key")
+    except Exception:
+        key = os.environ.get("OPENAI_API_KEY")
+    if key and "YOUR_OPENAI_API_KEY" not in str(key):
+        return str(key).strip()
+    return None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def pool_settings() -> Dict[str, Any]:
+    cfg: Dict[str, Any] = {}
+    try:
+        cfg = dict(st.secrets.get("openai", {}))
+    except Exception:
+        pass
+    out = dict(DEFAULT_POOL_SETTINGS)
+    for k, default in DEFAULT_POOL_SETTINGS.items():
+        if k not in cfg:
+            continue
+        v = cfg[k]
+        if isinstance(default, bool):
+            out[k] = v if isinstance(v, bool) else str(v).strip().lower() in ("1", "true", "yes", "on")
+        else:
+            out[k] = type(default)(v)
+    out["http2"] = out["http2"] and _http2_available()
+    return out
+
+
+def _http_kwargs() -> Dict[str, Any]:
+    s = pool_settings()
+    httpx = lazy_import("httpx")
+    return {
+        "limits": httpx.Limits(
+            max_connections=s["max_connections"],
+            max_keepalive_connections=s["max_keepalive_connections"],
+            keepalive_expiry=s["keepalive_expiry"],
+        ),
+        "http2": s["http2"],
+        "trust_env": False,
+    }
+
+
+def get_openai_client() -> Optional[Tuple["OpenAI", "httpx.Client"]]:
+    """(OpenAI, httpx.Client) dùng chung theo api key; None nếu chưa cấu hình key."""
+    api_key = get_openai_api_key()
+    if not api_key:
+        return None
+    with _lock:
+        pair = _sync_clients.get(api_key)
+        if pair is None:
+            http_client = lazy_import("httpx").Client(**_http_kwargs())
+            pair = _sync_clients[api_key] = (lazy_import("openai").OpenAI(api_key=api_key, http_client=http_client), http_client)
+        return pair
+
+
+def get_async_openai_client() -> Optional[Tuple["AsyncOpenAI", "httpx.AsyncClient"]]:
+    """
+    (AsyncOpenAI, httpx.AsyncClient) dùng chung theo (api key, event loop đang chạy).
+    Pool async gắn với event loop tạo ra nó nên mỗi loop có một client riêng.
+    """
+    api_key = get_openai_api_key()
+    if not api_key:
+        return None
+    loop = asyncio.get_running_loop()
+    with _lock:
+        per_loop = _async_clients.setdefault(loop, {})
+        pair = per_loop.get(api_key)
+        if pair is None:
+            http_client = lazy_import("httpx").AsyncClient(**_http_kwargs())
+            pair = per_loop[api_key] = (lazy_import("openai").AsyncOpenAI(api_key=api_key, http_client=http_client), http_client)
+        return pair
+
+
+async def aclose_async_clients() -> None:
+    """Đóng các client async của event loop đang chạy (pool của loop không dùng được sau khi loop đóng)."""
+    with _lock:
+        per_loop = _async_clients.pop(asyncio.get_running_loop(), {})
+    for _, http_client in per_loop.values():
+        try:
+            await http_client.aclose()
+        except Exception:
+            pass
+
+
+def close_clients() -> None:
+    """
+    Đóng các pool sync. Client async không đóng được từ đây (cần chính loop của nó): chỉ bỏ tham chiếu;
+    dùng aclose_async_clients() bên trong loop để đóng socket.
+    """
+    with _lock:
+        for _, http_client in _sync_clients.values():
+            try:
+                http_client.close()
+            except Exception:
+                pass
+        _sync_clients.clear()
+        _async_clients.clear()
+
+
+atexit.register(close_clients)
@@ -0,0 +1,144 @@
+# src/services/problem_bank.py
+"""
+Ngân hàng bài toán (tab 'problems') cho sidebar "Run AI User (batch)", cache theo TTL.
+
+Trước đây mỗi lần rerun (mỗi phím gõ trong ô chat) sidebar gọi get_df("problems") rồi quét lại
+DataFrame để lấy các lựa chọn CCSS / Level / Context. Giờ tab được đọc một lần cho mỗi TTL; các tập
+lựa chọn và chỉ mục problem_id -> hàng được tính sẵn ngay khi nạp. invalidate() bỏ cache (kèm cache
+tab của GoogleSheetManager) để lần sau đọc lại toàn bộ.
+
+Cấu hình (tuỳ chọn) trong .streamlit/secrets.toml:
+    [problem_bank]
+    ttl_sec = 300        # 0 = luôn đọc lại
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+
+from src.utils.text import clean_problem_text, generate_problem_id
+
+DEFAULT_PROBLEM_BANK_TTL_SEC = 300.0
+
+
+@dataclass(frozen=True)
+class ProblemBank:
+    sheet_name: str
+    df: pd.DataFrame
+    ccss_options: List[str] = field(default_factory=list)
+    level_options: List[str] = field(default_factory=list)
+    context_options: List[str] = field(default_factory=list)
+    by_id: Dict[str, int] = field(default_factory=dict)  # problem_id -> vị trí hàng trong df
+    loaded_at: float = 0.0
+
+    @property
+    def empty(self) -> bool:
+        return self.df is None or self.df.empty
+
+    def problem(self, problem_id: str) -> Optional[pd.Series]:
+        pos = self.by_id.get(problem_id)
+        return None if pos is None else self.df.iloc[pos]
+
+
+def _column(df: pd.DataFrame, *names: str) -> Optional[str]:
+    cols = {str(c).lower().strip(): c for c in df.columns}
+    return next((cols[n] for n in names if n in cols), None)
+
+
+def _distinct(values, fn: Callable[[str], str] = lambda s: s) -> List[str]:
+    return sorted({fn(str(v).strip()) for v in values if str(v).strip()})
+
+
+def build_problem_bank(df: Optional[pd.DataFrame], sheet_name: str = "problems") -> ProblemBank:
+    if df is None or df.empty:
+        return ProblemBank(sheet_name, pd.DataFrame(), loaded_at=time.time())
+    ccss_col = _column(df, "ccss")
+    level_col = _column(df, "level")
+    ctx_col = next((c for c in df.columns if "abstract" in str(c).lower() and "real" in str(c).lower()), None)
+    problem_col = _column(df, "problem")
+    by_id: Dict[str, int] = {}
+    if problem_col is not None:
+        for pos, text in enumerate(df[problem_col]):
+            # Cùng cách sinh id với ai_user_runner; bài trùng nội dung giữ hàng đầu tiên
+            by_id.setdefault(generate_problem_id(clean_problem_text(str(text))), pos)
+    return ProblemBank(
+        sheet_name=sheet_name,
+        df=df,
+        ccss_options=_distinct(df[ccss_col], lambda s: s.split("(")[0].strip()) if ccss_col is not None else [],
+        level_options=_distinct(df[level_col]) if level_col is not None else [],
+        context_options=_distinct(df[ctx_col]) if ctx_col is not None else [],
+        by_id=by_id,
+        loaded_at=time.time(),
+    )
+
+
+class ProblemBankCache:
+    """
+    Cache ProblemBank theo tên tab, hết hạn sau ttl_sec. Lần nạp dùng `reader(sheet_name, refresh)`
+    (vd GoogleSheetManager.get_df); lỗi đọc không được cache.
+    """
+
+    def __init__(self, reader: Callable[[str, bool], Optional[pd.DataFrame]], ttl_sec: float = DEFAULT_PROBLEM_BANK_TTL_SEC):
+        self.reader = reader
+        self.ttl_sec = float(ttl_sec)
+        self._lock = threading.Lock()
+        self._banks: Dict[str, Tuple[float, ProblemBank]] = {}
+        self._stale: set = set()  # tab đã invalidate -> lần nạp sau đọc lại toàn bộ (refresh=True)
+        self.stats = {"hits": 0, "misses": 0, "loads": 0}
+
+    def get(self, sheet_name: str = "problems") -> ProblemBank:
+        with self._lock:
+            entry = self._banks.get(sheet_name)
+            if entry and self.ttl_sec > 0 and time.monotonic() - entry[0] < self.ttl_sec:
+                self.stats["hits"] += 1
+                return entry[1]
+            self.stats["misses"] += 1
+            refresh = sheet_name in self._stale
+            # Nạp trong lock: nhiều session rerun cùng lúc chỉ tạo một lần đọc Sheets
+            bank = build_problem_bank(self.reader(sheet_name, refresh), sheet_name)
+            self.stats["loads"] += 1
+            if not bank.empty:
+                # Chỉ bỏ cờ stale khi đọc được (bank rỗng = đọc lỗi -> lần sau vẫn refresh=True, không dùng cache tab cũ)
+                self._stale.discard(sheet_name)
+                self._banks[sheet_name] = (time.monotonic(), bank)
+            return bank
+
+    def invalidate(self, sheet_name: Optional[str] = None) -> None:
+        with self._lock:
+            names = list(self._banks) if sheet_name is None else [sheet_name]
+            for name in names:
+                self._banks.pop(name, None)
+                self._stale.add(name)
+
+
+def problem_bank_settings() -> Dict[str, Any]:
+    cfg: Dict[str, Any] = {}
+    try:
+        cfg = dict(st.secrets.get("problem_bank", {}))
+    except Exception:
+        pass
+    return {"ttl_sec": float(cfg.get("ttl_sec", os.environ.get("PROMPTOPTIMA_PROBLEM_BANK_TTL", DEFAULT_PROBLEM_BANK_TTL_SEC)))}
+
+
+def _read_problems(sheet_name: str, refresh: bool) -> Optional[pd.DataFrame]:
+    from src.services.google_sheets import get_gsheet_manager
+    manager = get_gsheet_manager()
+    return manager.get_df(sheet_name, refresh=refresh) if manager else None
+
+
+@st.cache_resource
+def get_problem_bank_cache() -> ProblemBankCache:
+    return ProblemBankCache(_read_problems, **problem_bank_settings())
+
+
+def load_problem_bank(sheet_name: str = "problems") -> ProblemBank:
+    return get_problem_bank_cache().get(sheet_name)
+
+
+def invalidate_problem_bank(sheet_name: Optional[str] = None) -> None:
+    get_problem_bank_cache().invalidate(sheet_name)
@@ -0,0 +1,238 @@
+# src/services/rate_limiter.py
+"""
+Rate limiter + retry scheduler dùng chung cho mọi call OpenAI trong openai_client.
+
+- Hai token bucket: requests-per-minute (RPM) và tokens-per-minute (TPM). Mỗi call "đặt chỗ"
+  (reserve) 1 request + số token ước lượng; bucket được phép âm, người đặt sau chờ đúng phần
+  thiếu -> không ngủ khi còn quota, và không vượt quota khi nhiều thread/coroutine cùng gọi.
+- Sau khi có `usage.total_tokens` thật, `settle()` trả lại/thu thêm phần chênh lệch so với ước lượng.
+- 429 / 5xx / lỗi kết nối: retry với exponential backoff + full jitter; nếu server gửi
+  `Retry-After` (hoặc `retry-after-ms`) thì tôn trọng giá trị đó. Một 429 còn đặt "cooldown"
+  chung để các call khác cũng tạm dừng thay vì cùng dội vào quota.
+
+Cấu hình (tuỳ chọn) trong .streamlit/secrets.toml:
+    [rate_limit]
+    rpm = 500            # 0 = không giới hạn
+    tpm = 200000         # 0 = không giới hạn
+    max_retries = 5
+    backoff_base = 0.5   # giây
+    backoff_max = 30.0   # giây
+"""
+
+import asyncio
+import random
+import sys
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import streamlit as st
+
+T = TypeVar("T")
+
+DEFAULT_RATE_LIMIT_SETTINGS: Dict[str, Any] = {
+    "rpm": 500,
+    "tpm": 200000,
+    "max_retries": 5,
+    "backoff_base": 0.5,
+    "backoff_max": 30.0,
+}
+
+
+class TokenBucket:
+    """Bucket nạp đều `per_minute` đơn vị/phút, dung lượng tối đa `capacity` (mặc định = per_minute)."""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = float(per_minute) / 60.0
+        self.capacity = float(capacity if capacity is not None else per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Trừ `amount` (có thể làm bucket âm) và trả về số giây cần chờ trước khi dùng."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        # Một yêu cầu lớn hơn dung lượng vẫn phải đi qua được (chờ tới khi bucket đầy)
+        self.level -= min(float(amount), self.capacity)
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def refund(self, amount: float, now: float) -> None:
+        if self.rate <= 0:
+            return
+        self._refill(now)
+        self.level = min(self.capacity, self.level + float(amount))
+
+
+class RateLimiter:
+    def __init__(self, rpm: float = 0, tpm: float = 0, *, max_retries: int = 5, backoff_base: float = 0.5, backoff_max: float = 30.0):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = int(max_retries)
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self._lock = threading.Lock()
+        self._cooldown_until = 0.0
+        self.stats: Dict[str, float] = {"calls": 0, "retries": 0, "rate_limited": 0, "waited_sec": 0.0}
+
+    # ---- pacing ----
+    def reserve(self, est_tokens: int) -> float:
+        """Đặt chỗ cho một call; trả về số giây phải chờ (0 nếu còn quota)."""
+        now = time.monotonic()
+        with self._lock:
+            wait = max(
+                self.requests.reserve(1, now),
+                self.tokens.reserve(est_tokens, now),
+                self._cooldown_until - now,
+            )
+            self.stats["calls"] += 1
+            if wait > 0:
+                self.stats["waited_sec"] += wait
+        return max(0.0, wait)
+
+    def settle(self, est_tokens: int, actual_tokens: Optional[int]) -> None:
+        """Điều chỉnh bucket TPM theo usage thật (ước lượng dư -> trả lại, thiếu -> trừ thêm)."""
+        if actual_tokens is None:
+            return
+        diff = int(est_tokens) - int(actual_tokens)
+        now = time.monotonic()
+        with self._lock:
+            if diff > 0:
+                self.tokens.refund(diff, now)
+            elif diff < 0:
+                self.tokens.reserve(-diff, now)
+
+    def release(self, est_tokens: int) -> None:
+        """Trả lại phần token đã đặt cho một lần thử thất bại (lần retry sẽ đặt chỗ lại từ đầu)."""
+        now = time.monotonic()
+        with self._lock:
+            self.tokens.refund(min(float(est_tokens), self.tokens.capacity), now)
+
+    def cooldown(self, seconds: float) -> None:
+        with self._lock:
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + seconds)
+
+    # ---- retry policy ----
+    def backoff_delay(self, attempt: int, err: Exception) -> float:
+        retry_after = _retry_after_seconds(err)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # full jitter: U(0, min(max, base * 2^attempt))
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _on_error(self, attempt: int, err: Exception) -> Optional[float]:
+        """None -> không retry (ném lỗi ra ngoài); ngược lại là số giây chờ trước lần thử tiếp."""
+        if attempt >= self.max_retries or not is_retryable(err):
+            return None
+        delay = self.backoff_delay(attempt, err)
+        rate_limited = _is_openai_error(err, "RateLimitError")
+        with self._lock:
+            self.stats["retries"] += 1
+            if rate_limited:
+                self.stats["rate_limited"] += 1
+        if rate_limited:
+            self.cooldown(delay)
+        return delay
+
+    def call(self, fn: Callable[[], T], *, est_tokens: int = 0, usage_tokens: Callable[[T], Optional[int]] = lambda r: None) -> T:
+        attempt = 0
+        while True:
+            wait = self.reserve(est_tokens)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                result = fn()
+            except Exception as e:
+                self.release(est_tokens)
+                delay = self._on_error(attempt, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.settle(est_tokens, usage_tokens(result))
+            return result
+
+    async def acall(self, fn: Callable[[], Awaitable[T]], *, est_tokens: int = 0, usage_tokens: Callable[[T], Optional[int]] = lambda r: None) -> T:
+        attempt = 0
+        while True:
+            wait = self.reserve(est_tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                result = await fn()
+            except Exception as e:
+                self.release(est_tokens)
+                delay = self._on_error(attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.settle(est_tokens, usage_tokens(result))
+            return result
+
+
+def _is_openai_error(err: Exception, *names: str) -> bool:
+    # Không import openai ở đây: SDK chưa được nạp thì lỗi không thể là lỗi của SDK
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(err, tuple(getattr(openai, n) for n in names))
+
+
+def is_retryable(err: Exception) -> bool:
+    if _is_openai_error(err, "RateLimitError", "APIConnectionError", "APITimeoutError"):
+        return True
+    return _is_openai_error(err, "APIStatusError") and (err.status_code >= 500 or err.status_code in (408, 409))
+
+
+def _retry_after_seconds(err: Exception) -> Optional[float]:
+    response = getattr(err, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        ms = headers.get("retry-after-ms")
+        if ms is not None:
+            return max(0.0, float(ms) / 1000.0)
+        sec = headers.get("retry-after")
+        if sec is not None:
+            return max(0.0, float(sec))
+    except (TypeError, ValueError):
+        pass  # vd Retry-After dạng HTTP-date -> dùng backoff mặc định
+    return None
+
+
+def estimate_request_tokens(req: Dict[str, Any]) -> int:
+    """Ước lượng thô (~4 ký tự/token) cho prompt + max_tokens đầu ra."""
+    chars = sum(len(str(m.get("content") or "")) for m in req.get("messages", []))
+    return chars // 4 + int(req.get("max_tokens") or 0)
+
+
+# ---------- process-wide instance ----------
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+def rate_limit_settings() -> Dict[str, Any]:
+    cfg: Dict[str, Any] = {}
+    try:
+        cfg = dict(st.secrets.get("rate_limit", {}))
+    except Exception:
+        pass
+    return {k: type(v)(cfg.get(k, v)) for k, v in DEFAULT_RATE_LIMIT_SETTINGS.items()}
+
+def get_rate_limiter() -> RateLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            s = rate_limit_settings()
+            _limiter = RateLimiter(s.pop("rpm"), s.pop("tpm"), **s)
+        return _limiter
+
+def set_rate_limiter(limiter: RateLimiter) -> None:
+    global _limiter
+    with _limiter_lock:
+        _limiter = limiter
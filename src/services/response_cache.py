@@ -0,0 +1,192 @@
+# src/services/response_cache.py
+"""
+Cache phản hồi OpenAI trên đĩa (SQLite), địa chỉ hoá theo nội dung request.
+
+Khoá = sha256 của toàn bộ request (kind, model, messages đã render từ template + user_prompt +
+problem_text, temperature, max_tokens, response_format). Giá trị = JSON của ChatCompletion
+cùng latency gốc, nên code phía sau đọc `resp.choices[0].message.content` / `resp.usage` như cũ.
+
+Chế độ (mode):
+- "off"    : không dùng cache.
+- "on"     : đọc cache, miss thì gọi API rồi ghi lại (mặc định).
+- "replay" : chỉ đọc (read-only) — miss thì ném CacheMissError, KHÔNG gọi API. Áp dụng cho
+             mọi kind (bỏ qua `kinds`). Dùng để tái lập chính xác một lần chạy nghiên cứu.
+
+Cấu hình (tuỳ chọn) trong .streamlit/secrets.toml:
+    [response_cache]
+    mode = "on"
+    path = ".cache/openai_responses.sqlite"
+    kinds = ["analyzer"]      # loại call được cache: analyzer | solver | paraphrase
+    ttl_days = 30             # 0 = không hết hạn
+    max_entries = 50000       # 0 = không giới hạn; vượt thì xoá các entry ít dùng gần đây nhất
+Mặc định chỉ cache analyzer (temperature 0.0, tất định); solver/paraphrase lấy mẫu ở
+temperature > 0 nên chỉ cache khi được bật rõ ràng (vd để replay).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import streamlit as st
+
+CACHE_MODES = ("off", "on", "replay")
+CACHE_KINDS = ("analyzer", "solver", "paraphrase")
+
+
+class CacheMissError(RuntimeError):
+    """Ném ra ở chế độ replay khi request chưa có trong cache."""
+
+
+def request_key(kind: str, request: Dict[str, Any]) -> str:
+    payload = json.dumps({"kind": kind, **request}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    _PRUNE_EVERY = 100  # kiểm tra max_entries sau mỗi N lần ghi
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        mode: str = "on",
+        kinds: Iterable[str] = ("analyzer",),
+        ttl_days: float = 30.0,
+        max_entries: int = 50000,
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode '{mode}'. Expected one of {CACHE_MODES}.")
+        self.path = path
+        self.mode = mode
+        self.kinds = set(kinds)
+        self.ttl_sec = float(ttl_days) * 86400.0
+        self.max_entries = int(max_entries)
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self.stats: Dict[str, Dict[str, int]] = {k: {"hits": 0, "misses": 0, "writes": 0} for k in CACHE_KINDS}
+        self._conn: Optional[sqlite3.Connection] = None
+        if mode != "off":
+            d = os.path.dirname(os.path.abspath(path))
+            os.makedirs(d, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, kind TEXT NOT NULL, model TEXT, response TEXT NOT NULL,"
+                " latency_ms INTEGER, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+            self._conn.commit()
+
+    # ---- policy ----
+    def enabled_for(self, kind: str) -> bool:
+        # Replay không được rơi xuống API cho kind nào -> luôn đọc cache (miss = CacheMissError)
+        return self._conn is not None and (self.mode == "replay" or kind in self.kinds)
+
+    # ---- read / write ----
+    def get(self, kind: str, request: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], int]]:
+        """(response_json, latency_ms gốc) hoặc None nếu miss/hết hạn. Replay + miss -> CacheMissError."""
+        if not self.enabled_for(kind):
+            return None
+        key = request_key(kind, request)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, latency_ms, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row and self.ttl_sec > 0 and now - row[2] > self.ttl_sec:
+                if self.mode != "replay":
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                    row = None
+            if row:
+                self.stats[kind]["hits"] += 1
+                if self.mode != "replay":
+                    self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                    self._conn.commit()
+                return json.loads(row[0]), int(row[1] or 0)
+            self.stats[kind]["misses"] += 1
+        if self.mode == "replay":
+            raise CacheMissError(f"Replay mode: no cached {kind} response for request {key[:12]}")
+        return None
+
+    def put(self, kind: str, request: Dict[str, Any], response: Dict[str, Any], latency_ms: int) -> None:
+        if not self.enabled_for(kind) or self.mode == "replay":
+            return
+        key = request_key(kind, request)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, kind, model, response, latency_ms, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, request.get("model"), json.dumps(response, ensure_ascii=False), int(latency_ms), now, now),
+            )
+            self._conn.commit()
+            self.stats[kind]["writes"] += 1
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= self._PRUNE_EVERY:
+                self._writes_since_prune = 0
+                self._prune_locked(now)
+
+    def prune(self) -> None:
+        if self._conn is None or self.mode == "replay":
+            return
+        with self._lock:
+            self._prune_locked(time.time())
+
+    def _prune_locked(self, now: float) -> None:
+        if self.ttl_sec > 0:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_sec,))
+        if self.max_entries > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        self._conn.commit()
+
+    def size(self) -> int:
+        if self._conn is None:
+            return 0
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0])
+
+
+# ---------- process-wide instance ----------
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+def _cache_settings() -> Dict[str, Any]:
+    cfg: Dict[str, Any] = {}
+    try:
+        cfg = dict(st.secrets.get("response_cache", {}))
+    except Exception:
+        pass
+    return {
+        "path": str(cfg.get("path", os.environ.get("PROMPTOPTIMA_CACHE_PATH", ".cache/openai_responses.sqlite"))),
+        "mode": str(cfg.get("mode", os.environ.get("PROMPTOPTIMA_CACHE_MODE", "on"))).strip().lower(),
+        "kinds": list(cfg.get("kinds", ["analyzer"])),
+        "ttl_days": float(cfg.get("ttl_days", 30)),
+        "max_entries": int(cfg.get("max_entries", 50000)),
+    }
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            s = _cache_settings()
+            _cache = ResponseCache(s.pop("path"), **s)
+        return _cache
+
+def set_response_cache(cache: ResponseCache) -> None:
+    """Thay cache của process (vd bật replay cho một lần chạy nghiên cứu, hoặc trong test)."""
+    global _cache
+    with _cache_lock:
+        _cache = cache
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    return {k: dict(v) for k, v in get_response_cache().stats.items()}
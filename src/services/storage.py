@@ -0,0 +1,204 @@
+# src/services/storage.py
+"""
+Nơi lưu các record (Run, PromptMetrics, ...) — chọn backend qua cấu hình:
+
+- "sheets" (mặc định): GoogleSheetManager, mỗi record type một tab như trước.
+- "sqlite": SQLiteRecordStore, một bảng cho mỗi record type trong một file SQLite cục bộ,
+  có index trên run_id / problem_id. Batch lớn ghi ở tốc độ đĩa; phân tích đọc bằng SQL
+  (`query`) thay vì get_all_values.
+
+Cả hai cùng giao diện RecordStore: append_many({tên tab: [record]}) / append_data / get_df.
+Tab đầu vào "problems" (ngân hàng bài toán) vẫn đọc từ Google Sheets (hoặc --input ở CLI).
+
+Cấu hình (tuỳ chọn) trong .streamlit/secrets.toml:
+    [storage]
+    backend = "sqlite"                 # "sheets" | "sqlite"
+    path = ".cache/records.sqlite"
+"""
+
+import json
+import math
+import os
+import sqlite3
+import threading
+import typing
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+import streamlit as st
+
+from src.models.schemas import (
+    AdvancedMetricsPattern,
+    AdvancedMetricsRecord,
+    AnalyzerPattern,
+    AnalyzerScores,
+    Evaluation,
+    PromptMetrics,
+    Run,
+    Suggestion,
+)
+
+STORAGE_BACKENDS = ("sheets", "sqlite")
+DEFAULT_STORAGE_PATH = os.path.join(".cache", "records.sqlite")
+
+# Tên tab / bảng -> model (thứ tự cột khi tạo bảng lấy theo model)
+RECORD_TABLES = {
+    "runs": Run,
+    "metrics_deterministic": PromptMetrics,
+    "metrics_advanced": AdvancedMetricsRecord,
+    "metrics_patterns": AdvancedMetricsPattern,
+    "analyzer_scores": AnalyzerScores,
+    "analyzer_patterns": AnalyzerPattern,
+    "suggestions": Suggestion,
+    "evaluations": Evaluation,
+}
+INDEXED_COLUMNS = ("run_id", "problem_id")
+
+
+def to_row(record: Any) -> Dict[str, Any]:
+    """dict / Pydantic v1-v2 / dataclass -> dict."""
+    if isinstance(record, dict):
+        return record
+    if hasattr(record, "model_dump"):
+        return record.model_dump()
+    if hasattr(record, "dict"):
+        return record.dict()
+    from dataclasses import asdict, is_dataclass
+    return asdict(record) if is_dataclass(record) else dict(vars(record))
+
+
+class RecordStore:
+    def append_many(self, batches: Dict[str, list]) -> bool:
+        raise NotImplementedError
+
+    def append_data(self, sheet_name: str, records: list) -> bool:
+        return self.append_many({sheet_name: records})
+
+    def get_df(self, sheet_name: str) -> pd.DataFrame:
+        raise NotImplementedError
+
+
+def _column_type(annotation: Any) -> str:
+    args = [a for a in typing.get_args(annotation) if a is not type(None)]
+    t = args[0] if typing.get_origin(annotation) is typing.Union and len(args) == 1 else annotation
+    if t in (int, bool):
+        return "INTEGER"
+    if t is float:
+        return "REAL"
+    return "TEXT"
+
+
+def _sql_value(v: Any) -> Any:
+    if v is None or v is pd.NA or v is pd.NaT:
+        return None
+    if hasattr(v, "item") and not isinstance(v, (str, bytes)):
+        v = v.item()  # numpy scalar
+    if isinstance(v, float) and math.isnan(v):
+        return None
+    if isinstance(v, datetime):
+        # Cùng định dạng thời gian mà GoogleSheetManager ghi
+        return v.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    if isinstance(v, bool):
+        return int(v)
+    if isinstance(v, (int, float, str)):
+        return v
+    if isinstance(v, (dict, list, tuple)):
+        return json.dumps(v, ensure_ascii=False, default=str)
+    return str(v)
+
+
+def _quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class SQLiteRecordStore(RecordStore):
+    """Mỗi tab một bảng (append-only); cột mới trong record được thêm bằng ALTER TABLE như header sheet."""
+
+    def __init__(self, path: str = DEFAULT_STORAGE_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._columns: Dict[str, List[str]] = {}
+
+    def _table_columns(self, table: str) -> List[str]:
+        if table not in self._columns:
+            self._columns[table] = [r[1] for r in self._conn.execute(f"PRAGMA table_info({_quote(table)})")]
+        return self._columns[table]
+
+    def _ensure_table(self, table: str, columns: Sequence[str]) -> List[str]:
+        existing = self._table_columns(table)
+        if not existing:
+            model = RECORD_TABLES.get(table)
+            fields = getattr(model, "model_fields", {}) if model else {}
+            cols = list(fields) + [c for c in columns if c not in fields]
+            defs = ", ".join(f"{_quote(c)} {_column_type(fields[c].annotation) if c in fields else ''}".rstrip() for c in cols)
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS {_quote(table)} ({defs})")
+            for c in INDEXED_COLUMNS:
+                if c in cols:
+                    self._conn.execute(f"CREATE INDEX IF NOT EXISTS {_quote(f'idx_{table}_{c}')} ON {_quote(table)} ({_quote(c)})")
+            self._columns[table] = existing = cols
+        for c in columns:
+            if c not in existing:
+                self._conn.execute(f"ALTER TABLE {_quote(table)} ADD COLUMN {_quote(c)}")
+                existing.append(c)
+        return existing
+
+    def append_many(self, batches: Dict[str, list]) -> bool:
+        """Ghi mọi tab trong một transaction (hoặc tất cả, hoặc không gì)."""
+        with self._lock:
+            try:
+                with self._conn:
+                    for table, records in batches.items():
+                        rows = [to_row(r) for r in records if r is not None]
+                        if not rows:
+                            continue
+                        cols = list(dict.fromkeys(k for row in rows for k in row))
+                        self._ensure_table(table, cols)
+                        sql = f"INSERT INTO {_quote(table)} ({', '.join(map(_quote, cols))}) VALUES ({', '.join('?' * len(cols))})"
+                        self._conn.executemany(sql, [[_sql_value(row.get(c)) for c in cols] for row in rows])
+                return True
+            except sqlite3.Error as e:
+                self._columns.clear()  # ALTER/CREATE có thể đã bị rollback
+                st.error(f"Lỗi khi ghi dữ liệu vào {self.path} ({', '.join(batches)}): {e}")
+                return False
+
+    def query(self, sql: str, params: Sequence[Any] = ()) -> pd.DataFrame:
+        with self._lock:
+            return pd.read_sql_query(sql, self._conn, params=list(params))
+
+    def get_df(self, sheet_name: str) -> pd.DataFrame:
+        with self._lock:
+            if not self._table_columns(sheet_name):
+                self._columns.pop(sheet_name, None)
+                return pd.DataFrame()
+        return self.query(f"SELECT * FROM {_quote(sheet_name)} ORDER BY rowid")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def storage_settings() -> Dict[str, Any]:
+    try:
+        cfg = dict(st.secrets.get("storage", {}))
+    except Exception:
+        cfg = {}
+    backend = str(cfg.get("backend") or os.environ.get("PROMPTOPTIMA_STORAGE") or "sheets").lower()
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend}' (expected one of {', '.join(STORAGE_BACKENDS)}).")
+    return {"backend": backend, "path": cfg.get("path") or os.environ.get("PROMPTOPTIMA_STORAGE_PATH") or DEFAULT_STORAGE_PATH}
+
+
+@st.cache_resource
+def get_storage() -> Optional[RecordStore]:
+    """Backend lưu record theo [storage]; "sheets" trả về chính GoogleSheetManager dùng chung."""
+    cfg = storage_settings()
+    if cfg["backend"] == "sqlite":
+        return SQLiteRecordStore(cfg["path"])
+    from src.services.google_sheets import get_gsheet_manager
+    return get_gsheet_manager()
@@ -0,0 +1,50 @@
+# src/utils/lazy_import.py
+"""
+Nạp module nặng (openai, httpx, gspread, pandas) ở lần dùng đầu tiên thay vì lúc import app.
+
+- lazy_import(name): như importlib.import_module, nhưng lần nạp thật đầu tiên được đo thời gian.
+- timed(label): context manager đo một đoạn khởi động bất kỳ (vd toàn bộ import của app.py).
+- import_times(): [(label, ms)] giảm dần, hiển thị trong panel Debug của sidebar.
+
+Module đã có trong sys.modules (do nơi khác import trước) được trả về ngay và không ghi thời gian.
+"""
+
+import importlib
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Dict, Iterator, List, Tuple
+
+_lock = threading.Lock()
+IMPORT_TIMES: Dict[str, float] = {}  # label -> ms (chỉ lần đầu)
+
+
+def record_import(label: str, ms: float) -> None:
+    with _lock:
+        IMPORT_TIMES.setdefault(label, round(ms, 1))
+
+
+def lazy_import(name: str) -> ModuleType:
+    mod = sys.modules.get(name)
+    if mod is not None:
+        return mod
+    t0 = time.perf_counter()
+    mod = importlib.import_module(name)
+    record_import(name, (time.perf_counter() - t0) * 1000)
+    return mod
+
+
+@contextmanager
+def timed(label: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_import(label, (time.perf_counter() - t0) * 1000)
+
+
+def import_times() -> List[Tuple[str, float]]:
+    with _lock:
+        return sorted(IMPORT_TIMES.items(), key=lambda kv: kv[1], reverse=True)
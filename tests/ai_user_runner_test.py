@@ -0,0 +1,202 @@
+import random
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import src.batch.ai_user_runner as R
+from src.batch.paraphrase_store import ParaphraseStore
+from src.batch.progress import BatchReporter
+from src.prompts.taxonomy import PROMPT_TAXONOMY
+from src.services.batch_jobs import LocalBatchBackend
+
+KEYS = (110, 210)
+
+
+class FakeStore:
+    def __init__(self):
+        self.written = []  # [(sheet, row)] theo thứ tự ghi
+
+    def append_many(self, batches):
+        for name, rows in batches.items():
+            self.written.extend((name, row) for row in rows)
+        return True
+
+    def get_df(self, sheet_name):
+        return pd.DataFrame({"run_id": [r["run_id"] for n, r in self.written if n == sheet_name]})
+
+    def rows(self, sheet_name):
+        return [r for n, r in self.written if n == sheet_name]
+
+
+class RecordingReporter(BatchReporter):
+    def __init__(self, crash_at=None):
+        self.progress_calls, self.warnings = [], []
+        self.crash_at = crash_at
+
+    def progress(self, done, total, message=""):
+        self.progress_calls.append((done, total, message))
+        if self.crash_at is not None and len(self.progress_calls) >= self.crash_at:
+            raise KeyboardInterrupt("session died")
+
+    def warning(self, message):
+        self.warnings.append(message)
+
+
+def _problems(n=3):
+    return pd.DataFrame({
+        "CCSS": ["7.RP (ratios)"] * n, "Level": ["L2"] * n, "Abstract / Real-world": ["real"] * n,
+        "Problem": [f"Problem {i}: 3x + 2 = {i}" for i in range(n)],
+    })
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # journal .cache/checkpoints nằm trong tmp
+    monkeypatch.setattr(R, "PROMPT_TAXONOMY", {k: PROMPT_TAXONOMY[k] for k in KEYS})
+    store = FakeStore()
+    monkeypatch.setattr(R, "get_storage", lambda: store)
+    return store
+
+
+def _stub_variant(executed, fail_on=None):
+    def process(*, run_id, prompt_text, problem_id, prompt_name, sug_key, **kw):
+        executed.append((problem_id, sug_key))
+        if (problem_id, sug_key) == fail_on:
+            raise RuntimeError("solver down")
+        row = {"run_id": run_id, "problem_id": problem_id, "prompt_name": prompt_name}
+        return {field: dict(row) if field in ("run", "analyzer_score") else None for _, field in R._SHEET_FIELDS}
+    return process
+
+
+def _run(problems, **kw):
+    return R.run_ai_user_batch(
+        ccss_filters=[], level_filters=[], context_filters=[], evaluator_name="t", problems=problems,
+        paraphrase_store=ParaphraseStore(".cache/p.sqlite"), **kw,
+    )
+
+
+def test_resume_skips_finished_tasks_and_writes_once(env, monkeypatch):
+    executed = []
+    monkeypatch.setattr(R, "_process_single_prompt_variant", _stub_variant(executed))
+    monkeypatch.setattr(R, "_paraphrase", lambda *, problem, sug_key, **kw: f"paraphrase {sug_key}")
+    df = _problems()
+    total = len(df) * (len(KEYS) + 1)
+
+    # Session chết sau 4 task (task 3-4 chưa flush vì flush_every=3)
+    with pytest.raises(KeyboardInterrupt):
+        _run(df, flush_every=3, max_workers=1, max_in_flight=1, reporter=RecordingReporter(crash_at=4))
+    assert len(executed) == 4 and len(env.rows("runs")) == 3
+
+    out = _run(df, flush_every=3, max_workers=1, max_in_flight=1, reporter=RecordingReporter())
+    assert out["resumed"] == 4 and out["created_runs"] == total - 4
+    assert len(executed) == total and len(set(executed)) == total  # không task nào chạy lại
+    run_ids = [r["run_id"] for r in env.rows("runs")]
+    assert len(run_ids) == total and len(set(run_ids)) == total   # không dòng nào ghi hai lần
+    assert len(env.rows("analyzer_scores")) == total
+
+
+def test_duplicate_problems_and_input_identity(env, monkeypatch):
+    executed = []
+    monkeypatch.setattr(R, "_process_single_prompt_variant", _stub_variant(executed))
+    monkeypatch.setattr(R, "_paraphrase", lambda *, problem, sug_key, **kw: f"paraphrase {sug_key}")
+    df = _problems(2)
+    dup = pd.concat([df, df.iloc[[0]]], ignore_index=True)
+    reporter = RecordingReporter()
+    out = _run(dup, reporter=reporter)
+    assert out["selected"] == 2 and len(env.rows("runs")) == 2 * (len(KEYS) + 1)
+    assert any("duplicate" in w for w in reporter.warnings)
+    # Input khác (cùng filter/model) -> journal khác; cùng tập bài -> cùng journal
+    assert _run(_problems(3), reporter=RecordingReporter())["batch_id"] != out["batch_id"]
+    assert _run(df.iloc[::-1], reporter=RecordingReporter())["batch_id"] == out["batch_id"]
+
+
+def test_second_run_reuses_stored_paraphrases(env, monkeypatch):
+    executed, calls = [], []
+    monkeypatch.setattr(R, "_process_single_prompt_variant", _stub_variant(executed))
+
+    def synthesize(problem_text, sug, level, persona, *, model, n):
+        calls.append(persona)
+        return [f"{sug['name']} for {persona}"] * n
+
+    monkeypatch.setattr(R, "synthesize_prompt_variants", synthesize)
+    df = _problems(3)
+    store = ParaphraseStore(".cache/p.sqlite")
+    common = dict(ccss_filters=[], level_filters=[], context_filters=[], problems=df, paraphrase_store=store, paraphrases_per_key=2)
+    first = R.run_ai_user_batch(evaluator_name="a", reporter=RecordingReporter(), **common)
+    assert len(calls) == len(df) * len(KEYS)
+
+    # Batch khác (evaluator khác -> journal mới) nhưng persona tất định theo bài -> cùng khoá paraphrase
+    second = R.run_ai_user_batch(evaluator_name="b", reporter=RecordingReporter(), **common)
+    assert second["batch_id"] != first["batch_id"]
+    assert len(calls) == len(df) * len(KEYS) and store.stats["hits"] == len(df) * len(KEYS)
+    assert R._choose_persona(["p", "q", "r"], "s", "id") == R._choose_persona(["p", "q", "r"], "s", "id")
+
+
+def _completion(text):
+    return {"id": "x", "object": "chat.completion", "created": 1, "model": "m",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 4, "total_tokens": 7}}
+
+
+def test_offline_mode_end_to_end_with_local_backend(env):
+    paraphrases = []
+
+    def responder(body):
+        if "prompt engineer" in body["messages"][0]["content"]:
+            paraphrases.append(body)
+            if len(paraphrases) == 3:  # Problem 1 × key 110
+                raise RuntimeError("paraphrase quota")
+            return _completion(f"PARA {len(paraphrases)}")
+        if body.get("response_format"):
+            return _completion('{"prompt_analysis": {"signals": {"tokens": 42}}}')
+        return _completion("SOLUTION")
+
+    reporter = RecordingReporter()
+    out = _run(_problems(2), mode="offline", batch_backend=LocalBatchBackend(responder), batch_poll_sec=0, reporter=reporter)
+    total = 2 * (len(KEYS) + 1)
+    assert len(paraphrases) == 2 * len(KEYS)
+    assert out["created_runs"] == total - 1
+    assert len(reporter.warnings) == 1 and "paraphrase quota" in reporter.warnings[0]
+
+    runs = env.rows("runs")
+    assert [r["prompt_text"] for r in runs if r["prompt_name"] != "Zero-Shot Baseline"] == ["PARA 1", "PARA 2", "PARA 4"]
+    assert {r["response_text"] for r in runs} == {"SOLUTION"}
+    assert [r["tokens"] for r in env.rows("analyzer_scores")] == [42] * (total - 1)
+    assert [d for d, _, _ in reporter.progress_calls[:total]] == list(range(1, total + 1))
+
+
+def test_thread_pool_keeps_task_order_and_isolates_failures(env, monkeypatch):
+    executed, active, peak = [], [0], [0]
+    lock = threading.Lock()
+    df = _problems(3)
+    failing = (R.generate_problem_id(R.clean_problem_text(df["Problem"][1])), 110)
+    inner = _stub_variant(executed, fail_on=failing)
+
+    def process(**kw):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(random.uniform(0, 0.02))  # hoàn thành lệch thứ tự
+        try:
+            return inner(**kw)
+        finally:
+            with lock:
+                active[0] -= 1
+
+    monkeypatch.setattr(R, "_process_single_prompt_variant", process)
+    monkeypatch.setattr(R, "_paraphrase", lambda *, problem, sug_key, **kw: f"paraphrase {sug_key}")
+    reporter = RecordingReporter()
+    out = _run(df, max_workers=4, flush_every=2, reporter=reporter)
+
+    total = len(df) * (len(KEYS) + 1)
+    assert peak[0] > 1 and len(executed) == total
+    names = ["Zero-Shot Baseline"] + [str(PROMPT_TAXONOMY[k]["name"]) for k in KEYS]
+    expected = [(i, n) for i in range(len(df)) for n in names]
+    assert [(d, m.split(" | ")[1]) for d, _, m in reporter.progress_calls[:total]] == [(i + 1, n) for i, (_, n) in enumerate(expected)]
+    # Một task lỗi chỉ bị bỏ qua; các dòng còn lại ghi theo đúng thứ tự task
+    assert out["created_runs"] == total - 1 and out["failed"] == 1 and len(reporter.warnings) == 1
+    pid = {R.generate_problem_id(R.clean_problem_text(t)): i for i, t in enumerate(df["Problem"])}
+    written = [(pid[r["problem_id"]], r["prompt_name"]) for r in env.rows("runs")]
+    assert written == [e for e in expected if e != (1, str(PROMPT_TAXONOMY[110]["name"]))]
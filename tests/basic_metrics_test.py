@@ -0,0 +1,70 @@
+import random
+from dataclasses import asdict
+
+import pytest
+
+from src.core.metrics import BasicMetrics
+from src.core.tokenizer import AdvancedTokenizer
+
+PROMPTS = [
+    "Giải phương trình: 2x + 5 = 11. Tìm giá trị của x.",
+    "Explain the relationship between ratios and proportional reasoning! Then verify…",
+    "",
+    "   ",
+    "one two three four five six seven eight nine ten eleven twelve one two",
+]
+
+
+def test_compute_many_matches_compute():
+    metrics, tokenizer = BasicMetrics(), AdvancedTokenizer()
+    run_ids = [f"r{i}" for i in range(len(PROMPTS))]
+    df = metrics.compute_many(PROMPTS, tokenizer, run_ids)
+    assert list(df["run_id"]) == run_ids
+    for prompt, run_id, row in zip(PROMPTS, run_ids, df.to_dict("records")):
+        expected = asdict(metrics.compute(prompt, tokenizer, run_id=run_id))
+        assert row == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("w", [1, 3, 10, 25])
+def test_compute_many_vectorized_matches_compute_exactly(w):
+    rng = random.Random(w)
+    vocab = "the The cat dog Giải phương trình x 2x 12 + = 7.5 . ! ? … , ( ) a'b π 😀 proportional reasoning \n".split(" ")
+    prompts = [" ".join(rng.choice(vocab) for _ in range(rng.randint(0, 60))) for _ in range(200)]
+    prompts += ["12 + 7 = 19. 3 4 5 6 7 8 9 10 11 12 13 3 4", ". . .", "x"]  # prompt không có token chữ
+    metrics, tokenizer = BasicMetrics(), AdvancedTokenizer()
+    for batch in (prompts, prompts + ["a\x01b c"]):  # ký tự ngăn cách trong dữ liệu -> tính từng prompt
+        run_ids = [str(i) for i in range(len(batch))]
+        df = metrics.compute_many(batch, tokenizer, run_ids, w=w)
+        assert df.to_dict("records") == [asdict(metrics.compute(p, tokenizer, run_id=r, w=w)) for p, r in zip(batch, run_ids)]
+
+
+def test_compute_many_length_mismatch():
+    with pytest.raises(ValueError):
+        BasicMetrics().compute_many(PROMPTS, AdvancedTokenizer(), ["only-one"])
+
+
+def _mattr_bruteforce(tokens, w):
+    base = [t.lower() for t in tokens if t.isalpha()]
+    n = len(base)
+    if n <= w:
+        return len(set(base)) / n
+    ratios = [len(set(base[i:i + w])) / w for i in range(n - w + 1)]
+    return sum(ratios) / len(ratios)
+
+
+@pytest.mark.parametrize("w", [1, 3, 10, 25, 50, 100])
+def test_sliding_mattr_matches_bruteforce(w):
+    tokens = ("the cat saw The dog and the Dog saw a cat " * 30).split()
+    assert BasicMetrics()._mattr(tokens, w) == pytest.approx(_mattr_bruteforce(tokens, w))
+
+
+def test_mattr_profile_windows():
+    profile = BasicMetrics().mattr_profile("a b c d " * 50, AdvancedTokenizer(), windows=(4, 8))
+    assert profile == {4: pytest.approx(1.0), 8: pytest.approx(0.5)}
+
+
+def test_mattr_accepts_token_iterator():
+    metrics, tokenizer = BasicMetrics(), AdvancedTokenizer()
+    text = "12 + 7 = 19. " * 20
+    assert metrics._mattr(tokenizer.iter_tokens(text)) == pytest.approx(metrics._mattr(tokenizer.tokenize(text)))
+    assert metrics.compute(text, tokenizer, run_id="r").token_count == tokenizer.count(text)
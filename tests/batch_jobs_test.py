@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from src.services.batch_jobs import BatchBackend, BatchJobError, LocalBatchBackend, chunk_requests, read_results, run_batch_job
+
+
+def _completion(text):
+    return {"id": "x", "object": "chat.completion", "created": 1, "model": "m",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}]}
+
+
+def _responder(body):
+    content = body["messages"][0]["content"]
+    if content == "fail":
+        raise RuntimeError("boom")
+    return _completion(content.upper())
+
+
+def test_local_backend_round_trip(tmp_path):
+    reqs = [{"custom_id": f"r{i}", "body": {"model": "m", "messages": [{"role": "user", "content": c}]}}
+            for i, c in enumerate(["a", "fail", "c"])]
+    polls = []
+    out = run_batch_job(reqs, LocalBatchBackend(_responder), workdir=str(tmp_path), poll_interval=0,
+                        on_poll=lambda job_id, status, elapsed: polls.append(status))
+    assert polls == ["completed"]
+    assert out["r0"]["body"]["choices"][0]["message"]["content"] == "A"
+    assert out["r1"] == {"body": None, "error": "boom"}
+    assert out["r2"]["error"] is None
+    line = json.loads((next(tmp_path.glob("*.requests.jsonl"))).read_text().splitlines()[0])
+    assert line["url"] == "/v1/chat/completions" and line["method"] == "POST"
+
+
+def test_missing_and_http_error_lines(tmp_path):
+    p = tmp_path / "out.jsonl"
+    p.write_text(json.dumps({"custom_id": "a", "response": {"status_code": 500, "body": {"message": "server"}}, "error": None}) + "\n")
+    assert read_results(str(p)) == {"a": {"body": None, "error": "server"}}
+
+
+class _FailedBackend(BatchBackend):
+    def submit(self, input_path):
+        return "job"
+
+    def status(self, job_id):
+        return "failed"
+
+
+def test_failed_job_raises(tmp_path):
+    with pytest.raises(BatchJobError):
+        run_batch_job([{"custom_id": "a", "body": {}}], _FailedBackend(), workdir=str(tmp_path), poll_interval=0)
+
+
+def test_large_request_sets_are_split_into_several_jobs(tmp_path):
+    reqs = [{"custom_id": f"r{i}", "body": {"model": "m", "messages": [{"role": "user", "content": c}]}}
+            for i, c in enumerate(["a", "b", "fail", "d", "e"])]
+    polls = []
+    out = run_batch_job(reqs, LocalBatchBackend(_responder), workdir=str(tmp_path), poll_interval=0,
+                        max_requests_per_file=2, on_poll=lambda job_id, status, elapsed: polls.append(job_id))
+    assert len(set(polls)) == 3 and len(list(tmp_path.glob("*.requests.jsonl"))) == 3
+    assert [out[f"r{i}"]["error"] for i in range(5)] == [None, None, "boom", None, None]
+    assert out["r4"]["body"]["choices"][0]["message"]["content"] == "E"
+    assert [len(c) for c in chunk_requests(reqs, max_requests=10, max_bytes=320)] == [2, 2, 1]
+
+
+def test_each_input_file_has_a_single_model(tmp_path):
+    reqs = [{"custom_id": f"r{i}", "body": {"model": m, "messages": [{"role": "user", "content": "x"}]}}
+            for i, m in enumerate(["analyzer-m", "solver-m", "analyzer-m", "solver-m"])]
+    out = run_batch_job(reqs, LocalBatchBackend(_responder), workdir=str(tmp_path), poll_interval=0)
+    assert set(out) == {"r0", "r1", "r2", "r3"}
+    files = sorted(tmp_path.glob("*.requests.jsonl"))
+    models = [{json.loads(line)["body"]["model"] for line in f.read_text().splitlines()} for f in files]
+    assert len(files) == 2 and all(len(m) == 1 for m in models)
+    # Backend local từ chối file trộn model như Batch API
+    path = tmp_path / "mixed.jsonl"
+    path.write_text("\n".join(json.dumps(r) for r in reqs[:2]))
+    with pytest.raises(BatchJobError):
+        LocalBatchBackend(_responder).submit(str(path))
@@ -0,0 +1,28 @@
+from src.batch.checkpoint import FLUSHED, FLUSHING, BatchCheckpoint
+
+
+def test_journal_round_trip(tmp_path):
+    ck = BatchCheckpoint("b1", root=str(tmp_path))
+    assert ck.persona_for("p1", lambda: "tutor") == "tutor"
+    ck.record("p1", None, "r1", {"runs": [{"run_id": "r1"}]})
+    ck.record("p1", 110, "r2", {"runs": [{"run_id": "r2"}]})
+    ck.close()
+
+    ck = BatchCheckpoint("b1", root=str(tmp_path))
+    assert ck.persona_for("p1", lambda: "coach") == "tutor"
+    assert ck.done_keys() == {("p1", "baseline"), ("p1", "110")}
+    assert [rid for rid, _, _ in ck.unflushed()] == ["r1", "r2"]
+
+    ck.mark(["r1"], FLUSHING)
+    ck.mark(["r2"], FLUSHED)
+    assert [(rid, state) for rid, _, state in ck.unflushed()] == [("r1", FLUSHING)]
+    assert ck.counts() == {"pending": 0, "flushing": 1, "flushed": 1}
+
+
+def test_reset_and_meta(tmp_path):
+    ck = BatchCheckpoint("b2", root=str(tmp_path))
+    ck.record("p", 1, "r", {})
+    ck.set_meta("completed", True)
+    assert ck.get_meta("completed") is True
+    ck.reset()
+    assert ck.done_keys() == set() and ck.get_meta("completed", False) is False
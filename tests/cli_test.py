@@ -0,0 +1,45 @@
+import pytest
+
+from src.batch.cli import LoggingReporter, build_parser, exit_code, load_problems
+
+
+def test_load_problems_csv_keeps_strings(tmp_path):
+    p = tmp_path / "problems.csv"
+    p.write_text("CCSS, Level ,Abstract / Real-world,Problem\n7.RP,1,real,Find 10% of 50\n7.EE,,abstract,NA\n")
+    df = load_problems(str(p))
+    assert list(df.columns) == ["CCSS", "Level", "Abstract / Real-world", "Problem"]
+    assert df["Level"].tolist() == ["1", ""] and df["Problem"].tolist()[1] == "NA"
+
+
+def test_load_problems_rejects_unknown_extension(tmp_path):
+    with pytest.raises(ValueError):
+        load_problems(str(tmp_path / "problems.xlsx"))
+
+
+def test_parser_filters_and_defaults():
+    args = build_parser().parse_args(["--evaluator", "lab", "--ccss", "7.RP", "7.EE", "--level", "2", "--mode", "offline"])
+    assert args.ccss == ["7.RP", "7.EE"] and args.level == ["2"] and args.context == []
+    assert args.mode == "offline" and args.workers == 4 and not args.no_resume
+
+
+def test_logging_reporter_counts_and_stop():
+    r = LoggingReporter(every_sec=0)
+    r.warning("w")
+    r.error("e")
+    assert (r.warnings, r.errors) == (1, 1)
+    assert not r.should_stop()
+    r.stop_event.set()
+    assert r.should_stop()
+
+
+def test_exit_code_ignores_informational_warnings():
+    ok = {"selected": 3, "created_runs": 9, "cancelled": False, "failed": 0, "unflushed": 0}
+    r = LoggingReporter(every_sec=0)
+    r.warning("Skipping 1 duplicate problem(s) with the same text as an earlier row.")
+    assert exit_code(ok, r) == 0
+    assert exit_code({**ok, "failed": 1}, r) == 2
+    assert exit_code({**ok, "unflushed": 2}, r) == 2
+    assert exit_code({**ok, "cancelled": True}, r) == 130
+    assert exit_code({"selected": 0, "created_runs": 0}, r) == 1
+    r.error("Offline batch failed: boom")
+    assert exit_code(ok, r) == 2
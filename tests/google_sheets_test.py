@@ -0,0 +1,196 @@
+import threading
+from datetime import datetime, timezone
+
+from src.services.google_sheets import GoogleSheetManager, _cell
+
+
+class FakeWorksheet:
+    def __init__(self, title, sheet_id, col_count=26):
+        self.title, self.id, self.col_count = title, sheet_id, col_count
+
+
+class FakeSpreadsheet:
+    def __init__(self, headers):
+        self.headers = headers
+        self.sheets = [FakeWorksheet(t, i) for i, t in enumerate(headers)]
+        self.calls = []
+
+    def worksheets(self):
+        self.calls.append("worksheets")
+        return list(self.sheets)
+
+    def add_worksheet(self, title, rows, cols):
+        self.calls.append(("add_worksheet", title))
+        ws = FakeWorksheet(title, len(self.sheets), col_count=1)
+        self.sheets.append(ws)
+        return ws
+
+    def values_batch_get(self, ranges):
+        self.calls.append(("values_batch_get", tuple(ranges)))
+        titles = [r.split("'")[1] for r in ranges]
+        return {"valueRanges": [{"values": [self.headers[t]]} if self.headers.get(t) else {} for t in titles]}
+
+    def batch_update(self, body):
+        self.calls.append(("batch_update", body))
+
+
+class FakeClient:
+    def __init__(self, spreadsheet):
+        self.spreadsheet, self.opened = spreadsheet, []
+
+    def open(self, name):
+        self.opened.append(("open", name))
+        return self.spreadsheet
+
+    def open_by_key(self, key):
+        self.opened.append(("open_by_key", key))
+        return self.spreadsheet
+
+
+def _manager(spreadsheet, key=None):
+    m = GoogleSheetManager.__new__(GoogleSheetManager)
+    m.client, m.spreadsheet_name, m.spreadsheet_key = FakeClient(spreadsheet), "bench", key
+    m._write_lock = threading.Lock()
+    m._init_caches()
+    return m
+
+
+def _row_values(req):
+    return [[c.get("userEnteredValue", {}) for c in r["values"]] for r in req["appendCells"]["rows"]]
+
+
+def test_one_batch_update_for_all_tabs_and_cached_headers():
+    ss = FakeSpreadsheet({"runs": ["run_id", "score"], "evaluations": ["run_id", "notes"]})
+    m = _manager(ss)
+    assert m.append_many({"runs": [{"score": 1.5, "run_id": "a", "extra": 1}], "evaluations": [{"run_id": "a"}], "suggestions": []})
+    updates = [c for c in ss.calls if c[0] == "batch_update"]
+    assert len(updates) == 1
+    reqs = updates[0][1]["requests"]
+    # Cột chưa có trong header được nối vào cuối header
+    assert reqs[0]["updateCells"]["start"] == {"sheetId": 0, "rowIndex": 0, "columnIndex": 2}
+    assert reqs[0]["updateCells"]["rows"] == [{"values": [{"userEnteredValue": {"stringValue": "extra"}}]}]
+    assert _row_values(reqs[1]) == [[{"stringValue": "a"}, {"numberValue": 1.5}, {"numberValue": 1}]]
+    assert _row_values(reqs[2]) == [[{"stringValue": "a"}, {}]]
+    assert m._headers["runs"] == ["run_id", "score", "extra"]
+
+    ss.calls.clear()
+    m.append_many({"runs": [{"run_id": "b", "score": 2}]})
+    assert not any(c[0] == "values_batch_get" for c in ss.calls if isinstance(c, tuple))
+
+
+def test_new_tab_gets_header_and_columns():
+    ss = FakeSpreadsheet({})
+    m = _manager(ss)
+    assert m.append_data("runs", [{"run_id": "a", "ok": True}])
+    reqs = [c for c in ss.calls if c[0] == "batch_update"][0][1]["requests"]
+    assert reqs[0]["appendDimension"]["length"] == 1
+    assert _row_values(reqs[1]) == [[{"stringValue": "run_id"}, {"stringValue": "ok"}], [{"stringValue": "a"}, {"boolValue": True}]]
+    assert m._headers["runs"] == ["run_id", "ok"]
+
+
+def test_handles_cached_and_header_mismatch_refetches():
+    ss = FakeSpreadsheet({"runs": ["run_id", "score"]})
+    m = _manager(ss, key="abc")
+    for i in range(3):
+        assert m.append_data("runs", [{"run_id": str(i), "score": i}])
+    assert m.client.opened == [("open_by_key", "abc")]
+    assert ss.calls.count("worksheets") == 1
+    assert sum(1 for c in ss.calls if c[0] == "values_batch_get") == 1
+    assert m.cache_info()["header"] == {"hits": 2, "misses": 1}
+
+    # Cột mới được thêm vào sheet ngoài app -> header cache lệch -> đọc lại đúng một lần
+    ss.headers["runs"] = ["run_id", "score", "notes"]
+    ss.calls.clear()
+    m.append_data("runs", [{"run_id": "x", "notes": "n"}])
+    m.append_data("runs", [{"run_id": "y", "notes": "n"}])
+    assert sum(1 for c in ss.calls if c[0] == "values_batch_get") == 1
+    assert m._headers["runs"] == ["run_id", "score", "notes"]
+
+    m.invalidate()
+    m.append_data("runs", [{"run_id": "z"}])
+    assert m.client.opened == [("open_by_key", "abc")] * 2
+
+
+
+def test_open_failure_returns_false_and_retries():
+    ss = FakeSpreadsheet({"runs": ["run_id"]})
+    m = _manager(ss, key="abc")
+    fail = [True]
+
+    def open_by_key(key):
+        if fail.pop(0) if fail else False:
+            raise ConnectionError("network down")
+        return ss
+
+    m.client.open_by_key = open_by_key
+    # Lỗi mở spreadsheet (mạng/quota) -> ghi log, trả False thay vì ném exception
+    assert m.append_data("runs", [{"run_id": "a"}]) is False
+    assert m.append_data("runs", [{"run_id": "b"}]) is True
+
+class GridWorksheet(FakeWorksheet):
+    def __init__(self, title, grid):
+        super().__init__(title, 0)
+        self.grid, self.full_reads = grid, 0
+
+    def get_all_values(self):
+        self.full_reads += 1
+        width = max(len(r) for r in self.grid)
+        return [list(r) + [""] * (width - len(r)) for r in self.grid]
+
+
+class GridSpreadsheet(FakeSpreadsheet):
+    def __init__(self, title, grid):
+        super().__init__({})
+        self.ws = GridWorksheet(title, grid)
+        self.sheets = [self.ws]
+
+    def values_batch_get(self, ranges):
+        self.calls.append(("values_batch_get", tuple(ranges)))
+        out = []
+        for r in ranges:
+            spec = r.split("!")[1]
+            start = 1 if spec == "1:1" else int(spec.split(":")[0][1:])
+            rows = self.ws.grid[start - 1:1 if spec == "1:1" else None]
+            out.append({"values": rows} if rows else {})
+        return {"valueRanges": out}
+
+
+def test_get_df_reads_only_new_rows():
+    grid = [["id", "text"], ["1", "a"], ["", "  "], ["2"]]
+    ss = GridSpreadsheet("problems", grid)
+    m = _manager(ss)
+    df = m.get_df("problems")
+    assert df.to_dict("records") == [{"id": "1", "text": "a"}, {"id": "2", "text": ""}]
+
+    grid.extend([["3", "c"], [], ["4", "d", "extra"]])
+    df = m.get_df("problems")
+    assert list(df["id"]) == ["1", "2", "3", "4"]
+    assert ss.ws.full_reads == 1
+    assert ss.calls[-1] == ("values_batch_get", ("'problems'!1:1", "'problems'!A4:B"))
+    assert m.cache_info()["tab"] == {"hits": 1, "misses": 1}
+
+    # Hàng cuối đã biết bị sửa ngoài app -> đọc lại toàn bộ
+    grid[-1] = ["4", "changed"]
+    grid.append(["5", "e"])
+    m.get_df("problems")
+    grid[0] = ["id", "text", "notes"]
+    df = m.get_df("problems")
+    assert ss.ws.full_reads == 3 and list(df.columns) == ["id", "text", "notes"]
+
+
+def test_cell_conversion():
+    assert _cell(None) == {} and _cell(float("nan")) == {} and _cell("") == {}
+    assert _cell(3) == {"userEnteredValue": {"numberValue": 3}}
+    ts = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    assert _cell(ts) == {"userEnteredValue": {"stringValue": "2024-01-02T03:04:05.000000Z"}}
+
+
+def test_string_cells_follow_user_entered_parsing():
+    value = lambda v: _cell(v)["userEnteredValue"]
+    assert value("42") == {"numberValue": 42.0} and value("-1,234.5") == {"numberValue": -1234.5}
+    assert value(".5") == {"numberValue": 0.5} and value("3e-4") == {"numberValue": 3e-4}
+    assert value("=SUM(A1:A3)") == {"formulaValue": "=SUM(A1:A3)"}
+    assert value("true") == {"boolValue": True}
+    assert value("'0042") == {"stringValue": "0042"}
+    for text in ("e5", "1,23", "7.RP.A.1", "2x + 3 = 7", "2024-01-02T03:04:05.000000Z", "="):
+        assert value(text) == {"stringValue": text}
@@ -0,0 +1,45 @@
+import threading
+
+from src.batch.jobs import BatchJobQueue
+
+
+def _runner(*, n, gate=None, reporter):
+    for i in range(n):
+        if reporter.should_stop():
+            return {"created_runs": i, "cancelled": True}
+        if gate is not None:
+            gate.wait(5)
+        reporter.progress(i + 1, n, f"task {i + 1}")
+    if n < 0:
+        raise ValueError("bad spec")
+    reporter.warning("done with warnings")
+    return {"created_runs": n, "cancelled": False}
+
+
+def test_job_runs_in_background_and_reports():
+    q = BatchJobQueue(runner=_runner)
+    job_id = q.submit({"n": 3}, submitted_by="tester")
+    snap = q.wait(job_id, timeout=5)
+    assert snap["status"] == "done" and snap["done"] == 3 and snap["total"] == 3
+    assert snap["result"] == {"created_runs": 3, "cancelled": False}
+    assert snap["log"] == ["⚠️ done with warnings"] and snap["submitted_by"] == "tester"
+
+
+def test_cancel_queued_and_running():
+    gate = threading.Event()
+    q = BatchJobQueue(runner=_runner)
+    running = q.submit({"n": 100, "gate": gate})
+    queued = q.submit({"n": 1})
+    assert q.cancel(queued) and q.status(queued)["status"] == "cancelled"
+    while q.status(running)["status"] != "running":
+        pass
+    assert q.cancel(running)
+    gate.set()
+    assert q.wait(running, timeout=5)["status"] == "cancelled"
+    assert not q.cancel(running)
+
+
+def test_failed_job_keeps_error():
+    q = BatchJobQueue(runner=_runner)
+    snap = q.wait(q.submit({"n": -1}), timeout=5)
+    assert snap["status"] == "failed" and "bad spec" in snap["error"]
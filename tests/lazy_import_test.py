@@ -0,0 +1,34 @@
+import subprocess
+import sys
+
+from src.utils.lazy_import import IMPORT_TIMES, import_times, lazy_import, timed
+
+NETWORK_LIBS = ("openai", "httpx", "gspread")
+
+
+def _loaded_after(stmt: str) -> set:
+    code = f"import sys; {stmt}; print(' '.join(sorted({{m.split('.')[0] for m in sys.modules}})))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return set(out.split())
+
+
+def test_metrics_path_has_no_network_or_dataframe_deps():
+    loaded = _loaded_after("import src.core.metrics, src.core.metrics_advanced, src.core.tokenizer")
+    assert loaded.isdisjoint({*NETWORK_LIBS, "pandas", "streamlit"})
+
+
+def test_service_modules_defer_network_clients():
+    loaded = _loaded_after("import src.services.openai_client, src.services.google_sheets, src.prompts.templates")
+    assert loaded.isdisjoint(NETWORK_LIBS)
+
+
+def test_lazy_import_records_first_load_only():
+    IMPORT_TIMES.pop("colorsys", None)
+    sys.modules.pop("colorsys", None)
+    assert lazy_import("colorsys").__name__ == "colorsys"
+    first = IMPORT_TIMES["colorsys"]
+    lazy_import("colorsys")
+    with timed("colorsys"):
+        pass
+    assert IMPORT_TIMES["colorsys"] == first
+    assert ("colorsys", first) in import_times()
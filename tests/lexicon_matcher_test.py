@@ -0,0 +1,34 @@
+import re
+
+from src.core.lexicon_matcher import LexiconMatcher
+
+
+def _naive(text_lower, terms):
+    hits = []
+    for term in terms:
+        if " " in term:
+            hits.extend([term] * text_lower.count(term))
+        else:
+            hits.extend(re.findall(rf"\b{re.escape(term)}\b", text_lower))
+    return sorted(hits)
+
+
+def test_matches_naive_lexicon_count():
+    lexicons = {
+        "verbs": {"explain", "explain why", "check", "self-check"},
+        "logic": {"if", "if and only if", "then", "case 1"},
+    }
+    matcher = LexiconMatcher(lexicons)
+    text = "explain why x; explained? if and only if and only if then self-check, case 1case 10 checks check"
+    res = matcher.scan(text)
+    for name, terms in lexicons.items():
+        cnt, hits = res[name]
+        assert cnt == len(hits)
+        assert sorted(hits) == _naive(text, terms)
+
+
+def test_hits_in_text_order_and_shared_terms():
+    matcher = LexiconMatcher({"a": {"ratio", "rate"}, "b": {"rate"}})
+    res = matcher.scan("rate then ratio then rate")
+    assert res["a"] == (3, ["rate", "ratio", "rate"])
+    assert res["b"] == (2, ["rate", "rate"])
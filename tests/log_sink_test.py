@@ -0,0 +1,58 @@
+import threading
+from datetime import datetime, timezone
+
+from src.services.log_sink import SheetLogSink
+
+
+class FakeWriter:
+    def __init__(self, fail=0):
+        self.calls, self.fail = [], fail
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def append_many(self, batches):
+        self.gate.wait(5)
+        if self.fail:
+            self.fail -= 1
+            return False
+        self.calls.append(batches)
+        return True
+
+
+def test_coalesces_turns_into_one_write(tmp_path):
+    w = FakeWriter()
+    sink = SheetLogSink(w, str(tmp_path / "sink.sqlite"), flush_interval_sec=0.2)
+    ts = datetime(2024, 1, 2, tzinfo=timezone.utc)
+    assert sink.enqueue({"runs": [{"run_id": "a", "created_at": ts}], "metrics_advanced": [None]})
+    assert sink.enqueue({"runs": [{"run_id": "b"}]})
+    assert sink.flush(timeout=5)
+    sink.close()
+    assert w.calls == [{"runs": [{"run_id": "a", "created_at": "2024-01-02T00:00:00.000000Z"}, {"run_id": "b"}]}]
+
+
+def test_failed_writes_survive_restart(tmp_path):
+    path = str(tmp_path / "sink.sqlite")
+    sink = SheetLogSink(FakeWriter(fail=10**6), path, flush_interval_sec=0)
+    sink.enqueue({"runs": [{"run_id": "a"}]})
+    sink.close(timeout=1)
+
+    w = FakeWriter()
+    sink = SheetLogSink(w, path, flush_interval_sec=0)
+    assert sink.flush(timeout=5)
+    sink.close()
+    assert w.calls == [{"runs": [{"run_id": "a"}]}]
+    assert SheetLogSink(w, path, start=False).pending() == 0
+
+
+def test_backpressure_rejects_when_full(tmp_path):
+    w = FakeWriter()
+    w.gate.clear()  # writer treo -> không entry nào được ghi
+    sink = SheetLogSink(w, str(tmp_path / "sink.sqlite"), max_pending=2, flush_interval_sec=0)
+    assert sink.enqueue({"runs": [{"run_id": "a"}]})
+    assert sink.enqueue({"runs": [{"run_id": "b"}]})
+    assert not sink.enqueue({"runs": [{"run_id": "c"}]}, block_sec=0.1)
+    assert sink.stats["rejected"] == 1
+    w.gate.set()
+    assert sink.flush(timeout=5)
+    sink.close()
+    assert [r["run_id"] for c in w.calls for r in c["runs"]] == ["a", "b"]
@@ -0,0 +1,26 @@
+from src.core.metrics_advanced import (
+    compute_advanced_metrics, compute_arq, compute_cdi, compute_sss, extract_prompt_features,
+)
+
+PROMPT = (
+    "Step 1: Explain why the unit rate is a ratio. For example, 12 apples cost $3.\n"
+    "2. Compare both strategies and justify which is more efficient, because we should check the equation 3x + 5 = 11."
+)
+AI_HITS = {"cognitive_terms_ai": ["explain"], "abstract_terms_ai": ["unit rate"], "meta_terms_ai": ["justify"]}
+
+
+def test_shared_features_match_standalone_scorers():
+    res = compute_advanced_metrics(PROMPT, ai_pattern_hits=AI_HITS)
+    assert res["cdi"] == compute_cdi(PROMPT, ai_pattern_hits=AI_HITS)
+    assert res["sss"] == compute_sss(PROMPT)
+    assert res["arq"] == compute_arq(PROMPT, ai_pattern_hits=AI_HITS)
+
+
+def test_features_scan_each_text_variant_once():
+    f = extract_prompt_features(PROMPT)
+    assert f.cdi_text == f.arq_text == f.text_lower
+    compute_advanced_metrics(PROMPT)
+    compute_cdi(PROMPT, features=f)
+    compute_arq(PROMPT, features=f)
+    assert list(f._lex_cache) == [f.text_lower]
+    assert f.numbers == ["1", "12", "3", "2", "5", "11"]
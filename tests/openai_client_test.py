@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+from openai.types.chat import ChatCompletion
+
+import src.services.openai_client as oc
+from src.services.rate_limiter import RateLimiter
+from src.services.response_cache import ResponseCache
+
+
+def _completion(content):
+    return ChatCompletion.model_validate({
+        "id": "c1", "object": "chat.completion", "created": 1, "model": "m",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+    })
+
+
+class FakeCompletions:
+    def __init__(self, content):
+        self.content = content
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        return _completion(self.content)
+
+
+class AsyncFakeCompletions(FakeCompletions):
+    async def create(self, **kwargs):
+        return FakeCompletions.create(self, **kwargs)
+
+
+def _client_with(completions):
+    client = type("Client", (), {})()
+    client.chat = type("Chat", (), {})()
+    client.chat.completions = completions
+    return client
+
+
+def _setup(tmp_path, monkeypatch, completions):
+    cache = ResponseCache(str(tmp_path / "c.sqlite"))
+    monkeypatch.setattr(oc, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(oc, "get_rate_limiter", lambda: RateLimiter(0, 0))
+    monkeypatch.setattr(oc, "_client", lambda timeout=45.0: (_client_with(completions), None))
+    monkeypatch.setattr(oc, "_aclient", lambda timeout=45.0: (_client_with(completions), None))
+    return cache
+
+
+def test_analyzer_non_json_twice_falls_back_to_empty_analysis(tmp_path, monkeypatch):
+    completions = FakeCompletions("not json")
+    cache = _setup(tmp_path, monkeypatch, completions)
+    out = oc.get_analysis_from_analyzer("Solve.", "2x = 8")
+    assert completions.calls == 2
+    assert out["error"] is None and "prompt_analysis" in out
+    assert cache.size() == 0  # reply hỏng không được ghi cache
+
+
+def test_async_analyzer_non_json_twice_falls_back(tmp_path, monkeypatch):
+    completions = AsyncFakeCompletions("not json")
+    cache = _setup(tmp_path, monkeypatch, completions)
+    out = asyncio.run(oc.aget_analysis_from_analyzer("Solve.", "2x = 8"))
+    assert completions.calls == 2
+    assert out["error"] is None and "prompt_analysis" in out
+    assert cache.size() == 0
+
+
+class SlowLimiter(RateLimiter):
+    """Limiter giả: mỗi call phải chờ trong hàng đợi 200ms trước khi gửi request."""
+
+    def call(self, fn, **kw):
+        time.sleep(0.2)
+        return super().call(fn, **kw)
+
+    async def acall(self, fn, **kw):
+        await asyncio.sleep(0.2)
+        return await super().acall(fn, **kw)
+
+
+def test_latency_excludes_rate_limiter_wait(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch, FakeCompletions("x = 4"))
+    monkeypatch.setattr(oc, "get_rate_limiter", lambda: SlowLimiter(0, 0))
+    assert oc.get_solution_from_solver("Solve.", "2x = 8")["latency_ms"] < 100
+
+    _setup(tmp_path / "a", monkeypatch, AsyncFakeCompletions("x = 4"))
+    monkeypatch.setattr(oc, "get_rate_limiter", lambda: SlowLimiter(0, 0))
+    assert asyncio.run(oc.aget_solution_from_solver("Solve.", "2x = 8"))["latency_ms"] < 100
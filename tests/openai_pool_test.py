@@ -0,0 +1,23 @@
+import asyncio
+import gc
+
+from src.services import openai_pool as pool
+
+
+def test_async_clients_are_per_loop_and_released(monkeypatch):
+    monkeypatch.setattr(pool, "get_openai_api_key", lambda: "sk-test")
+
+    async def grab(close=False):
+        first, again = pool.get_async_openai_client(), pool.get_async_openai_client()
+        assert first is again
+        if close:
+            await pool.aclose_async_clients()
+            assert first[1].is_closed
+        return first
+
+    a = asyncio.run(grab())
+    b = asyncio.run(grab(close=True))
+    assert a[0] is not b[0]
+    gc.collect()
+    # Loop đã đóng và bị thu hồi -> không còn giữ client (id() của loop có thể bị dùng lại)
+    assert len(pool._async_clients) == 0
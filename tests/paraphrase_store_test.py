@@ -0,0 +1,19 @@
+from src.batch.paraphrase_store import ParaphraseStore, paraphrase_key
+
+
+def test_take_rotates_least_used_variant(tmp_path):
+    store = ParaphraseStore(str(tmp_path / "p.sqlite"))
+    key = paraphrase_key("p1", 110, "A Socratic coach", 2, "gpt-3.5-turbo", "Explain {problem_text}")
+    assert store.take(key) is None
+    assert store.add(key, ["v0", "", "v1", "v2"]) == "v0"
+    assert [store.take(key) for _ in range(4)] == ["v1", "v2", "v0", "v1"]
+    assert store.count(key) == 3
+    assert store.stats == {"hits": 4, "misses": 1, "stored": 3}
+
+
+def test_key_includes_persona_and_template(tmp_path):
+    store = ParaphraseStore(str(tmp_path / "p.sqlite"))
+    store.add(paraphrase_key("p1", 110, "A", 1, "m", "tpl"), ["x"])
+    assert store.take(paraphrase_key("p1", 110, "B", 1, "m", "tpl")) is None
+    assert store.take(paraphrase_key("p1", 110, "A", 1, "m", "tpl v2")) is None
+    assert store.take(paraphrase_key("p1", 110, "A", 1, "m", "tpl")) == "x"
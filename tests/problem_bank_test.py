@@ -0,0 +1,60 @@
+import pandas as pd
+
+from src.services.problem_bank import ProblemBankCache, build_problem_bank
+from src.utils.text import generate_problem_id
+
+
+def _problems():
+    return pd.DataFrame({
+        "CCSS": ["7.RP.A.1 (ratios)", "7.EE.B.4", "7.RP.A.1", ""],
+        "Level": ["2", "1", "2", "3"],
+        "Abstract / Real-world": ["Real-world", "Abstract", "", "Abstract"],
+        "Problem": ['"Solve 2x = 8"', "Find x", "Find y", "Solve 2x = 8"],
+    })
+
+
+def test_build_precomputes_options_and_index():
+    bank = build_problem_bank(_problems())
+    assert bank.ccss_options == ["7.EE.B.4", "7.RP.A.1"]
+    assert bank.level_options == ["1", "2", "3"]
+    assert bank.context_options == ["Abstract", "Real-world"]
+    # Bài trùng nội dung (sau clean) giữ hàng đầu tiên
+    assert len(bank.by_id) == 3
+    assert bank.by_id[generate_problem_id("Solve 2x = 8")] == 0
+    assert bank.problem(generate_problem_id("Find y"))["Level"] == "2"
+    assert bank.problem("missing") is None
+    assert build_problem_bank(pd.DataFrame()).empty
+
+
+def test_cache_ttl_and_invalidate():
+    calls = []
+
+    def reader(sheet_name, refresh):
+        calls.append((sheet_name, refresh))
+        return _problems()
+
+    cache = ProblemBankCache(reader, ttl_sec=60)
+    first = cache.get("problems")
+    assert cache.get("problems") is first
+    assert calls == [("problems", False)]
+
+    cache.invalidate("problems")
+    assert cache.get("problems") is not first
+    assert calls[-1] == ("problems", True)
+    assert cache.stats == {"hits": 1, "misses": 2, "loads": 2}
+
+    # Đọc lỗi (DataFrame rỗng) không được cache; sau invalidate, lần thử lại vẫn refresh=True
+    frames = [pd.DataFrame(), _problems()]
+    retry_calls = []
+
+    def flaky(sheet_name, refresh):
+        retry_calls.append(refresh)
+        return frames.pop(0)
+
+    flaky_cache = ProblemBankCache(flaky, ttl_sec=60)
+    flaky_cache.invalidate("problems")
+    assert flaky_cache.get().empty
+    assert not flaky_cache.get().empty
+    assert retry_calls == [True, True]
+    flaky_cache.get()
+    assert flaky_cache.stats["loads"] == 2
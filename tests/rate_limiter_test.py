@@ -0,0 +1,83 @@
+import httpx
+import pytest
+from openai import BadRequestError, RateLimitError
+
+from src.services import rate_limiter as rl
+from src.services.rate_limiter import RateLimiter, TokenBucket, estimate_request_tokens
+
+
+def _err(cls, status, headers=None):
+    req = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    resp = httpx.Response(status, headers=headers or {}, request=req)
+    return cls("boom", response=resp, body=None)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    out = []
+    monkeypatch.setattr(rl.time, "sleep", out.append)
+    return out
+
+
+def test_bucket_waits_only_when_empty():
+    b = TokenBucket(60)  # 1/giây, dung lượng 60
+    assert b.reserve(60, now=b.updated) == 0.0
+    assert b.reserve(1, now=b.updated) == pytest.approx(1.0)
+    assert b.reserve(1, now=b.updated + 2.0) == 0.0
+
+
+def test_unlimited_never_waits():
+    lim = RateLimiter(0, 0)
+    assert all(lim.reserve(10**6) == 0.0 for _ in range(100))
+
+
+def test_retry_honors_retry_after(sleeps):
+    lim = RateLimiter(0, 0, max_retries=3)
+    calls = []
+    def fn():
+        calls.append(1)
+        if len(calls) < 3:
+            raise _err(RateLimitError, 429, {"retry-after-ms": "250"})
+        return "ok"
+    assert lim.call(fn) == "ok"
+    assert sleeps[0] == 0.25
+    assert lim.stats["retries"] == 2 and lim.stats["rate_limited"] == 2
+
+
+def test_non_retryable_and_exhausted(sleeps):
+    lim = RateLimiter(0, 0, max_retries=2)
+    with pytest.raises(BadRequestError):
+        lim.call(lambda: (_ for _ in ()).throw(_err(BadRequestError, 400)))
+    assert lim.stats["retries"] == 0
+    with pytest.raises(RateLimitError):
+        lim.call(lambda: (_ for _ in ()).throw(_err(RateLimitError, 429)))
+    assert lim.stats["retries"] == 2
+
+
+def test_settle_refunds_overestimate():
+    lim = RateLimiter(0, 600)
+    lim.reserve(600)
+    lim.settle(600, 100)
+    assert lim.reserve(400) == 0.0
+
+
+def test_estimate_request_tokens():
+    req = {"messages": [{"role": "user", "content": "x" * 400}], "max_tokens": 50}
+    assert estimate_request_tokens(req) == 150
+
+
+def test_failed_attempts_release_their_tokens(sleeps):
+    lim = RateLimiter(0, 600, max_retries=3)
+    calls = []
+    def fn():
+        calls.append(1)
+        if len(calls) < 3:
+            raise _err(RateLimitError, 429, {"retry-after-ms": "1"})
+        return "ok"
+    assert lim.call(fn, est_tokens=200, usage_tokens=lambda r: 200) == "ok"
+    # Chỉ lần thử thành công bị tính vào TPM (không phải 3 × 200)
+    assert lim.tokens.level == pytest.approx(400, abs=1)
+
+    with pytest.raises(BadRequestError):
+        lim.call(lambda: (_ for _ in ()).throw(_err(BadRequestError, 400)), est_tokens=300)
+    assert lim.tokens.level == pytest.approx(400, abs=1)
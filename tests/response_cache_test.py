@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from src.services.response_cache import CacheMissError, ResponseCache, request_key
+
+REQ = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "2 + 2 = ?"}], "temperature": 0.0}
+
+
+def test_request_key_is_order_independent():
+    reordered = {k: REQ[k] for k in reversed(list(REQ))}
+    assert request_key("analyzer", REQ) == request_key("analyzer", reordered)
+    assert request_key("analyzer", REQ) != request_key("solver", REQ)
+
+
+def test_get_put_and_stats(tmp_path):
+    cache = ResponseCache(str(tmp_path / "c.sqlite"))
+    assert cache.get("analyzer", REQ) is None
+    cache.put("analyzer", REQ, {"id": "x"}, 123)
+    assert cache.get("analyzer", REQ) == ({"id": "x"}, 123)
+    assert cache.stats["analyzer"] == {"hits": 1, "misses": 1, "writes": 1}
+    # kind chưa bật -> không đọc/ghi
+    cache.put("solver", REQ, {"id": "y"}, 1)
+    assert cache.get("solver", REQ) is None and cache.size() == 1
+
+
+def test_replay_is_read_only(tmp_path):
+    path = str(tmp_path / "c.sqlite")
+    ResponseCache(path).put("analyzer", REQ, {"id": "x"}, 5)
+    replay = ResponseCache(path, mode="replay")
+    assert replay.get("analyzer", REQ) == ({"id": "x"}, 5)
+    with pytest.raises(CacheMissError):
+        replay.get("analyzer", {**REQ, "temperature": 0.1})
+    replay.put("analyzer", {**REQ, "temperature": 0.1}, {"id": "z"}, 5)
+    assert replay.size() == 1
+    # kind không nằm trong `kinds` cũng không được gọi API ở chế độ replay
+    with pytest.raises(CacheMissError):
+        replay.get("solver", REQ)
+
+
+def test_ttl_and_lru_eviction(tmp_path):
+    cache = ResponseCache(str(tmp_path / "c.sqlite"), max_entries=2)
+    for i in range(3):
+        cache.put("analyzer", {**REQ, "n": i}, {"id": i}, 1)
+        time.sleep(0.01)
+    cache.get("analyzer", {**REQ, "n": 0})  # làm mới entry cũ nhất
+    cache.prune()
+    assert cache.size() == 2
+    assert cache.get("analyzer", {**REQ, "n": 0}) is not None
+    assert cache.get("analyzer", {**REQ, "n": 1}) is None
+
+    expiring = ResponseCache(str(tmp_path / "t.sqlite"), ttl_days=1e-9)
+    expiring.put("analyzer", REQ, {"id": "x"}, 1)
+    time.sleep(0.01)
+    assert expiring.get("analyzer", REQ) is None
+
+
+def test_off_mode_touches_nothing(tmp_path):
+    cache = ResponseCache(str(tmp_path / "sub" / "c.sqlite"), mode="off")
+    cache.put("analyzer", REQ, {"id": "x"}, 1)
+    assert cache.get("analyzer", REQ) is None
+    assert not (tmp_path / "sub").exists()
@@ -0,0 +1,68 @@
+import time
+
+from openai.types.chat import ChatCompletionChunk
+
+import src.services.openai_client as oc
+from src.services.rate_limiter import RateLimiter
+from src.services.response_cache import ResponseCache
+
+
+def _chunk(content=None, finish=None, usage=None):
+    choices = [] if usage else [{"index": 0, "delta": {"content": content}, "finish_reason": finish}]
+    return ChatCompletionChunk.model_validate({
+        "id": "c1", "object": "chat.completion.chunk", "created": 1, "model": "m", "choices": choices, "usage": usage,
+    })
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.kwargs = None
+
+    def create(self, **kwargs):
+        self.kwargs = kwargs
+        return iter([_chunk("Step 1. "), _chunk("x = 4"), _chunk(finish="stop"),
+                     _chunk(usage={"prompt_tokens": 10, "completion_tokens": 6, "total_tokens": 16})])
+
+
+class FakeClient:
+    def __init__(self):
+        self.chat = type("Chat", (), {})()
+        self.chat.completions = FakeCompletions()
+
+
+def test_stream_yields_deltas_and_records_latency(tmp_path, monkeypatch):
+    client = FakeClient()
+    cache = ResponseCache(str(tmp_path / "c.sqlite"), kinds=("solver",))
+    monkeypatch.setattr(oc, "_client", lambda timeout=45.0: (client, None))
+    monkeypatch.setattr(oc, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(oc, "get_rate_limiter", lambda: RateLimiter(0, 0))
+
+    stream = oc.stream_solution_from_solver("Solve.", "2x = 8")
+    assert list(stream) == ["Step 1. ", "x = 4"]
+    res = stream.result
+    assert client.chat.completions.kwargs["stream"] is True
+    assert res["solution_text"] == "Step 1. x = 4"
+    assert res["usage"] == {"prompt_tokens": 10, "completion_tokens": 6}
+    assert res["ttft_ms"] is not None and res["ttft_ms"] <= res["latency_ms"]
+    assert res["cached"] is False
+
+    # Lần sau lấy từ cache (cùng khoá với bản không stream): trả một lần, không có TTFT
+    again = oc.stream_solution_from_solver("Solve.", "2x = 8")
+    assert list(again) == ["Step 1. x = 4"]
+    assert again.result["cached"] is True and again.result["ttft_ms"] is None
+    assert oc.get_solution_from_solver("Solve.", "2x = 8")["cached"] is True
+
+
+def test_ttft_excludes_rate_limiter_wait(tmp_path, monkeypatch):
+    class SlowLimiter(RateLimiter):
+        def call(self, fn, **kw):
+            time.sleep(0.2)  # chờ quota trước khi mở stream
+            return super().call(fn, **kw)
+
+    client = FakeClient()
+    monkeypatch.setattr(oc, "_client", lambda timeout=45.0: (client, None))
+    monkeypatch.setattr(oc, "get_response_cache", lambda: ResponseCache(str(tmp_path / "c.sqlite"), kinds=()))
+    monkeypatch.setattr(oc, "get_rate_limiter", lambda: SlowLimiter(0, 0))
+    stream = oc.stream_solution_from_solver("Solve.", "2x = 8")
+    list(stream)
+    assert stream.result["ttft_ms"] < 100 and stream.result["latency_ms"] < 100
@@ -0,0 +1,39 @@
+from datetime import datetime, timezone
+
+from src.models.schemas import Evaluation, Run
+from src.services.storage import SQLiteRecordStore
+
+
+def _run(run_id, problem_id="p1"):
+    return Run(run_id=run_id, session_id="s", user_id="u", problem_id=problem_id, problem_text="x",
+               content_domain="RP", cognitive_level=1, problem_context="Applied Math", prompt_text="p",
+               prompt_level=0, solver_model_name="m", response_text="r",
+               created_at=datetime(2024, 1, 2, tzinfo=timezone.utc))
+
+
+def test_append_many_and_query(tmp_path):
+    store = SQLiteRecordStore(str(tmp_path / "records.sqlite"))
+    assert store.append_many({
+        "runs": [_run("a"), _run("b", "p2")],
+        "evaluations": [Evaluation(run_id="a", grader_id="g", correctness_score=1)],
+        "suggestions": [],
+    })
+    df = store.get_df("runs")
+    assert list(df["run_id"]) == ["a", "b"]
+    assert df.loc[0, "created_at"] == "2024-01-02T00:00:00.000000Z"
+    assert df["latency_ms"].dtype.kind == "i"
+    assert store.get_df("suggestions").empty
+
+    indexes = set(store.query("SELECT name FROM sqlite_master WHERE type = 'index'")["name"])
+    assert {"idx_runs_run_id", "idx_runs_problem_id", "idx_evaluations_run_id"} <= indexes
+    hit = store.query("SELECT r.run_id, e.correctness_score FROM runs r JOIN evaluations e USING (run_id) WHERE r.problem_id = ?", ["p1"])
+    assert hit.to_dict("records") == [{"run_id": "a", "correctness_score": 1}]
+
+
+def test_new_columns_are_added(tmp_path):
+    store = SQLiteRecordStore(str(tmp_path / "records.sqlite"))
+    store.append_data("notes", [{"run_id": "a"}])
+    store.append_data("notes", [{"run_id": "b", "extra": True}])
+    df = store.get_df("notes")
+    assert list(df.columns) == ["run_id", "extra"]
+    assert df["extra"].isna().tolist() == [True, False] and df.loc[1, "extra"] == 1
@@ -0,0 +1,33 @@
+import pytest
+
+from src.prompts.taxonomy import PROMPT_TAXONOMY
+from src.prompts.templates import COMPILED_TEMPLATES, STRICT_FILL_VALUES, compile_template, compiled, strict_fill_grid
+
+
+def test_every_taxonomy_template_compiles_and_fills():
+    assert set(COMPILED_TEMPLATES) == set(PROMPT_TAXONOMY)
+    assert COMPILED_TEMPLATES[310].placeholders == {"problem_text", "student_answer"}
+    for t in COMPILED_TEMPLATES.values():
+        assert "{" not in t.strict_fill("P")
+
+
+def test_render_matches_replace_and_ignores_braces_in_problem():
+    tpl = compile_template("A {problem_text} B {hypothesis} C {problem_text}")
+    assert tpl.render_many(["x", "y"], STRICT_FILL_VALUES) == [
+        f"A x B {STRICT_FILL_VALUES['hypothesis']} C x", f"A y B {STRICT_FILL_VALUES['hypothesis']} C y"]
+    assert compiled("Solve {problem_text}").strict_fill("f(x) = {hypothesis}") == "Solve f(x) = {hypothesis}"
+
+
+def test_validation():
+    with pytest.raises(ValueError):
+        compile_template("Solve {problem_txt}")
+    with pytest.raises(ValueError):
+        compile_template("No placeholder")
+    assert compiled("Keep {other} as is").strict_fill("p") == "Keep {other} as is"
+
+
+def test_strict_fill_grid():
+    df = strict_fill_grid(["p0", "p1"], keys=[110, 320])
+    assert list(df["sug_key"]) == [110, 110, 320, 320]
+    assert df.loc[1, "prompt_text"] == COMPILED_TEMPLATES[110].strict_fill("p1")
+    assert len(strict_fill_grid(["p"] * 3)) == 3 * len(PROMPT_TAXONOMY)
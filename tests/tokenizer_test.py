@@ -0,0 +1,44 @@
+import pytest
+
+from src.core.tokenizer import AdvancedTokenizer
+
+SAMPLES = [
+    "Giải phương trình: 2x + 5 = 11. Tìm giá trị của x.",
+    "Explain why 3.5 * 2 = 7 isn't trivial! (π ≈ 3.14, ∑ x_i)",
+    "  \n\t ",
+    "",
+    "ĐÂY là 12.5% — \"quoted\" [a] {b} 😀#",
+]
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_regex_mode_matches_legacy(text):
+    assert AdvancedTokenizer().tokenize(text) == AdvancedTokenizer(mode="legacy").tokenize(text)
+
+
+def test_tokenize_with_kinds():
+    kinds = AdvancedTokenizer().tokenize_with_kinds("x + 5 = 11 π")
+    assert kinds == [("x", "english"), ("+", "math_symbols"), ("5 = 11", "math_expr"), ("π", "math_symbols")]
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        AdvancedTokenizer(mode="fast")
+
+
+@pytest.mark.parametrize("mode", AdvancedTokenizer.MODES)
+@pytest.mark.parametrize("text", SAMPLES + ["trailing space  ", "x\n"])
+def test_count_and_iter_tokens_match_tokenize(mode, text):
+    tokenizer = AdvancedTokenizer(mode=mode)
+    tokens = tokenizer.tokenize(text)
+    assert tokenizer.count(text) == len(tokens)
+    assert list(tokenizer.iter_tokens(text)) == tokens
+
+
+@pytest.mark.parametrize("mode", AdvancedTokenizer.MODES)
+def test_tokenize_many_matches_per_text(mode):
+    tok = AdvancedTokenizer(mode=mode)
+    texts = SAMPLES + ["5", "+3 x", "7 ", "a\x01b"]
+    tokens, counts = tok.tokenize_many(texts)
+    assert counts == [len(tok.tokenize(t)) for t in texts]
+    assert tokens == [t for text in texts for t in tok.tokenize(text)]